@@ -91,18 +91,28 @@ def criar_entidade(endpoint, data, nome_entidade):
         print(f"❌ Erro de conexão ao criar {nome_entidade}: {e}")
         return None
 
-def criar_preco(produto_id, estabelecimento_id, preco_base):
-    """Cria preço com variação realista"""
+def gerar_preco(produto_id, estabelecimento_id, preco_base):
+    """Gera preço com variação realista"""
     variacao = random.uniform(0.7, 1.4)  # Variação de -30% a +40%
     preco = round(preco_base * variacao, 2)
     
-    data = {
+    return {
         'produto_id': produto_id,
         'estabelecimento_id': estabelecimento_id,
         'preco': preco
     }
-    
-    return criar_entidade('precos', data, 'preço')
+
+def criar_precos_lote(precos):
+    """Envia um lote de preços numa única requisição; retorna quantos foram inseridos"""
+    try:
+        response = requests.post(f'{BASE_URL}/precos/lote', json=precos)
+        resultado = response.json()
+        for erro in resultado.get('erros', []):
+            print(f"❌ Preço {erro['linha']} rejeitado: {erro['erro']}")
+        return resultado.get('inseridos', 0)
+    except Exception as e:
+        print(f"❌ Erro de conexão ao criar lote de preços: {e}")
+        return 0
 
 def main():
     print("🚀 Populando banco com dados completos de teste...")
@@ -145,6 +155,7 @@ def main():
     # Criar preços (cada produto em cada estabelecimento)
     print("\n💰 Criando preços (100 produtos × 20 estabelecimentos = 2000 preços)...")
     precos_criados = 0
+    lote = []
     total_precos = len(produtos_ids) * len(estabelecimentos_ids)
     
     # Preços base por categoria (estimativa realista)
@@ -164,12 +175,13 @@ def main():
                 preco_base = preco
                 break
         
-        for estabelecimento_id in estabelecimentos_ids:
-            preco_id = criar_preco(produto_id, estabelecimento_id, preco_base)
-            if preco_id:
-                precos_criados += 1
+        lote.extend(gerar_preco(produto_id, estabelecimento_id, preco_base)
+                    for estabelecimento_id in estabelecimentos_ids)
         
-        if (i + 1) % 10 == 0:
+        # Um lote a cada 10 produtos (200 preços por requisição)
+        if (i + 1) % 10 == 0 or i + 1 == len(produtos_ids):
+            precos_criados += criar_precos_lote(lote)
+            lote = []
             print(f"   ✅ {precos_criados}/{total_precos} preços criados ({i+1}/100 produtos processados)")
     
     print("\n" + "=" * 60)
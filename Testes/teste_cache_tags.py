@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Verifica o cache de respostas com invalidação por tags (cacheamento.py)
+
+Monta uma aplicação Flask mínima com rotas em cache e conta quantas vezes
+cada view roda: invalidar uma tag deve recalcular só as respostas que a
+usam, tags acrescentadas com ``marcar_tags`` também invalidam, uma
+invalidação durante o cálculo não pode deixar a resposta antiga valendo e
+só respostas 200 são guardadas. Não precisa do Flask rodando.
+"""
+
+import os
+import sys
+from collections import Counter
+
+from flask import Flask, jsonify, request
+from flask_caching import Cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cacheamento import CacheComTags, marcar_tags
+
+app = Flask(__name__)
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+cache_tags = CacheComTags(cache, app)
+execucoes = Counter()
+invalidar_durante = set()
+
+@app.route('/produtos/<int:produto_id>')
+@cache_tags.cached(timeout=300, tags=['produto:{produto_id}'])
+def produto(produto_id):
+    execucoes[f'produto:{produto_id}'] += 1
+    if produto_id in invalidar_durante:
+        # Simula uma escrita concorrente que termina no meio do cálculo
+        invalidar_durante.discard(produto_id)
+        cache_tags.invalidar(f'produto:{produto_id}')
+    return jsonify({'id': produto_id, 'versao': execucoes[f'produto:{produto_id}']})
+
+@app.route('/precos')
+@cache_tags.cached(timeout=300, tags=['precos'])
+def precos():
+    execucoes['precos'] += 1
+    # Tags dos estabelecimentos listados, conhecidas só durante o cálculo
+    for estabelecimento_id in request.args.getlist('estabelecimento_id', type=int):
+        marcar_tags(f'estabelecimento:{estabelecimento_id}')
+    return jsonify({'versao': execucoes['precos']})
+
+@app.route('/falha')
+@cache_tags.cached(timeout=300)
+def falha():
+    execucoes['falha'] += 1
+    return jsonify({'error': 'Erro interno'}), 500
+
+def conferir(descricao, chave, esperado):
+    if execucoes[chave] != esperado:
+        print(f"❌ {descricao}: {chave} executou {execucoes[chave]} vez(es), esperado {esperado}")
+        return False
+    return True
+
+def testar_invalidacao_por_tag(cliente):
+    print("\n🧪 Invalidando por tag...")
+    ok = True
+    cliente.get('/produtos/1')
+    cliente.get('/produtos/2')
+    cliente.get('/produtos/1')
+    ok &= conferir("Segunda leitura vem do cache", 'produto:1', 1)
+
+    cache_tags.invalidar('produto:1')
+    resposta = cliente.get('/produtos/1').get_json()
+    cliente.get('/produtos/2')
+    ok &= conferir("Tag invalidada recalcula", 'produto:1', 2)
+    ok &= conferir("Outra tag continua em cache", 'produto:2', 1)
+    if resposta['versao'] != 2:
+        print(f"❌ Resposta antiga servida depois da invalidação: {resposta}")
+        ok = False
+
+    cache_tags.invalidar('precos')
+    cliente.get('/produtos/1')
+    ok &= conferir("Tag sem relação não invalida", 'produto:1', 2)
+    if ok:
+        print("✅ Só as respostas com a tag invalidada são recalculadas")
+    return ok
+
+def testar_marcar_tags(cliente):
+    print("\n🧪 Testando tags marcadas durante o cálculo...")
+    ok = True
+    cliente.get('/precos?estabelecimento_id=3&estabelecimento_id=4')
+    cliente.get('/precos?estabelecimento_id=4&estabelecimento_id=3')
+    ok &= conferir("Query string em outra ordem usa a mesma entrada", 'precos', 1)
+
+    cache_tags.invalidar('estabelecimento:5')
+    cliente.get('/precos?estabelecimento_id=3&estabelecimento_id=4')
+    ok &= conferir("Estabelecimento não listado não invalida", 'precos', 1)
+
+    cache_tags.invalidar('estabelecimento:4')
+    cliente.get('/precos?estabelecimento_id=3&estabelecimento_id=4')
+    ok &= conferir("Estabelecimento listado invalida", 'precos', 2)
+    if ok:
+        print("✅ Tags de marcar_tags invalidam a resposta")
+    return ok
+
+def testar_invalidacao_durante_calculo(cliente):
+    print("\n🧪 Invalidando durante o cálculo...")
+    invalidar_durante.add(7)
+    cliente.get('/produtos/7')
+    cliente.get('/produtos/7')
+    cliente.get('/produtos/7')
+    # A primeira entrada nasce inválida; a segunda fica em cache
+    ok = conferir("Entrada calculada antes da invalidação", 'produto:7', 2)
+    if ok:
+        print("✅ Resposta calculada com dados antigos não é reaproveitada")
+    return ok
+
+def testar_apenas_200(cliente):
+    print("\n🧪 Testando respostas de erro...")
+    status = [cliente.get('/falha').status_code for _ in range(2)]
+    ok = conferir("Erros não são guardados", 'falha', 2) and status == [500, 500]
+    if ok:
+        print("✅ Respostas de erro não vão para o cache")
+    return ok
+
+def main():
+    print("Verificando o cache com invalidação por tags")
+    print("=" * 50)
+    cliente = app.test_client()
+    resultados = [
+        testar_invalidacao_por_tag(cliente),
+        testar_marcar_tags(cliente),
+        testar_invalidacao_durante_calculo(cliente),
+        testar_apenas_200(cliente),
+    ]
+    print("\n" + "=" * 50)
+    print("✅ Tudo certo!" if all(resultados) else "❌ Há falhas")
+    return all(resultados)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
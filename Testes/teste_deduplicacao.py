@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Verifica a deduplicação de preços repetidos (ingestao.py e compactar_precos.py)
+
+Um preço igual ao último do mesmo produto/estabelecimento, coletado no
+mesmo dia e dentro da janela, deve apenas estender o ``valido_ate`` da
+linha existente, tanto entre lotes quanto dentro do mesmo lote. Sequências aleatórias de coletas
+são gravadas em lotes com a deduplicação ligada e, em outro banco, sem
+deduplicação e depois compactadas com ``compactar_pares``: os dois
+históricos devem ser iguais ao de uma referência simples. Usa SQLite em
+memória; não precisa do Flask rodando.
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, Produto, Estabelecimento, Preco
+from ingestao import processar_lote, confirmar_repetido
+from compactar_precos import compactar_pares
+from app import observado_desde
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+JANELA = 3 * 3600
+INICIO = datetime(2025, 1, 1, 8)
+SEQUENCIAS = 40
+
+def novo_banco(produtos=3, estabelecimentos=2):
+    db.drop_all()
+    db.create_all()
+    db.session.add_all([Produto(descricao=f'Produto {i}', ean=f'{i:013d}') for i in range(produtos)])
+    db.session.add_all([Estabelecimento(nome=f'Mercado {i}', cnpj=f'{i:014d}', bairro='Centro', cidade='São Paulo')
+                        for i in range(estabelecimentos)])
+    db.session.commit()
+
+def historico():
+    """(produto, estabelecimento, preço, início, fim) de cada linha gravada"""
+    return sorted(
+        (preco.produto_id, preco.estabelecimento_id, round(float(preco.preco), 2), preco.data_coleta,
+         max(preco.data_coleta, preco.valido_ate or preco.data_coleta))
+        for preco in Preco.query.all()
+    )
+
+def referencia(coletas):
+    """Dobra as coletas em ordem: repetição no mesmo dia e dentro da janela estende o trecho atual"""
+    trechos = []
+    atual = {}
+    for produto_id, estabelecimento_id, preco, data in sorted(coletas, key=lambda c: (c[0], c[1], c[3])):
+        trecho = atual.get((produto_id, estabelecimento_id))
+        if (trecho and trecho[2] == preco and data.date() == trecho[3].date()
+                and (data - trecho[4]).total_seconds() <= JANELA):
+            trecho[4] = data
+        else:
+            atual[(produto_id, estabelecimento_id)] = trecho = [produto_id, estabelecimento_id, preco, data, data]
+            trechos.append(trecho)
+    return sorted(tuple(trecho) for trecho in trechos)
+
+def gerar_coletas(rnd):
+    coletas = []
+    for produto_id in (1, 2, 3):
+        for estabelecimento_id in (1, 2):
+            data = INICIO
+            for _ in range(rnd.randint(0, 12)):
+                data += timedelta(minutes=rnd.choice([30, 90, 170, 180, 190, 300]))
+                coletas.append((produto_id, estabelecimento_id, rnd.choice([4.99, 5.49]), data))
+    return coletas
+
+def gravar_em_lotes(rnd, coletas, janela):
+    """Grava as coletas em ordem cronológica, em lotes de tamanho aleatório"""
+    coletas = sorted(coletas, key=lambda c: c[3])
+    inicio = 0
+    while inicio < len(coletas):
+        fim = inicio + rnd.randint(1, 8)
+        itens = [{'produto_id': p, 'estabelecimento_id': e, 'preco': preco, 'data_coleta': data.isoformat()}
+                 for p, e, preco, data in coletas[inicio:fim]]
+        processar_lote(itens, janela=janela)
+        db.session.commit()
+        inicio = fim
+
+def testar_casos_basicos():
+    print("\n🧪 Testando repetições na escrita...")
+    novo_banco()
+    ok = True
+    hora = lambda horas: (INICIO + timedelta(hours=horas)).isoformat()
+
+    # Repetição dentro do mesmo lote e no lote seguinte
+    inseridos, confirmados, erros, _ = processar_lote([
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(0)},
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(2)},
+    ], janela=JANELA)
+    db.session.commit()
+    inseridos_2, confirmados_2, _, _ = processar_lote([
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(4)},
+    ], janela=JANELA)
+    db.session.commit()
+    linhas = historico()
+    if (inseridos, confirmados, inseridos_2, confirmados_2) != (1, 1, 0, 1) or erros:
+        print(f"❌ Contagens: {(inseridos, confirmados, inseridos_2, confirmados_2)} {erros}")
+        ok = False
+    if linhas != [(1, 1, 5.0, INICIO, INICIO + timedelta(hours=4))]:
+        print(f"❌ Repetições não viraram valido_ate: {linhas}")
+        ok = False
+    # Coletado antes do limite, mas confirmado depois: continua nos filtros por data
+    if Preco.query.filter(observado_desde(INICIO + timedelta(hours=3))).count() != 1:
+        print("❌ Preço confirmado depois do limite ficou fora de observado_desde")
+        ok = False
+
+    # Fora da janela e preço diferente geram linhas novas
+    processar_lote([
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(8)},
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.5, 'data_coleta': hora(9)},
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(10)},
+    ], janela=JANELA)
+    db.session.commit()
+    if len(historico()) != 4:
+        print(f"❌ Fora da janela ou preço diferente: {historico()}")
+        ok = False
+
+    # Versão de um preço só, usada por POST /precos
+    ultima = max(Preco.query.all(), key=lambda preco: preco.data_coleta)
+    confirmado = confirmar_repetido(1, 1, 5.0, INICIO + timedelta(hours=11), JANELA)
+    db.session.commit()
+    if confirmado != ultima.id or db.session.get(Preco, ultima.id).valido_ate != INICIO + timedelta(hours=11):
+        print(f"❌ confirmar_repetido não estendeu o preço {ultima.id}")
+        ok = False
+    if confirmar_repetido(1, 1, 5.5, INICIO + timedelta(hours=12), JANELA) is not None:
+        print("❌ confirmar_repetido aceitou um preço diferente")
+        ok = False
+
+    # Dentro da janela, mas depois da meia-noite: o novo dia ganha uma linha
+    processar_lote([
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(14)},
+        {'produto_id': 1, 'estabelecimento_id': 1, 'preco': 5.0, 'data_coleta': hora(17)},
+    ], janela=JANELA)
+    db.session.commit()
+    ultimas = sorted(historico(), key=lambda linha: linha[3])[-2:]
+    if [(inicio, fim) for _, _, _, inicio, fim in ultimas] != [
+            (INICIO + timedelta(hours=10), INICIO + timedelta(hours=14)),
+            (INICIO + timedelta(hours=17), INICIO + timedelta(hours=17))]:
+        print(f"❌ Repetição depois da meia-noite: {ultimas}")
+        ok = False
+
+    if ok:
+        print("✅ Repetições dentro da janela estendem valido_ate")
+    return ok
+
+def testar_sequencias_aleatorias():
+    print("\n🧪 Comparando escrita, compactação e referência...")
+    rnd = random.Random(3)
+    falhas = 0
+    for caso in range(SEQUENCIAS):
+        coletas = gerar_coletas(rnd)
+        esperado = referencia(coletas)
+
+        novo_banco()
+        gravar_em_lotes(rnd, coletas, JANELA)
+        na_escrita = historico()
+
+        novo_banco()
+        gravar_em_lotes(rnd, coletas, 0)
+        pares = sorted({(p, e) for p, e, _, _ in coletas})
+        if pares:
+            compactar_pares(pares, JANELA)
+            db.session.commit()
+        compactado = historico()
+
+        for nome, obtido in (('escrita', na_escrita), ('compactação', compactado)):
+            if obtido != esperado:
+                falhas += 1
+                print(f"❌ Caso {caso} ({nome}): {len(obtido)} linhas, esperado {len(esperado)}")
+    if not falhas:
+        print(f"✅ {SEQUENCIAS} sequências iguais à referência")
+    return not falhas
+
+def main():
+    print("Verificando a deduplicação de preços")
+    print("=" * 50)
+    with app.app_context():
+        resultados = [testar_casos_basicos(), testar_sequencias_aleatorias()]
+    print("\n" + "=" * 50)
+    print("✅ Tudo certo!" if all(resultados) else "❌ Há falhas")
+    return all(resultados)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Verifica o histórico compacto de preços (``historico_compacto`` em app.py)
+
+Gera históricos aleatórios (com coletas no mesmo instante e linhas com
+``valido_ate``) e compara os trechos ``[inicio, fim, preco]`` de cada
+estabelecimento com uma codificação de referência: coletas seguidas do
+mesmo preço viram um trecho, trechos vizinhos nunca têm o mesmo preço e
+preços coletados antes da janela mas confirmados dentro dela entram com o
+início cortado no limite. Também confere o mapa de estabelecimentos. Usa SQLite em memória; não
+precisa do Flask rodando.
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, Produto, Estabelecimento, Preco
+from app import historico_compacto
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+INICIO = datetime(2025, 1, 1, 8)
+CASOS = 40
+
+def novo_banco(rnd):
+    db.drop_all()
+    db.create_all()
+    db.session.add_all([Produto(descricao=f'Produto {i}', ean=f'{i:013d}') for i in range(2)])
+    db.session.add_all([Estabelecimento(nome=f'Mercado {i}', cnpj=f'{i:014d}', bairro=f'Bairro {i}', cidade='São Paulo')
+                        for i in range(4)])
+    db.session.flush()
+    for produto_id in (1, 2):
+        for estabelecimento_id in rnd.sample([1, 2, 3, 4], rnd.randint(0, 4)):
+            data = INICIO
+            for _ in range(rnd.randint(1, 30)):
+                # Intervalo zero gera coletas no mesmo instante
+                data += timedelta(hours=rnd.choice([0, 6, 24, 72]))
+                valido_ate = data + timedelta(hours=rnd.choice([1, 12])) if rnd.random() < 0.2 else None
+                db.session.add(Preco(produto_id=produto_id, estabelecimento_id=estabelecimento_id,
+                                     preco=Decimal(rnd.choice(['4.99', '5.49', '5.99'])),
+                                     data_coleta=data, valido_ate=valido_ate))
+    db.session.commit()
+
+def referencia(produto_id, data_limite):
+    """{estabelecimento_id: [[inicio, fim, preco], ...]} codificado linha a linha
+
+    Entram as linhas observadas (coleta ou ``valido_ate``) a partir de
+    ``data_limite``, com o início do trecho cortado em ``data_limite``.
+    """
+    series = {}
+    for preco in sorted(Preco.query.filter_by(produto_id=produto_id).all(),
+                        key=lambda p: (p.estabelecimento_id, p.data_coleta, p.id)):
+        fim = max(preco.data_coleta, preco.valido_ate or preco.data_coleta)
+        if fim < data_limite:
+            continue
+        trechos = series.setdefault(preco.estabelecimento_id, [])
+        if trechos and trechos[-1][2] == float(preco.preco):
+            trechos[-1][1] = max(trechos[-1][1], fim.isoformat())
+        else:
+            inicio = max(preco.data_coleta, data_limite)
+            trechos.append([inicio.isoformat(), fim.isoformat(), float(preco.preco)])
+    return series
+
+def conferir(produto_id, data_limite):
+    """Lista de problemas do histórico compacto do produto (vazia se está certo)"""
+    resultado = historico_compacto(produto_id, data_limite)
+    esperado = referencia(produto_id, data_limite)
+    problemas = []
+
+    series = {serie['estabelecimento_id']: serie['trechos'] for serie in resultado['series']}
+    if len(series) != len(resultado['series']):
+        problemas.append("estabelecimento repetido em series")
+    if series != esperado:
+        problemas.append("trechos diferentes da referência")
+    for estabelecimento_id, trechos in series.items():
+        if any(anterior[2] == seguinte[2] for anterior, seguinte in zip(trechos, trechos[1:])):
+            problemas.append(f"trechos vizinhos com o mesmo preço no estabelecimento {estabelecimento_id}")
+        if any(inicio > fim for inicio, fim, _ in trechos):
+            problemas.append(f"trecho terminando antes de começar no estabelecimento {estabelecimento_id}")
+
+    if set(resultado['estabelecimentos']) != {str(estabelecimento_id) for estabelecimento_id in series}:
+        problemas.append(f"mapa de estabelecimentos {sorted(resultado['estabelecimentos'])} não bate com as séries")
+    for chave, dados in resultado['estabelecimentos'].items():
+        estabelecimento = db.session.get(Estabelecimento, int(chave))
+        if dados != {'nome': estabelecimento.nome, 'bairro': estabelecimento.bairro, 'cidade': estabelecimento.cidade}:
+            problemas.append(f"dados errados do estabelecimento {chave}")
+    return problemas
+
+def testar_historicos_aleatorios():
+    print("\n🧪 Comparando com a codificação de referência...")
+    rnd = random.Random(5)
+    falhas = 0
+    for caso in range(CASOS):
+        novo_banco(rnd)
+        for produto_id in (1, 2):
+            # Janela completa, janela que corta o histórico numa coleta e
+            # janela que começa entre uma coleta e o seu valido_ate
+            for data_limite in (INICIO - timedelta(days=1), INICIO + timedelta(days=rnd.randint(1, 20)),
+                                INICIO + timedelta(days=rnd.randint(1, 20), hours=rnd.choice([3, 9]))):
+                problemas = conferir(produto_id, data_limite)
+                if problemas:
+                    falhas += 1
+                    print(f"❌ Caso {caso}, produto {produto_id}, desde {data_limite:%d/%m}: {'; '.join(problemas)}")
+    if not falhas:
+        print(f"✅ {CASOS} históricos iguais à referência")
+    return not falhas
+
+def testar_preco_estavel():
+    print("\n🧪 Testando preço estável desde antes da janela...")
+    db.drop_all()
+    db.create_all()
+    db.session.add(Produto(descricao='Produto', ean='0' * 13))
+    db.session.add(Estabelecimento(nome='Mercado', cnpj='0' * 14, bairro='Centro', cidade='São Paulo'))
+    db.session.add(Preco(produto_id=1, estabelecimento_id=1, preco=Decimal('4.99'),
+                         data_coleta=INICIO, valido_ate=INICIO + timedelta(hours=12)))
+    db.session.commit()
+    resultado = historico_compacto(1, INICIO + timedelta(hours=6))
+    esperado = [{'estabelecimento_id': 1, 'trechos': [[
+        (INICIO + timedelta(hours=6)).isoformat(), (INICIO + timedelta(hours=12)).isoformat(), 4.99
+    ]]}]
+    ok = resultado['series'] == esperado
+    print("✅ Trecho confirmado dentro da janela, com início cortado" if ok
+          else f"❌ Esperado {esperado}, veio {resultado['series']}")
+    return ok
+
+def testar_sem_coletas():
+    print("\n🧪 Testando produto sem coletas na janela...")
+    novo_banco(random.Random(1))
+    resultado = historico_compacto(1, datetime(2100, 1, 1))
+    ok = resultado == {'estabelecimentos': {}, 'series': []}
+    print("✅ Histórico vazio" if ok else f"❌ Esperado histórico vazio: {resultado}")
+    return ok
+
+def main():
+    print("Verificando o histórico compacto de preços")
+    print("=" * 50)
+    with app.app_context():
+        resultados = [testar_historicos_aleatorios(), testar_preco_estavel(), testar_sem_coletas()]
+    print("\n" + "=" * 50)
+    print("✅ Tudo certo!" if all(resultados) else "❌ Há falhas")
+    return all(resultados)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
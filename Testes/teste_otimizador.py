@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Verifica o otimizador de cesta (otimizador.py) contra força bruta
+
+Gera matrizes pequenas de custos (com estabelecimentos sem preço para
+alguns itens) e compara o resultado de ``otimizar_cesta`` com o melhor
+subconjunto de até K estabelecimentos encontrado por enumeração. Não
+precisa do Flask rodando.
+"""
+
+import itertools
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from otimizador import otimizar_cesta
+
+CASOS = 300
+
+def gerar_custos(rnd, lojas, itens, falta=0.25):
+    custos = np.array([[round(rnd.uniform(1, 30), 2) for _ in range(itens)] for _ in range(lojas)])
+    custos[np.array([[rnd.random() < falta for _ in range(itens)] for _ in range(lojas)])] = np.inf
+    return custos
+
+def forca_bruta(custos, max_lojas):
+    """(itens cobertos, total) do melhor subconjunto: cobertura primeiro, depois preço"""
+    melhor = None
+    for k in range(1, min(max_lojas, len(custos)) + 1):
+        for lojas in itertools.combinations(range(len(custos)), k):
+            menores = custos[list(lojas)].min(axis=0)
+            cobertos = np.isfinite(menores)
+            chave = (-int(cobertos.sum()), round(float(menores[cobertos].sum()), 6))
+            if melhor is None or chave < melhor:
+                melhor = chave
+    return -melhor[0], melhor[1]
+
+def conferir_resultado(custos, max_lojas, resultado):
+    """Confere se a resposta é coerente: lojas, atribuição e total"""
+    lojas = resultado['lojas']
+    if not 1 <= len(lojas) <= max_lojas or len(set(lojas)) != len(lojas):
+        return f"lojas inválidas: {lojas}"
+    total = 0.0
+    for item, loja in enumerate(resultado['atribuicao']):
+        if loja == -1:
+            if np.isfinite(custos[lojas, item]).any():
+                return f"item {item} sem loja, mas uma das escolhidas tem preço"
+            continue
+        if loja not in lojas or custos[loja, item] != custos[lojas, item].min():
+            return f"item {item} atribuído à loja {loja}, que não é a mais barata das escolhidas"
+        total += custos[loja, item]
+    if abs(total - resultado['total']) > 1e-6:
+        return f"total {resultado['total']} diferente da soma da atribuição {total}"
+    return None
+
+def testar_contra_forca_bruta():
+    print("\n🧪 Comparando com força bruta...")
+    rnd = random.Random(42)
+    falhas = 0
+    for caso in range(CASOS):
+        lojas, itens = rnd.randint(1, 8), rnd.randint(1, 10)
+        max_lojas = rnd.randint(1, 4)
+        custos = gerar_custos(rnd, lojas, itens)
+
+        resultado = otimizar_cesta(custos, max_lojas, tempo_limite=5)
+        erro = conferir_resultado(custos, max_lojas, resultado)
+        cobertos, total = forca_bruta(custos, max_lojas)
+        cobertos_resultado = sum(1 for loja in resultado['atribuicao'] if loja != -1)
+        if erro is None and not resultado['otimo']:
+            erro = "solução não marcada como ótima"
+        if erro is None and (cobertos_resultado, round(resultado['total'], 6)) != (cobertos, total):
+            erro = f"{cobertos_resultado} itens por {resultado['total']:.2f}, esperado {cobertos} itens por {total:.2f}"
+        if erro:
+            falhas += 1
+            print(f"❌ Caso {caso} ({lojas} lojas, {itens} itens, K={max_lojas}): {erro}")
+
+    if not falhas:
+        print(f"✅ {CASOS} casos iguais à força bruta")
+    return not falhas
+
+def testar_casos_limite():
+    print("\n🧪 Testando casos limite...")
+    ok = True
+
+    vazio = otimizar_cesta(np.zeros((0, 3)), 2)
+    if vazio['lojas'] or vazio['atribuicao'] != [-1, -1, -1]:
+        print(f"❌ Sem estabelecimentos: {vazio}")
+        ok = False
+
+    # Nenhum estabelecimento tem o item 1: ele fica sem loja e fora do total
+    custos = np.array([[5.0, np.inf], [4.0, np.inf]])
+    resultado = otimizar_cesta(custos, 2)
+    if resultado['atribuicao'] != [1, -1] or resultado['total'] != 4.0:
+        print(f"❌ Item sem preço em nenhum estabelecimento: {resultado}")
+        ok = False
+
+    # Cobertura vem antes do preço: a loja cara é a única com o item 1
+    custos = np.array([[1.0, np.inf], [50.0, 60.0]])
+    resultado = otimizar_cesta(custos, 1)
+    if resultado['lojas'] != [1]:
+        print(f"❌ Cobertura antes do preço: {resultado}")
+        ok = False
+
+    if ok:
+        print("✅ Casos limite")
+    return ok
+
+def main():
+    print("Verificando o otimizador de cesta")
+    print("=" * 50)
+    resultados = [testar_contra_forca_bruta(), testar_casos_limite()]
+    print("\n" + "=" * 50)
+    print("✅ Tudo certo!" if all(resultados) else "❌ Há falhas")
+    return all(resultados)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Verifica a paginação por cursor (paginacao.py)
+
+Percorre até o fim, seguindo os cursores, consultas com muitos empates na
+coluna de ordenação (mesmo preço, mesma data, mesma descrição) e confere
+que a sequência de ids é exatamente a da consulta completa: sem repetidos
+nem faltantes. Também confere que preços gravados no meio da navegação não
+deslocam as páginas seguintes e que cursores de outra ordenação são
+recusados. Usa SQLite em memória; não precisa do Flask rodando.
+"""
+
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, Produto, Estabelecimento, Preco
+from paginacao import paginar_por_cursor, codificar_cursor, CursorInvalido
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+# Mesmas ordenações de /precos/ordenados: (coluna, valor da coluna numa linha)
+ORDENACOES = {
+    'preco': (Preco.preco, lambda item: item[0].preco),
+    'data_coleta': (Preco.data_coleta, lambda item: item[0].data_coleta),
+    'produto': (Produto.descricao, lambda item: item[1].descricao),
+    'estabelecimento': (Estabelecimento.nome, lambda item: item[2].nome),
+}
+
+def popular():
+    """Poucos valores distintos em cada coluna, para forçar empates"""
+    rnd = random.Random(7)
+    db.create_all()
+    produtos = [Produto(descricao=descricao, ean=f'{i:013d}')
+                for i, descricao in enumerate(['Arroz 5kg', 'Arroz 5kg', 'Feijão 1kg'])]
+    estabelecimentos = [Estabelecimento(nome=nome, cnpj=f'{i:014d}', bairro='Centro', cidade='São Paulo')
+                        for i, nome in enumerate(['Mercado A', 'Mercado A', 'Mercado B'])]
+    db.session.add_all(produtos + estabelecimentos)
+    db.session.flush()
+    base = datetime(2025, 1, 1, 12)
+    for _ in range(137):
+        db.session.add(Preco(
+            produto_id=rnd.choice(produtos).id, estabelecimento_id=rnd.choice(estabelecimentos).id,
+            preco=Decimal(rnd.choice(['4.99', '5.49', '5.99'])), data_coleta=base + timedelta(days=rnd.randint(0, 3))
+        ))
+    db.session.commit()
+
+def consulta():
+    return db.session.query(Preco, Produto, Estabelecimento).join(
+        Produto, Preco.produto_id == Produto.id
+    ).join(
+        Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
+    )
+
+def percorrer(coluna, extrair, ordem, per_page, ao_virar_pagina=None):
+    """Segue os cursores até a última página; retorna os ids na ordem recebida"""
+    ids, cursor, paginas = [], '', 0
+    limite_paginas = consulta().count() * 2 + 2
+    while True:
+        if paginas > limite_paginas:
+            raise AssertionError("o cursor não avança")
+        itens, cursor = paginar_por_cursor(
+            consulta(), coluna, Preco.id, ordem, cursor, per_page,
+            lambda item: (extrair(item), item[0].id)
+        )
+        if len(itens) > per_page:
+            raise AssertionError(f"página com {len(itens)} itens")
+        ids.extend(item[0].id for item in itens)
+        paginas += 1
+        if cursor is None:
+            return ids
+        if ao_virar_pagina:
+            ao_virar_pagina(paginas, itens)
+
+def esperado(coluna, ordem):
+    direcao = (lambda c: c.asc()) if ordem == 'asc' else (lambda c: c.desc())
+    return [item[0].id for item in consulta().order_by(direcao(coluna), direcao(Preco.id)).all()]
+
+def testar_percorrer_ate_o_fim():
+    print("\n🧪 Percorrendo todas as ordenações até o fim...")
+    ok = True
+    for nome, (coluna, extrair) in ORDENACOES.items():
+        for ordem in ('asc', 'desc'):
+            for per_page in (1, 7, 50, 137, 500):
+                try:
+                    ids = percorrer(coluna, extrair, ordem, per_page)
+                except AssertionError as e:
+                    print(f"❌ {nome} {ordem} per_page={per_page}: {e}")
+                    ok = False
+                    continue
+                if len(ids) != len(set(ids)):
+                    print(f"❌ {nome} {ordem} per_page={per_page}: ids repetidos")
+                    ok = False
+                elif ids != esperado(coluna, ordem):
+                    print(f"❌ {nome} {ordem} per_page={per_page}: sequência diferente da consulta completa")
+                    ok = False
+    if ok:
+        print(f"✅ {len(ORDENACOES) * 2 * 5} navegações sem repetidos nem faltantes")
+    return ok
+
+def testar_escrita_durante_a_navegacao():
+    print("\n🧪 Gravando preços no meio da navegação...")
+    coluna, extrair = ORDENACOES['preco']
+    antes = set(esperado(coluna, 'asc'))
+    novos = []
+
+    def gravar(pagina, itens):
+        # Um preço antes e outro depois da posição atual do cursor
+        if pagina in (2, 5):
+            for valor in ('0.01', '99.99'):
+                preco = Preco(produto_id=1, estabelecimento_id=1, preco=Decimal(valor), data_coleta=datetime(2025, 1, 2))
+                db.session.add(preco)
+                db.session.commit()
+                novos.append(preco.id)
+
+    try:
+        ids = percorrer(coluna, extrair, 'asc', 10, gravar)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return False
+    vistos = set(ids)
+    faltando = antes - vistos
+    ok = len(ids) == len(vistos) and not faltando
+    # Os de 99,99 ficam à frente do cursor e aparecem; os de 0,01 ficam para trás
+    ok = ok and all((preco_id in vistos) == (indice % 2 == 1) for indice, preco_id in enumerate(novos))
+
+    db.session.query(Preco).filter(Preco.id.in_(novos)).delete(synchronize_session=False)
+    db.session.commit()
+    print("✅ Páginas seguintes não se deslocam" if ok else f"❌ Repetidos ou faltando: {sorted(faltando)}")
+    return ok
+
+def testar_cursores_invalidos():
+    print("\n🧪 Testando cursores inválidos...")
+    coluna, extrair = ORDENACOES['preco']
+    ok = True
+    casos = {
+        'outra ordenação': codificar_cursor('data_coleta:desc', datetime(2025, 1, 2).isoformat(), 3),
+        'outra direção': codificar_cursor('preco:desc', '5.49', 3),
+        'texto qualquer': 'nao-e-um-cursor',
+    }
+    for nome, cursor in casos.items():
+        try:
+            paginar_por_cursor(consulta(), coluna, Preco.id, 'asc', cursor, 10, lambda item: (extrair(item), item[0].id))
+            print(f"❌ Cursor aceito: {nome}")
+            ok = False
+        except CursorInvalido:
+            pass
+    if ok:
+        print("✅ Cursores inválidos recusados")
+    return ok
+
+def main():
+    print("Verificando a paginação por cursor")
+    print("=" * 50)
+    with app.app_context():
+        popular()
+        resultados = [testar_percorrer_ate_o_fim(), testar_escrita_durante_a_navegacao(), testar_cursores_invalidos()]
+    print("\n" + "=" * 50)
+    print("✅ Tudo certo!" if all(resultados) else "❌ Há falhas")
+    return all(resultados)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, send_file, make_response, session
+from flask import Flask, request, jsonify, render_template, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
 from flask_limiter import Limiter
@@ -6,29 +6,45 @@ from flask_limiter.util import get_remote_address
 from datetime import datetime, timedelta
 from rapidfuzz import fuzz, process
 import re
+import json
 import time
 import logging
-import io
-import csv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-import xlsxwriter
+import os
 from sqlalchemy import func, desc, asc
-from models import db, Produto, Estabelecimento, Preco, Usuario, Favorito
+from models import (db, Produto, Estabelecimento, Preco, PrecoAtual, Usuario, Favorito,
+                    ResumoDiarioProduto, ResumoDiarioEstabelecimento)
 from auth import auth_bp, login_required
+from listas import listas_bp
+from busca import IndiceProdutos, MotorBuscaEstabelecimentos
+from comparacao import comparar_produtos
+from projecoes import (atualizar_preco_atual, atualizar_resumos_diarios, chaves_resumo,
+                       ajustar_contador, ler_contadores, reconciliar_contadores)
+from paginacao import paginar_por_cursor, CursorInvalido
+from ingestao import processar_lote, confirmar_repetido, LIMITE_LOTE
+from metricas import histograma, resumo_histogramas, resumo_contadores
+from cacheamento import CacheComTags, marcar_tags
+from relatorios_jobs import FilaRelatorios, relatorios_bp, registrar_relatorio, serializar_job
+from exportadores import FonteLinhas, obter_exportador, formatos_disponiveis, resposta_exportacao, resposta_streaming
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///promoprecco.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['CACHE_TYPE'] = 'SimpleCache'
+# Cache em disco compartilhado por todos os processos; as escritas invalidam por tag
+app.config['CACHE_TYPE'] = 'FileSystemCache'
+app.config['CACHE_DIR'] = os.path.join(app.instance_path, 'cache')
+app.config['CACHE_THRESHOLD'] = 5000
 app.config['CACHE_DEFAULT_TIMEOUT'] = 300
 app.config['SECRET_KEY'] = 'promoprecco-secret-key-2024'
+# Mantém a busca fuzzy antiga de estabelecimentos (varredura completa) para comparação de latência
+app.config['BUSCA_ESTABELECIMENTOS_LEGADA'] = False
+# Segundos em que um preço repetido no mesmo dia só estende o valido_ate da linha anterior (0 desliga)
+app.config['PRECOS_JANELA_DEDUP'] = 0
 
 db.init_app(app)
 app.register_blueprint(auth_bp)
+app.register_blueprint(relatorios_bp)
 cache = Cache(app)
+cache_tags = CacheComTags(cache, app, papel=lambda: papel_usuario())
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"]
@@ -38,8 +54,31 @@ limiter.init_app(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Índice de busca fuzzy residente (atualizado a cada commit de Produto)
+indice_produtos = IndiceProdutos()
+motor_estabelecimentos = MotorBuscaEstabelecimentos()
+# Exportações de arquivo rodam num pool de processos; pedidos iguais reaproveitam o resultado
+fila_relatorios = FilaRelatorios(app)
 
 
+def observado_desde(data_limite):
+    """Filtro dos preços coletados ou confirmados (``valido_ate``) a partir de ``data_limite``
+
+    A deduplicação só estende o ``valido_ate`` dentro do dia da coleta; a
+    condição redundante em ``data_coleta`` permite usar o seu índice.
+    """
+    return db.and_(
+        Preco.data_coleta >= data_limite - timedelta(days=1),
+        func.coalesce(Preco.valido_ate, Preco.data_coleta) >= data_limite
+    )
+
+def papel_usuario():
+    """Papel do usuário da sessão, usado para separar respostas em cache"""
+    usuario = db.session.get(Usuario, session['user_id']) if 'user_id' in session else None
+    if not usuario:
+        return 'anonimo'
+    return 'admin' if usuario.is_admin else 'usuario'
+
 # Funções de validação
 def validar_cnpj(cnpj):
     if not cnpj:
@@ -95,18 +134,17 @@ def dashboard_adminlte():
 
 @app.route('/dashboard/stats', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60)
+@cache_tags.cached(timeout=600, tags=['stats'])
 def dashboard_stats():
-    """Retorna estatísticas para o dashboard"""
+    """Retorna estatísticas para o dashboard (contadores mantidos na escrita)"""
     try:
-        total_produtos = Produto.query.count()
-        total_estabelecimentos = Estabelecimento.query.count()
-        total_precos = Preco.query.count()
+        contadores = ler_contadores()
+        db.session.commit()
         
         return jsonify({
-            'total_produtos': total_produtos,
-            'total_estabelecimentos': total_estabelecimentos,
-            'total_precos': total_precos
+            'total_produtos': contadores['produtos'],
+            'total_estabelecimentos': contadores['estabelecimentos'],
+            'total_precos': contadores['precos']
         })
     except Exception as e:
         logger.error(f"Erro ao carregar estatísticas: {str(e)}")
@@ -114,15 +152,15 @@ def dashboard_stats():
 
 @app.route('/comparar/<int:produto_id>')
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60)
+@cache_tags.cached(timeout=600, tags=['produto:{produto_id}'])
 def comparar_precos(produto_id):
     """Compara preços de um produto específico"""
     try:
         produto = Produto.query.get_or_404(produto_id)
         
-        precos = db.session.query(Preco, Estabelecimento).join(
-            Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-        ).filter(Preco.produto_id == produto_id).all()
+        precos = db.session.query(PrecoAtual, Estabelecimento).join(
+            Estabelecimento, PrecoAtual.estabelecimento_id == Estabelecimento.id
+        ).filter(PrecoAtual.produto_id == produto_id).order_by(PrecoAtual.preco).all()
         
         resultado = {
             'produto': {
@@ -134,6 +172,7 @@ def comparar_precos(produto_id):
         }
         
         for preco, estabelecimento in precos:
+            marcar_tags(f'estabelecimento:{estabelecimento.id}')
             resultado['precos'].append({
                 'preco': float(preco.preco),
                 'data_coleta': preco.data_coleta.isoformat(),
@@ -216,6 +255,7 @@ def toggle_usuario_status(user_id):
     usuario = Usuario.query.get_or_404(user_id)
     usuario.ativo = not usuario.ativo
     db.session.commit()
+    cache_tags.invalidar('usuarios')
     
     logger.info(f"Admin {usuario_atual.id} alterou status do usuário {user_id} para {'ativo' if usuario.ativo else 'inativo'}")
     return jsonify({'success': True, 'ativo': usuario.ativo})
@@ -234,13 +274,14 @@ def toggle_usuario_admin(user_id):
     usuario = Usuario.query.get_or_404(user_id)
     usuario.is_admin = not usuario.is_admin
     db.session.commit()
+    cache_tags.invalidar('usuarios')
     
     logger.info(f"Admin {usuario_atual.id} alterou privilégios admin do usuário {user_id} para {usuario.is_admin}")
     return jsonify({'success': True, 'is_admin': usuario.is_admin})
 
 @app.route('/admin/stats', methods=['GET'])
 @login_required
-@cache.cached(timeout=300)
+@cache_tags.cached(timeout=300, tags=['stats', 'usuarios'], por_papel=True)
 def admin_stats():
     """Estatísticas administrativas"""
     usuario_atual = Usuario.query.get(session.get('user_id'))
@@ -255,7 +296,7 @@ def admin_stats():
         # Estatísticas dos últimos 30 dias
         data_limite = datetime.utcnow() - timedelta(days=30)
         
-        precos_recentes = Preco.query.filter(Preco.data_coleta >= data_limite).count()
+        precos_recentes = Preco.query.filter(observado_desde(data_limite)).count()
         usuarios_recentes = Usuario.query.filter(Usuario.data_criacao >= data_limite).count()
         
         return jsonify({
@@ -270,104 +311,122 @@ def admin_stats():
         logger.error(f"Erro ao carregar estatísticas admin: {str(e)}")
         return jsonify({'error': 'Erro interno'}), 500
 
+@app.route('/admin/metricas', methods=['GET'])
+@login_required
+def admin_metricas():
+    """Histogramas de latência e contadores (inclusive do cache) do processo atual"""
+    usuario_atual = Usuario.query.get(session.get('user_id'))
+    if not usuario_atual or not usuario_atual.is_admin:
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    return jsonify({'histogramas': resumo_histogramas(), 'contadores': resumo_contadores()})
+
+@app.route('/admin/contadores/reconciliar', methods=['POST'])
+@login_required
+def admin_reconciliar_contadores():
+    """Recalcula os contadores do dashboard pela contagem exata das tabelas"""
+    usuario_atual = Usuario.query.get(session.get('user_id'))
+    if not usuario_atual or not usuario_atual.is_admin:
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    try:
+        resultado = reconciliar_contadores()
+        db.session.commit()
+        cache_tags.invalidar('stats')
+        
+        divergentes = {nome: valores for nome, valores in resultado.items() if valores[0] != valores[1]}
+        if divergentes:
+            logger.warning(f"Contadores divergentes corrigidos por {usuario_atual.id}: {divergentes}")
+        return jsonify({
+            nome: {'anterior': anterior, 'exato': exato, 'divergente': anterior != exato}
+            for nome, (anterior, exato) in resultado.items()
+        })
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao reconciliar contadores: {str(e)}")
+        return jsonify({'error': 'Erro interno'}), 500
+
 # Rotas de Relatórios
 
+DIAS_MAXIMOS_RELATORIO_VENDAS = 730  # janela máxima: 2 anos
+
 @app.route('/api/relatorio-vendas', methods=['GET'])
 @limiter.limit("20 per minute")
-@cache.cached(timeout=300)
+@cache_tags.cached(timeout=300, tags=['stats'], revalidar=True)
 def relatorio_vendas():
-    """Relatório de análise de vendas por período"""
+    """Relatório de análise de vendas por período, lido dos resumos diários"""
     try:
-        dias = request.args.get('dias', 30, type=int)
-        data_limite = datetime.utcnow() - timedelta(days=dias)
+        dias = min(max(request.args.get('dias', 30, type=int), 1), DIAS_MAXIMOS_RELATORIO_VENDAS)
+        hoje = datetime.utcnow().date()
+        data_inicio = hoje - timedelta(days=dias - 1)
         
-        # Estatísticas básicas
-        total_produtos = Produto.query.count()
-        total_estabelecimentos = Estabelecimento.query.count()
-        total_precos = Preco.query.filter(Preco.data_coleta >= data_limite).count()
+        # Produtos com mais preços
+        produtos_query = db.session.query(
+            Produto.id, Produto.descricao, func.sum(ResumoDiarioProduto.total_precos).label('total_precos')
+        ).join(
+            ResumoDiarioProduto, Produto.id == ResumoDiarioProduto.produto_id
+        ).filter(
+            ResumoDiarioProduto.dia >= data_inicio
+        ).group_by(Produto.id, Produto.descricao).order_by(
+            desc('total_precos')
+        ).limit(5).all()
         
-        # Dados mock para demonstração
-        produtos_populares = []
-        estabelecimentos_ativos = []
+        # Estabelecimentos mais ativos
+        estabelecimentos_query = db.session.query(
+            Estabelecimento.id, Estabelecimento.nome,
+            func.sum(ResumoDiarioEstabelecimento.total_precos).label('total_precos')
+        ).join(
+            ResumoDiarioEstabelecimento, Estabelecimento.id == ResumoDiarioEstabelecimento.estabelecimento_id
+        ).filter(
+            ResumoDiarioEstabelecimento.dia >= data_inicio
+        ).group_by(Estabelecimento.id, Estabelecimento.nome).order_by(
+            desc('total_precos')
+        ).limit(5).all()
+        
+        # Evolução diária: uma consulta agrupada por dia (pela chave primária
+        # do resumo) e dias sem coleta preenchidos com zero
+        total_dia = func.sum(ResumoDiarioProduto.total_precos)
+        por_dia = {
+            dia: (total, preco_medio) for dia, total, preco_medio in db.session.query(
+                ResumoDiarioProduto.dia, total_dia,
+                func.sum(ResumoDiarioProduto.soma_precos) / total_dia
+            ).filter(
+                ResumoDiarioProduto.dia >= data_inicio
+            ).group_by(ResumoDiarioProduto.dia)
+        }
         evolucao_diaria = []
-        
-        # Se há dados, buscar informações reais
-        if total_precos > 0:
-            # Produtos com mais preços
-            try:
-                produtos_query = db.session.query(
-                    Produto.id, Produto.descricao, func.count(Preco.id).label('total_precos')
-                ).join(Preco).filter(
-                    Preco.data_coleta >= data_limite
-                ).group_by(Produto.id, Produto.descricao).order_by(
-                    desc('total_precos')
-                ).limit(5).all()
-                
-                produtos_populares = [{
-                    'id': p.id,
-                    'descricao': p.descricao,
-                    'total_precos': p.total_precos
-                } for p in produtos_query]
-            except:
-                pass
-            
-            # Estabelecimentos mais ativos
-            try:
-                estabelecimentos_query = db.session.query(
-                    Estabelecimento.id, Estabelecimento.nome, func.count(Preco.id).label('total_precos')
-                ).join(Preco).filter(
-                    Preco.data_coleta >= data_limite
-                ).group_by(Estabelecimento.id, Estabelecimento.nome).order_by(
-                    desc('total_precos')
-                ).limit(5).all()
-                
-                estabelecimentos_ativos = [{
-                    'id': e.id,
-                    'nome': e.nome,
-                    'total_precos': e.total_precos
-                } for e in estabelecimentos_query]
-            except:
-                pass
-        
-        # Dados padrão se não houver dados suficientes
-        if not produtos_populares:
-            produtos_populares = [{
-                'id': 1,
-                'descricao': 'Nenhum produto encontrado',
-                'total_precos': 0
-            }]
-        
-        if not estabelecimentos_ativos:
-            estabelecimentos_ativos = [{
-                'id': 1,
-                'nome': 'Nenhum estabelecimento encontrado',
-                'total_precos': 0
-            }]
-        
-        evolucao_diaria = [{
-            'data': datetime.now().strftime('%Y-%m-%d'),
-            'total': total_precos
-        }]
+        for deslocamento in range(dias):
+            dia = data_inicio + timedelta(days=deslocamento)
+            total, preco_medio = por_dia.get(dia, (0, None))
+            evolucao_diaria.append({
+                'data': dia.isoformat(),
+                'total': total,
+                'preco_medio': round(float(preco_medio), 2) if preco_medio is not None else None
+            })
         
         return jsonify({
-            'produtos_populares': produtos_populares,
-            'estabelecimentos_ativos': estabelecimentos_ativos,
+            'produtos_populares': [{
+                'id': p.id,
+                'descricao': p.descricao,
+                'total_precos': p.total_precos
+            } for p in produtos_query],
+            'estabelecimentos_ativos': [{
+                'id': e.id,
+                'nome': e.nome,
+                'total_precos': e.total_precos
+            } for e in estabelecimentos_query],
             'evolucao_diaria': evolucao_diaria
         })
         
     except Exception as e:
         logger.error(f"Erro no relatório de vendas: {str(e)}")
-        return jsonify({
-            'produtos_populares': [{'id': 1, 'descricao': 'Erro ao carregar', 'total_precos': 0}],
-            'estabelecimentos_ativos': [{'id': 1, 'nome': 'Erro ao carregar', 'total_precos': 0}],
-            'evolucao_diaria': [{'data': datetime.now().strftime('%Y-%m-%d'), 'total': 0}]
-        })
+        return jsonify({'error': 'Erro interno'}), 500
 
 
 
 @app.route('/api/relatorio-comparativo', methods=['GET'])
 @limiter.limit("20 per minute")
-@cache.cached(timeout=300)
+@cache_tags.cached(timeout=600)
 def relatorio_comparativo():
     """Relatório comparativo de preços entre estabelecimentos"""
     try:
@@ -376,31 +435,28 @@ def relatorio_comparativo():
             return jsonify({'error': 'produto_id é obrigatório'}), 400
             
         produto = Produto.query.get_or_404(produto_id)
+        marcar_tags(f'produto:{produto_id}')
         
-        # Preços atuais por estabelecimento
+        # Preço atual por estabelecimento (já ordenado do menor para o maior)
         precos_atuais = db.session.query(
+            Estabelecimento.id,
             Estabelecimento.nome,
             Estabelecimento.bairro,
-            Preco.preco,
-            Preco.data_coleta
-        ).join(Preco).filter(
-            Preco.produto_id == produto_id
-        ).order_by(desc(Preco.data_coleta)).all()
-        
-        # Agrupar por estabelecimento (pegar o mais recente)
-        estabelecimentos = {}
-        for nome, bairro, preco, data in precos_atuais:
-            key = f"{nome} - {bairro}"
-            if key not in estabelecimentos:
-                estabelecimentos[key] = {
-                    'estabelecimento': nome,
-                    'bairro': bairro,
-                    'preco': float(preco),
-                    'data_coleta': data.strftime('%d/%m/%Y %H:%M')
-                }
+            PrecoAtual.preco,
+            PrecoAtual.data_coleta
+        ).join(
+            PrecoAtual, PrecoAtual.estabelecimento_id == Estabelecimento.id
+        ).filter(
+            PrecoAtual.produto_id == produto_id
+        ).order_by(PrecoAtual.preco).all()
         
-        dados = list(estabelecimentos.values())
-        dados.sort(key=lambda x: x['preco'])
+        marcar_tags(*(f'estabelecimento:{est_id}' for est_id, *_ in precos_atuais))
+        dados = [{
+            'estabelecimento': nome,
+            'bairro': bairro,
+            'preco': float(preco),
+            'data_coleta': data.strftime('%d/%m/%Y %H:%M')
+        } for _, nome, bairro, preco, data in precos_atuais]
         
         # Calcular estatísticas
         precos_valores = [d['preco'] for d in dados]
@@ -432,89 +488,19 @@ def relatorio_comparativo():
         logger.error(f"Erro no relatório comparativo: {str(e)}")
         return jsonify({'error': 'Erro interno'}), 500
 
-# Funções auxiliares para exportação
-def gerar_csv(dados, filename):
-    """Gera arquivo CSV"""
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=dados[0].keys() if dados else [])
-    writer.writeheader()
-    writer.writerows(dados)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
-
-def gerar_excel(dados, filename):
-    """Gera arquivo Excel"""
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet()
-    
-    if dados:
-        # Cabeçalhos
-        headers = list(dados[0].keys())
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        # Dados
-        for row, item in enumerate(dados, 1):
-            for col, header in enumerate(headers):
-                worksheet.write(row, col, item[header])
-    
-    workbook.close()
-    output.seek(0)
-    
-    response = make_response(output.read())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
-
-def gerar_pdf(dados, titulo):
-    """Gera arquivo PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Título
-    title = Paragraph(titulo, styles['Title'])
-    elements.append(title)
-    
-    if dados:
-        # Tabela
-        headers = list(dados[0].keys())
-        table_data = [headers]
-        
-        for item in dados:
-            row = [str(item[header]) for header in headers]
-            table_data.append(row)
-        
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    response = make_response(buffer.read())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename={titulo.replace(" ", "_")}.pdf'
-    return response
+def aceita_ndjson():
+    """Cliente pediu JSON Lines (Accept: application/x-ndjson) em vez de um array JSON"""
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def linhas_em_lotes(query, serializar, lote=1000):
+    """Percorre ``query`` com cursor no servidor, serializando cada linha"""
+    for linha in query.yield_per(lote):
+        yield serializar(linha)
 
 # Produtos
 @app.route('/produtos', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60, query_string=True)
+@cache_tags.cached(timeout=600, tags=['produtos'], unless=aceita_ndjson)
 def listar_produtos():
     start_time = time.perf_counter()
     
@@ -530,18 +516,17 @@ def listar_produtos():
             ).all()
             
             if len(produtos) < 3:
-                todos_produtos = Produto.query.all()
-                descricoes = [p.descricao for p in todos_produtos]
-                matches_fuzzy = busca_fuzzy(busca, descricoes)
+                produtos_ids = {p.id for p in produtos}
+                ids_fuzzy = [i for i in indice_produtos.buscar(busca) if i not in produtos_ids]
                 
-                if matches_fuzzy:
-                    produtos_fuzzy = Produto.query.filter(
-                        Produto.descricao.in_(matches_fuzzy)
-                    ).all()
-                    produtos_ids = {p.id for p in produtos}
-                    for p in produtos_fuzzy:
-                        if p.id not in produtos_ids:
-                            produtos.append(p)
+                if ids_fuzzy:
+                    produtos_fuzzy = Produto.query.filter(Produto.id.in_(ids_fuzzy)).all()
+                    produtos.extend(produtos_fuzzy)
+        elif aceita_ndjson():
+            # Tabela inteira em streaming, uma linha por produto, sem montar a lista
+            query = db.session.query(Produto.id, Produto.descricao, Produto.ean).order_by(Produto.id)
+            linhas = linhas_em_lotes(query, lambda p: {'id': p.id, 'descricao': p.descricao, 'ean': p.ean})
+            return resposta_streaming(FonteLinhas(['id', 'descricao', 'ean'], linhas), 'jsonl')
         else:
             produtos = Produto.query.all()
         
@@ -551,6 +536,9 @@ def listar_produtos():
             'ean': p.ean
         } for p in produtos]
         
+        if aceita_ndjson():
+            return resposta_streaming(FonteLinhas(['id', 'descricao', 'ean'], resultado), 'jsonl')
+        
         tempo_execucao = time.perf_counter() - start_time
         if tempo_execucao > 0.5:
             logger.warning(f"Query lenta em produtos: {tempo_execucao:.3f}s para '{busca}'")
@@ -576,7 +564,9 @@ def criar_produto():
         ean=data.get('ean')
     )
     db.session.add(produto)
+    ajustar_contador('produtos', 1)
     db.session.commit()
+    cache_tags.invalidar('produtos', 'stats')
     return jsonify({'id': produto.id}), 201
 
 @app.route('/produtos/<int:id>', methods=['PUT'])
@@ -593,18 +583,25 @@ def editar_produto(id):
     produto.descricao = data['descricao']
     produto.ean = data.get('ean')
     db.session.commit()
+    cache_tags.invalidar('produtos', f'produto:{id}')
     return jsonify({'success': True})
 
 @app.route('/produtos/<int:id>', methods=['DELETE'])
 def excluir_produto(id):
     produto = Produto.query.get_or_404(id)
+    # Os preços do produto também somam nos resumos diários dos estabelecimentos
+    chaves = chaves_resumo(Preco.produto_id == id)
+    ajustar_contador('precos', -produto.precos.count())
+    ajustar_contador('produtos', -1)
     db.session.delete(produto)
+    atualizar_resumos_diarios(chaves)
     db.session.commit()
+    cache_tags.invalidar('produtos', f'produto:{id}', 'precos', 'stats')
     return jsonify({'success': True})
 
 @app.route('/produtos/com-precos', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60, query_string=True)
+@cache_tags.cached(timeout=600, tags=['produtos', 'precos'])
 def produtos_com_precos():
     """Lista apenas produtos que têm preços cadastrados"""
     try:
@@ -620,9 +617,11 @@ def produtos_com_precos():
         return jsonify({'error': 'Erro interno'}), 500
 
 # Estabelecimentos
+CAMPOS_ESTABELECIMENTO = ['id', 'nome', 'cnpj', 'bairro', 'cidade']
+
 @app.route('/estabelecimentos', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60, query_string=True)
+@cache_tags.cached(timeout=600, tags=['estabelecimentos'], unless=aceita_ndjson)
 def listar_estabelecimentos():
     start_time = time.perf_counter()
     
@@ -641,18 +640,32 @@ def listar_estabelecimentos():
             
             # Busca fuzzy se poucos resultados
             if len(estabelecimentos) < 3:
-                todos_estabelecimentos = Estabelecimento.query.all()
-                nomes = [e.nome for e in todos_estabelecimentos]
-                matches_fuzzy = busca_fuzzy(busca, nomes)
+                estabelecimentos_ids = {e.id for e in estabelecimentos}
+                
+                if app.config['BUSCA_ESTABELECIMENTOS_LEGADA']:
+                    inicio_fuzzy = time.perf_counter()
+                    todos_estabelecimentos = Estabelecimento.query.all()
+                    nomes = [e.nome for e in todos_estabelecimentos]
+                    matches_fuzzy = busca_fuzzy(busca, nomes)
+                    ids_fuzzy = [e.id for e in todos_estabelecimentos if e.nome in matches_fuzzy]
+                    histograma('busca_estabelecimentos_legada').registrar(time.perf_counter() - inicio_fuzzy)
+                else:
+                    ids_fuzzy = motor_estabelecimentos.buscar(busca)
                 
-                if matches_fuzzy:
+                ids_fuzzy = [i for i in ids_fuzzy if i not in estabelecimentos_ids]
+                if ids_fuzzy:
                     estabelecimentos_fuzzy = Estabelecimento.query.filter(
-                        Estabelecimento.nome.in_(matches_fuzzy)
+                        Estabelecimento.id.in_(ids_fuzzy)
                     ).all()
-                    estabelecimentos_ids = {e.id for e in estabelecimentos}
-                    for e in estabelecimentos_fuzzy:
-                        if e.id not in estabelecimentos_ids:
-                            estabelecimentos.append(e)
+                    estabelecimentos.extend(estabelecimentos_fuzzy)
+        elif aceita_ndjson():
+            # Tabela inteira em streaming, uma linha por estabelecimento, sem montar a lista
+            query = db.session.query(
+                Estabelecimento.id, Estabelecimento.nome, Estabelecimento.cnpj,
+                Estabelecimento.bairro, Estabelecimento.cidade
+            ).order_by(Estabelecimento.id)
+            linhas = linhas_em_lotes(query, lambda e: e._asdict())
+            return resposta_streaming(FonteLinhas(CAMPOS_ESTABELECIMENTO, linhas), 'jsonl')
         else:
             estabelecimentos = Estabelecimento.query.all()
         
@@ -664,6 +677,9 @@ def listar_estabelecimentos():
             'cidade': e.cidade
         } for e in estabelecimentos]
         
+        if aceita_ndjson():
+            return resposta_streaming(FonteLinhas(CAMPOS_ESTABELECIMENTO, resultado), 'jsonl')
+        
         tempo_execucao = time.perf_counter() - start_time
         if tempo_execucao > 0.5:
             logger.warning(f"Query lenta em estabelecimentos: {tempo_execucao:.3f}s para '{busca}'")
@@ -697,7 +713,9 @@ def criar_estabelecimento():
         cidade=data['cidade']
     )
     db.session.add(estabelecimento)
+    ajustar_contador('estabelecimentos', 1)
     db.session.commit()
+    cache_tags.invalidar('estabelecimentos', 'stats')
     return jsonify({'id': estabelecimento.id}), 201
 
 @app.route('/estabelecimentos/<int:id>', methods=['PUT'])
@@ -722,16 +740,30 @@ def editar_estabelecimento(id):
     estabelecimento.bairro = data['bairro']
     estabelecimento.cidade = data['cidade']
     db.session.commit()
+    cache_tags.invalidar('estabelecimentos', f'estabelecimento:{id}')
     return jsonify({'success': True})
 
 @app.route('/estabelecimentos/<int:id>', methods=['DELETE'])
 def excluir_estabelecimento(id):
     estabelecimento = Estabelecimento.query.get_or_404(id)
+    # Os preços do estabelecimento também somam nos resumos diários dos produtos
+    chaves = chaves_resumo(Preco.estabelecimento_id == id)
+    ajustar_contador('precos', -estabelecimento.precos.count())
+    ajustar_contador('estabelecimentos', -1)
     db.session.delete(estabelecimento)
+    atualizar_resumos_diarios(chaves)
     db.session.commit()
+    cache_tags.invalidar('estabelecimentos', f'estabelecimento:{id}', 'precos', 'stats')
     return jsonify({'success': True})
 
 # Preços
+def invalidar_cache_precos(pares):
+    """Invalida as respostas em cache afetadas por preços dos pares (produto, estabelecimento)"""
+    tags = {'precos', 'stats'}
+    for produto_id, estabelecimento_id in pares:
+        tags.update((f'produto:{produto_id}', f'estabelecimento:{estabelecimento_id}'))
+    cache_tags.invalidar(*tags)
+
 @app.route('/precos', methods=['GET'])
 def listar_precos():
     # Busca avançada com filtros
@@ -753,16 +785,35 @@ def listar_precos():
     if preco_max:
         query = query.filter(Preco.preco <= float(preco_max))
     
-    precos = query.paginate(page=page, per_page=per_page, error_out=False)
-    
-    return jsonify({
-        'precos': [{
+    def serializar(p):
+        return {
             'id': p.id,
             'produto_id': p.produto_id,
             'estabelecimento_id': p.estabelecimento_id,
             'preco': float(p.preco),
             'data_coleta': p.data_coleta.isoformat()
-        } for p in precos.items],
+        }
+    
+    # Paginação por cursor: ?cursor= (vazio) inicia na primeira página
+    if 'cursor' in request.args:
+        try:
+            itens, proximo_cursor = paginar_por_cursor(
+                query, Preco.id, Preco.id, 'asc', request.args['cursor'], per_page,
+                lambda p: (p.id, p.id)
+            )
+        except CursorInvalido as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'precos': [serializar(p) for p in itens],
+            'proximo_cursor': proximo_cursor,
+            'total': query.count() if request.args.get('incluir_total') == '1' else None
+        })
+    
+    precos = query.paginate(page=page, per_page=per_page, error_out=False)
+    
+    return jsonify({
+        'precos': [serializar(p) for p in precos.items],
         'total': precos.total,
         'pages': precos.pages,
         'current_page': page
@@ -784,6 +835,18 @@ def criar_preco():
     
     usuario_id = session.get('user_id')
     
+    janela = app.config['PRECOS_JANELA_DEDUP']
+    if janela:
+        try:
+            par = (int(data['produto_id']), int(data['estabelecimento_id']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Produto e estabelecimento inválidos'}), 400
+        preco_id = confirmar_repetido(*par, preco_valor, datetime.utcnow(), janela)
+        if preco_id:
+            db.session.commit()
+            invalidar_cache_precos([par])
+            return jsonify({'id': preco_id, 'confirmado': True}), 200
+    
     preco = Preco(
         produto_id=data['produto_id'],
         estabelecimento_id=data['estabelecimento_id'],
@@ -791,9 +854,66 @@ def criar_preco():
         usuario_id=usuario_id
     )
     db.session.add(preco)
+    atualizar_preco_atual([(preco.produto_id, preco.estabelecimento_id)])
+    atualizar_resumos_diarios([(preco.data_coleta, preco.produto_id, preco.estabelecimento_id)])
+    ajustar_contador('precos', 1)
     db.session.commit()
+    invalidar_cache_precos([(preco.produto_id, preco.estabelecimento_id)])
     return jsonify({'id': preco.id}), 201
 
+def itens_do_corpo():
+    """Itens de um lote: array JSON, {"precos": [...]} ou JSON Lines (application/x-ndjson)
+
+    Linhas NDJSON que não são JSON válido seguem como texto, para serem
+    rejeitadas individualmente na validação. Retorna None se o corpo não for
+    um lote.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        itens = []
+        for linha in request.get_data(as_text=True).splitlines():
+            if not linha.strip():
+                continue
+            try:
+                itens.append(json.loads(linha))
+            except ValueError:
+                itens.append(linha)
+        return itens
+    
+    dados = request.get_json(silent=True)
+    if isinstance(dados, dict):
+        dados = dados.get('precos')
+    return dados if isinstance(dados, list) else None
+
+@app.route('/precos/lote', methods=['POST'])
+@limiter.limit("30 per minute")
+def criar_precos_lote():
+    """Cria vários preços numa transação; linhas inválidas são devolvidas em 'erros'"""
+    itens = itens_do_corpo()
+    if not itens:
+        return jsonify({'error': 'Envie uma lista de preços (JSON ou NDJSON)'}), 400
+    if len(itens) > LIMITE_LOTE:
+        return jsonify({'error': f'Máximo de {LIMITE_LOTE} preços por lote'}), 413
+    
+    try:
+        inseridos, confirmados, erros, pares = processar_lote(
+            itens, session.get('user_id'), janela=app.config['PRECOS_JANELA_DEDUP']
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao inserir lote de preços: {str(e)}")
+        return jsonify({'error': 'Erro interno'}), 500
+    
+    if pares:
+        invalidar_cache_precos(pares)
+    logger.info(f"Lote de preços: {inseridos} inseridos, {confirmados} confirmados, {len(erros)} rejeitados")
+    return jsonify({
+        'inseridos': inseridos,
+        'confirmados': confirmados,
+        'rejeitados': len(erros),
+        'erros': erros
+    }), 201 if inseridos or confirmados else 400
+
 @app.route('/precos/<int:id>', methods=['PUT'])
 def editar_preco(id):
     preco = Preco.query.get_or_404(id)
@@ -809,22 +929,33 @@ def editar_preco(id):
     except ValueError:
         return jsonify({'error': 'Preço deve ser um número válido'}), 400
     
+    par_anterior = (preco.produto_id, preco.estabelecimento_id)
     preco.produto_id = data['produto_id']
     preco.estabelecimento_id = data['estabelecimento_id']
     preco.preco = preco_valor
+    atualizar_preco_atual([par_anterior, (preco.produto_id, preco.estabelecimento_id)])
+    atualizar_resumos_diarios([
+        (preco.data_coleta, *par_anterior),
+        (preco.data_coleta, preco.produto_id, preco.estabelecimento_id)
+    ])
     db.session.commit()
+    invalidar_cache_precos([par_anterior, (preco.produto_id, preco.estabelecimento_id)])
     return jsonify({'success': True})
 
 @app.route('/precos/<int:id>', methods=['DELETE'])
 def excluir_preco(id):
     preco = Preco.query.get_or_404(id)
     db.session.delete(preco)
+    atualizar_preco_atual([(preco.produto_id, preco.estabelecimento_id)])
+    atualizar_resumos_diarios([(preco.data_coleta, preco.produto_id, preco.estabelecimento_id)])
+    ajustar_contador('precos', -1)
     db.session.commit()
+    invalidar_cache_precos([(preco.produto_id, preco.estabelecimento_id)])
     return jsonify({'success': True})
 
 @app.route('/precos/detalhados', methods=['GET'])
 @limiter.limit("20 per minute")
-@cache.cached(timeout=30, query_string=True)
+@cache_tags.cached(timeout=300, tags=['precos', 'produtos', 'estabelecimentos'])
 def listar_precos_detalhados():
     """Lista preços com informações detalhadas de produto e estabelecimento"""
     try:
@@ -847,11 +978,21 @@ def listar_precos_detalhados():
                 )
             )
         
-        query = query.order_by(Preco.data_coleta.desc())
-        precos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
+        if 'cursor' in request.args:
+            try:
+                itens, proximo_cursor = paginar_por_cursor(
+                    query, Preco.data_coleta, Preco.id, 'desc', request.args['cursor'], per_page,
+                    lambda item: (item[0].data_coleta, item[0].id)
+                )
+            except CursorInvalido as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            query = query.order_by(Preco.data_coleta.desc())
+            precos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
+            itens = precos_paginados.items
         
         resultado = []
-        for preco, produto, estabelecimento in precos_paginados.items:
+        for preco, produto, estabelecimento in itens:
             resultado.append({
                 'id': preco.id,
                 'produto_id': preco.produto_id,
@@ -870,6 +1011,13 @@ def listar_precos_detalhados():
                 }
             })
         
+        if 'cursor' in request.args:
+            return jsonify({
+                'precos': resultado,
+                'proximo_cursor': proximo_cursor,
+                'total': query.count() if request.args.get('incluir_total') == '1' else None
+            })
+        
         return jsonify({
             'precos': resultado,
             'total': precos_paginados.total,
@@ -887,7 +1035,7 @@ def listar_precos_detalhados():
 
 @app.route('/comparar', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60, query_string=True)
+@cache_tags.cached(timeout=300, tags=['precos', 'produtos', 'estabelecimentos'])
 def comparar_com_busca():
     """Comparação com busca fuzzy"""
     try:
@@ -895,53 +1043,23 @@ def comparar_com_busca():
         if not termo:
             return jsonify({'error': 'Termo de busca obrigatório'}), 400
         
+        limit_por_produto = request.args.get('limit_por_produto', type=int)
+        if limit_por_produto is not None and limit_por_produto < 1:
+            return jsonify({'error': 'limit_por_produto deve ser maior que zero'}), 400
+        
         produtos = Produto.query.filter(
             Produto.descricao.ilike(f'%{termo}%')
         ).all()
         
         if len(produtos) < 3:
-            todos_produtos = Produto.query.all()
-            descricoes = [p.descricao for p in todos_produtos]
-            matches_fuzzy = busca_fuzzy(termo, descricoes)
+            produtos_ids = {p.id for p in produtos}
+            ids_fuzzy = [i for i in indice_produtos.buscar(termo) if i not in produtos_ids]
             
-            if matches_fuzzy:
-                produtos_fuzzy = Produto.query.filter(
-                    Produto.descricao.in_(matches_fuzzy)
-                ).all()
-                produtos_ids = {p.id for p in produtos}
-                for p in produtos_fuzzy:
-                    if p.id not in produtos_ids:
-                        produtos.append(p)
+            if ids_fuzzy:
+                produtos_fuzzy = Produto.query.filter(Produto.id.in_(ids_fuzzy)).all()
+                produtos.extend(produtos_fuzzy)
         
-        resultado = []
-        for produto in produtos:
-            precos = db.session.query(Preco, Estabelecimento).join(
-                Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-            ).filter(Preco.produto_id == produto.id).order_by(Preco.preco).all()
-            
-            if precos:
-                produto_data = {
-                    'produto': {
-                        'id': produto.id,
-                        'descricao': produto.descricao,
-                        'ean': produto.ean
-                    },
-                    'precos': []
-                }
-                
-                for preco, estabelecimento in precos:
-                    produto_data['precos'].append({
-                        'preco': float(preco.preco),
-                        'data_coleta': preco.data_coleta.isoformat(),
-                        'estabelecimento': {
-                            'id': estabelecimento.id,
-                            'nome': estabelecimento.nome,
-                            'bairro': estabelecimento.bairro,
-                            'cidade': estabelecimento.cidade
-                        }
-                    })
-                
-                resultado.append(produto_data)
+        resultado = comparar_produtos(produtos, limit_por_produto=limit_por_produto)
         
         return jsonify(resultado)
         
@@ -956,32 +1074,41 @@ def relatorios():
 
 @app.route('/api/historico-precos/<int:produto_id>')
 @limiter.limit("20 per minute")
-@cache.cached(timeout=300, query_string=True)
+@cache_tags.cached(timeout=600, tags=['produto:{produto_id}', 'estabelecimentos'])
 def historico_precos(produto_id):
-    """Histórico de preços de um produto"""
+    """Histórico de preços de um produto
+
+    Com ``formato=compacto`` o histórico vem agrupado por estabelecimento, com
+    coletas seguidas do mesmo preço reunidas em trechos ``[inicio, fim, preco]``
+    e os dados de cada estabelecimento uma única vez em ``estabelecimentos``.
+    """
     try:
         produto = Produto.query.get_or_404(produto_id)
         dias = int(request.args.get('dias', 30))
         data_limite = datetime.utcnow() - timedelta(days=dias)
         
+        resultado = {
+            'produto': {
+                'id': produto.id,
+                'descricao': produto.descricao,
+                'ean': produto.ean
+            }
+        }
+        
+        if request.args.get('formato') == 'compacto':
+            resultado.update(historico_compacto(produto_id, data_limite))
+            return jsonify(resultado)
+        
         historico = db.session.query(
             Preco, Estabelecimento
         ).join(
             Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
         ).filter(
             Preco.produto_id == produto_id,
-            Preco.data_coleta >= data_limite
+            observado_desde(data_limite)
         ).order_by(Preco.data_coleta.desc()).all()
         
-        resultado = {
-            'produto': {
-                'id': produto.id,
-                'descricao': produto.descricao,
-                'ean': produto.ean
-            },
-            'historico': []
-        }
-        
+        resultado['historico'] = []
         for preco, estabelecimento in historico:
             resultado['historico'].append({
                 'preco': float(preco.preco),
@@ -1000,6 +1127,49 @@ def historico_precos(produto_id):
         logger.error(f"Erro no histórico de preços: {str(e)}")
         return jsonify({'error': 'Erro interno'}), 500
 
+def historico_compacto(produto_id, data_limite):
+    """Histórico em trechos de preço constante, por estabelecimento
+
+    O fim de cada trecho é a última coleta (ou ``valido_ate``) do mesmo preço.
+    Um preço coletado antes de ``data_limite`` e confirmado depois entra com
+    o início cortado em ``data_limite``.
+    """
+    linhas = db.session.query(
+        Preco.estabelecimento_id, Preco.preco, Preco.data_coleta, Preco.valido_ate
+    ).filter(
+        Preco.produto_id == produto_id,
+        observado_desde(data_limite)
+    ).order_by(Preco.estabelecimento_id, Preco.data_coleta, Preco.id).all()
+    
+    series = []
+    trechos, estabelecimento_atual = None, None
+    for estabelecimento_id, preco, data_coleta, valido_ate in linhas:
+        fim = max(data_coleta, valido_ate or data_coleta)
+        if estabelecimento_id != estabelecimento_atual:
+            trechos = []
+            series.append({'estabelecimento_id': estabelecimento_id, 'trechos': trechos})
+            estabelecimento_atual = estabelecimento_id
+        elif preco == trechos[-1][2]:
+            trechos[-1][1] = max(trechos[-1][1], fim)
+            continue
+        trechos.append([max(data_coleta, data_limite), fim, preco])
+    
+    for serie in series:
+        serie['trechos'] = [[inicio.isoformat(), fim.isoformat(), float(preco)] for inicio, fim, preco in serie['trechos']]
+    
+    ids = [serie['estabelecimento_id'] for serie in series]
+    estabelecimentos = db.session.query(
+        Estabelecimento.id, Estabelecimento.nome, Estabelecimento.bairro, Estabelecimento.cidade
+    ).filter(Estabelecimento.id.in_(ids)).all() if ids else []
+    
+    return {
+        'estabelecimentos': {
+            str(id_): {'nome': nome, 'bairro': bairro, 'cidade': cidade}
+            for id_, nome, bairro, cidade in estabelecimentos
+        },
+        'series': series
+    }
+
 @app.route('/api/relatorio-precos')
 @limiter.limit("10 per minute")
 def relatorio_precos():
@@ -1007,131 +1177,85 @@ def relatorio_precos():
     try:
         formato = request.args.get('formato', 'json')
         dias = int(request.args.get('dias', 7))
-        produto_id = request.args.get('produto_id')
-        estabelecimento_id = request.args.get('estabelecimento_id')
-        
-        data_limite = datetime.utcnow() - timedelta(days=dias)
+        produto_id = request.args.get('produto_id', type=int)
+        estabelecimento_id = request.args.get('estabelecimento_id', type=int)
         
-        query = db.session.query(
-            Preco, Produto, Estabelecimento
-        ).join(
-            Produto, Preco.produto_id == Produto.id
-        ).join(
-            Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-        ).filter(
-            Preco.data_coleta >= data_limite
-        )
+        if formato in formatos_disponiveis():
+            parametros = {'dias': dias, 'produto_id': produto_id, 'estabelecimento_id': estabelecimento_id}
+            
+            # Formatos incrementais podem ser enviados direto, em streaming, da mesma fonte de linhas
+            if request.args.get('modo') == 'stream' and obter_exportador(formato).incremental:
+                fonte = fonte_relatorio_precos(**parametros)
+                return resposta_exportacao(fonte, formato, f'relatorio_precos{obter_exportador(formato).extensao}')
+            
+            # Os demais arquivos são gerados pela fila de relatórios; a requisição só agenda o job
+            job = fila_relatorios.solicitar('relatorio_precos', formato, parametros)
+            return jsonify(serializar_job(job, fila_relatorios)), 202
         
-        if produto_id:
-            query = query.filter(Preco.produto_id == produto_id)
-        if estabelecimento_id:
-            query = query.filter(Preco.estabelecimento_id == estabelecimento_id)
-        
-        precos = query.order_by(Preco.data_coleta.desc()).all()
-        
-        dados = []
-        for preco, produto, estabelecimento in precos:
-            dados.append({
-                'produto': produto.descricao,
-                'ean': produto.ean or '',
-                'estabelecimento': estabelecimento.nome,
-                'bairro': estabelecimento.bairro,
-                'cidade': estabelecimento.cidade,
-                'preco': float(preco.preco),
-                'data_coleta': preco.data_coleta.strftime('%d/%m/%Y %H:%M')
-            })
+        if aceita_ndjson():
+            return resposta_streaming(fonte_relatorio_precos(dias, produto_id, estabelecimento_id), 'jsonl')
         
-        if formato == 'csv':
-            return exportar_csv(dados, 'relatorio_precos.csv')
-        elif formato == 'excel':
-            return exportar_excel(dados, 'relatorio_precos.xlsx')
-        elif formato == 'pdf':
-            return exportar_pdf(dados, 'Relatório de Preços')
-        else:
-            return jsonify(dados)
+        query = consulta_relatorio_precos(dias, produto_id, estabelecimento_id)
+        return jsonify(list(linhas_relatorio_precos(query)))
             
     except Exception as e:
         logger.error(f"Erro no relatório de preços: {str(e)}")
         return jsonify({'error': 'Erro interno'}), 500
 
-def exportar_csv(dados, filename):
-    """Exporta dados para CSV"""
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=dados[0].keys() if dados else [])
-    writer.writeheader()
-    writer.writerows(dados)
-    
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
-
-def exportar_excel(dados, filename):
-    """Exporta dados para Excel"""
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet()
-    
-    if dados:
-        headers = list(dados[0].keys())
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header)
-        
-        for row, item in enumerate(dados, 1):
-            for col, header in enumerate(headers):
-                worksheet.write(row, col, item[header])
+def consulta_relatorio_precos(dias, produto_id=None, estabelecimento_id=None):
+    """Consulta do relatório de preços, apenas com as colunas exportadas"""
+    data_limite = datetime.utcnow() - timedelta(days=dias)
     
-    workbook.close()
-    output.seek(0)
-    
-    response = make_response(output.read())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
-
-def exportar_pdf(dados, titulo):
-    """Exporta dados para PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    title = Paragraph(titulo, styles['Title'])
-    elements.append(title)
-    
-    if dados:
-        headers = list(dados[0].keys())
-        table_data = [headers]
-        
-        for item in dados:
-            row = [str(item[header]) for header in headers]
-            table_data.append(row)
-        
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
+    query = db.session.query(
+        Produto.descricao, Produto.ean,
+        Estabelecimento.nome, Estabelecimento.bairro, Estabelecimento.cidade,
+        Preco.preco, Preco.data_coleta
+    ).join(
+        Produto, Preco.produto_id == Produto.id
+    ).join(
+        Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
+    ).filter(
+        observado_desde(data_limite)
+    )
     
-    doc.build(elements)
-    buffer.seek(0)
+    if produto_id:
+        query = query.filter(Preco.produto_id == produto_id)
+    if estabelecimento_id:
+        query = query.filter(Preco.estabelecimento_id == estabelecimento_id)
     
-    response = make_response(buffer.read())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = 'attachment; filename=relatorio.pdf'
-    return response
+    return query.order_by(Preco.data_coleta.desc())
+
+CAMPOS_RELATORIO_PRECOS = ['produto', 'ean', 'estabelecimento', 'bairro', 'cidade', 'preco', 'data_coleta']
+LARGURAS_PDF_RELATORIO_PRECOS = [0.25, 0.12, 0.17, 0.12, 0.11, 0.08, 0.15]
+
+def linhas_relatorio_precos(query, formatar_datas=True, lote=1000):
+    """Percorre a consulta do relatório em lotes, gerando um dicionário por linha"""
+    for descricao, ean, nome, bairro, cidade, preco, data_coleta in query.yield_per(lote):
+        if formatar_datas:
+            data_coleta = data_coleta.strftime('%d/%m/%Y %H:%M')
+        yield {
+            'produto': descricao,
+            'ean': ean or '',
+            'estabelecimento': nome,
+            'bairro': bairro,
+            'cidade': cidade,
+            'preco': float(preco),
+            'data_coleta': data_coleta
+        }
+
+@registrar_relatorio('relatorio_precos')
+def fonte_relatorio_precos(dias, produto_id=None, estabelecimento_id=None):
+    query = consulta_relatorio_precos(dias, produto_id, estabelecimento_id)
+    return FonteLinhas(
+        CAMPOS_RELATORIO_PRECOS, linhas_relatorio_precos(query, formatar_datas=False),
+        titulo='Relatório de Preços', tipos={'preco': 'moeda', 'data_coleta': 'data'},
+        larguras=LARGURAS_PDF_RELATORIO_PRECOS, contar=lambda: query.order_by(None).count()
+    )
 
 # Ordenação avançada para listagens
 @app.route('/precos/ordenados', methods=['GET'])
 @limiter.limit("30 per minute")
-@cache.cached(timeout=60, query_string=True)
+@cache_tags.cached(timeout=300, tags=['precos', 'produtos', 'estabelecimentos'])
 def listar_precos_ordenados():
     """Lista preços com ordenação avançada"""
     try:
@@ -1146,25 +1270,40 @@ def listar_precos_ordenados():
             Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
         )
         
-        # Ordenação
+        # Ordenação (valor_ordenacao extrai o campo de uma linha para o cursor)
         if ordenar_por == 'preco':
             order_field = Preco.preco
+            valor_ordenacao = lambda item: item[0].preco
         elif ordenar_por == 'produto':
             order_field = Produto.descricao
+            valor_ordenacao = lambda item: item[1].descricao
         elif ordenar_por == 'estabelecimento':
             order_field = Estabelecimento.nome
+            valor_ordenacao = lambda item: item[2].nome
         else:
             order_field = Preco.data_coleta
+            valor_ordenacao = lambda item: item[0].data_coleta
         
-        if ordem == 'asc':
-            query = query.order_by(asc(order_field))
+        if 'cursor' in request.args:
+            try:
+                itens, proximo_cursor = paginar_por_cursor(
+                    query, order_field, Preco.id, 'asc' if ordem == 'asc' else 'desc',
+                    request.args['cursor'], per_page,
+                    lambda item: (valor_ordenacao(item), item[0].id)
+                )
+            except CursorInvalido as e:
+                return jsonify({'error': str(e)}), 400
         else:
-            query = query.order_by(desc(order_field))
-        
-        precos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
+            if ordem == 'asc':
+                query = query.order_by(asc(order_field))
+            else:
+                query = query.order_by(desc(order_field))
+            
+            precos_paginados = query.paginate(page=page, per_page=per_page, error_out=False)
+            itens = precos_paginados.items
         
         resultado = []
-        for preco, produto, estabelecimento in precos_paginados.items:
+        for preco, produto, estabelecimento in itens:
             resultado.append({
                 'id': preco.id,
                 'preco': float(preco.preco),
@@ -1182,11 +1321,21 @@ def listar_precos_ordenados():
                 }
             })
         
+        if 'cursor' in request.args:
+            paginacao = {
+                'proximo_cursor': proximo_cursor,
+                'total': query.count() if request.args.get('incluir_total') == '1' else None
+            }
+        else:
+            paginacao = {
+                'total': precos_paginados.total,
+                'pages': precos_paginados.pages,
+                'current_page': page
+            }
+        
         return jsonify({
             'precos': resultado,
-            'total': precos_paginados.total,
-            'pages': precos_paginados.pages,
-            'current_page': page,
+            **paginacao,
             'ordenacao': {
                 'campo': ordenar_por,
                 'ordem': ordem
@@ -1199,19 +1348,20 @@ def listar_precos_ordenados():
 
 @app.route('/api/estatisticas-avancadas')
 @limiter.limit("20 per minute")
-@cache.cached(timeout=300)
+@cache_tags.cached(timeout=300, tags=['stats'], revalidar=True)
 def estatisticas_avancadas():
-    """Estatísticas avançadas para gráficos"""
+    """Estatísticas avançadas para gráficos, lidas dos resumos diários"""
     try:
         # Top 10 produtos com mais preços
+        total_produto = func.sum(ResumoDiarioProduto.total_precos)
         top_produtos = db.session.query(
             Produto.descricao,
-            func.count(Preco.id).label('total_precos'),
-            func.min(Preco.preco).label('menor_preco'),
-            func.max(Preco.preco).label('maior_preco'),
-            func.avg(Preco.preco).label('preco_medio')
+            total_produto.label('total_precos'),
+            func.min(ResumoDiarioProduto.menor_preco).label('menor_preco'),
+            func.max(ResumoDiarioProduto.maior_preco).label('maior_preco'),
+            (func.sum(ResumoDiarioProduto.soma_precos) / total_produto).label('preco_medio')
         ).join(
-            Preco, Produto.id == Preco.produto_id
+            ResumoDiarioProduto, Produto.id == ResumoDiarioProduto.produto_id
         ).group_by(
             Produto.id, Produto.descricao
         ).order_by(
@@ -1219,12 +1369,13 @@ def estatisticas_avancadas():
         ).limit(10).all()
         
         # Top 10 estabelecimentos com mais preços
+        total_estabelecimento = func.sum(ResumoDiarioEstabelecimento.total_precos)
         top_estabelecimentos = db.session.query(
             Estabelecimento.nome,
-            func.count(Preco.id).label('total_precos'),
-            func.avg(Preco.preco).label('preco_medio')
+            total_estabelecimento.label('total_precos'),
+            (func.sum(ResumoDiarioEstabelecimento.soma_precos) / total_estabelecimento).label('preco_medio')
         ).join(
-            Preco, Estabelecimento.id == Preco.estabelecimento_id
+            ResumoDiarioEstabelecimento, Estabelecimento.id == ResumoDiarioEstabelecimento.estabelecimento_id
         ).group_by(
             Estabelecimento.id, Estabelecimento.nome
         ).order_by(
@@ -1232,16 +1383,17 @@ def estatisticas_avancadas():
         ).limit(10).all()
         
         # Variação de preços nos últimos 30 dias
-        data_limite = datetime.utcnow() - timedelta(days=30)
+        data_limite = (datetime.utcnow() - timedelta(days=30)).date()
+        total_dia = func.sum(ResumoDiarioProduto.total_precos)
         variacao_precos = db.session.query(
-            func.date(Preco.data_coleta).label('data'),
-            func.count(Preco.id).label('total_precos'),
-            func.avg(Preco.preco).label('preco_medio')
+            ResumoDiarioProduto.dia.label('data'),
+            total_dia.label('total_precos'),
+            (func.sum(ResumoDiarioProduto.soma_precos) / total_dia).label('preco_medio')
         ).filter(
-            Preco.data_coleta >= data_limite
+            ResumoDiarioProduto.dia >= data_limite
         ).group_by(
-            func.date(Preco.data_coleta)
-        ).order_by('data').all()
+            ResumoDiarioProduto.dia
+        ).order_by(ResumoDiarioProduto.dia).all()
         
         return jsonify({
             'top_produtos': [{
@@ -1274,17 +1426,31 @@ def listar_favoritos():
     """Lista favoritos do usuário logado"""
     try:
         usuario_id = session['user_id']
-        favoritos = db.session.query(Favorito, Produto).join(
+        
+        # Melhor oferta atual de cada produto favoritado
+        posicao = func.row_number().over(
+            partition_by=PrecoAtual.produto_id,
+            order_by=(PrecoAtual.preco, PrecoAtual.estabelecimento_id)
+        ).label('posicao')
+        ofertas = db.session.query(
+            PrecoAtual.produto_id, PrecoAtual.estabelecimento_id,
+            PrecoAtual.preco, PrecoAtual.data_coleta, posicao
+        ).join(
+            Favorito, Favorito.produto_id == PrecoAtual.produto_id
+        ).filter(Favorito.usuario_id == usuario_id).subquery()
+        
+        favoritos = db.session.query(
+            Favorito, Produto, ofertas.c.preco, ofertas.c.data_coleta, Estabelecimento.nome
+        ).join(
             Produto, Favorito.produto_id == Produto.id
+        ).outerjoin(
+            ofertas, db.and_(ofertas.c.produto_id == Favorito.produto_id, ofertas.c.posicao == 1)
+        ).outerjoin(
+            Estabelecimento, Estabelecimento.id == ofertas.c.estabelecimento_id
         ).filter(Favorito.usuario_id == usuario_id).all()
         
         resultado = []
-        for favorito, produto in favoritos:
-            # Buscar menor preço do produto
-            menor_preco = db.session.query(Preco, Estabelecimento).join(
-                Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-            ).filter(Preco.produto_id == produto.id).order_by(Preco.preco).first()
-            
+        for favorito, produto, preco, data_coleta, estabelecimento_nome in favoritos:
             item = {
                 'id': favorito.id,
                 'produto': {
@@ -1295,13 +1461,21 @@ def listar_favoritos():
                 'data_criacao': favorito.data_criacao.isoformat()
             }
             
-            if menor_preco:
-                preco, estabelecimento = menor_preco
+            if preco is not None:
                 item['menor_preco'] = {
-                    'preco': float(preco.preco),
-                    'estabelecimento': estabelecimento.nome,
-                    'data_coleta': preco.data_coleta.isoformat()
+                    'preco': float(preco),
+                    'estabelecimento': estabelecimento_nome,
+                    'data_coleta': data_coleta.isoformat()
                 }
+                
+                # Variação desde que o produto foi favoritado
+                if favorito.preco_referencia:
+                    referencia = float(favorito.preco_referencia)
+                    item['variacao_preco'] = {
+                        'preco_referencia': referencia,
+                        'diferenca': round(float(preco) - referencia, 2),
+                        'percentual': round((float(preco) - referencia) / referencia * 100, 1)
+                    }
             
             resultado.append(item)
         
@@ -1333,7 +1507,11 @@ def adicionar_favorito():
         if favorito_existente:
             return jsonify({'error': 'Produto já está nos favoritos'}), 400
         
-        favorito = Favorito(usuario_id=usuario_id, produto_id=produto_id)
+        preco_referencia = db.session.query(func.min(PrecoAtual.preco)).filter(
+            PrecoAtual.produto_id == produto_id
+        ).scalar()
+        
+        favorito = Favorito(usuario_id=usuario_id, produto_id=produto_id, preco_referencia=preco_referencia)
         db.session.add(favorito)
         db.session.commit()
         
@@ -1418,9 +1596,9 @@ def comparar_lista():
             if not produto:
                 continue
                 
-            precos = db.session.query(Preco, Estabelecimento).join(
-                Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-            ).filter(Preco.produto_id == produto_id).order_by(Preco.preco).all()
+            precos = db.session.query(PrecoAtual, Estabelecimento).join(
+                Estabelecimento, PrecoAtual.estabelecimento_id == Estabelecimento.id
+            ).filter(PrecoAtual.produto_id == produto_id).order_by(PrecoAtual.preco).all()
             
             if precos:
                 menor_preco = precos[0][0].preco
@@ -1450,6 +1628,10 @@ def comparar_lista():
         logger.error(f"Erro ao comparar lista: {str(e)}")
         return jsonify({'error': 'Erro interno'}), 500
 
+# Registrado depois das rotas acima para que GET /api/listas (lista padrão
+# baseada nos favoritos, usada pelo menu) continue tendo precedência
+app.register_blueprint(listas_bp)
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
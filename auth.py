@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, session, render_template
 from models import db, Usuario
+from cacheamento import invalidar_tags
 from datetime import datetime
 import re
 
@@ -74,6 +75,7 @@ def registro():
     
     db.session.add(usuario)
     db.session.commit()
+    invalidar_tags('usuarios')
     
     session['user_id'] = usuario.id
     session['user_name'] = usuario.nome
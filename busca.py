@@ -0,0 +1,286 @@
+"""
+Índices de busca em memória para a busca fuzzy
+
+Mantém os textos normalizados (minúsculas, sem acentos) e um índice
+invertido de trigramas, de modo que apenas um subconjunto de candidatos
+passe pelo RapidFuzz em vez da tabela inteira.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict, Counter
+import numpy as np
+from rapidfuzz import fuzz, process
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import db, Produto, Estabelecimento
+from metricas import histograma
+
+
+def normalizar_texto(texto):
+    """Converte para minúsculas, remove acentos e pontuação e colapsa espaços"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'[^\w\s]', ' ', texto.lower())
+    return ' '.join(texto.split())
+
+def gerar_ngramas(texto, n=3):
+    """Gera os n-gramas de cada token, com espaço nas bordas"""
+    ngramas = set()
+    for token in texto.split():
+        token = f' {token} '
+        for i in range(len(token) - n + 1):
+            ngramas.add(token[i:i + n])
+    return ngramas
+
+
+class IndiceProdutos:
+    """Índice residente das descrições de produtos
+
+    Carregado sob demanda na primeira busca e atualizado de forma incremental
+    após cada commit que insere, altera ou exclui um Produto. A recarga
+    periódica cobre alterações feitas por outros processos (workers).
+    """
+
+    def __init__(self, score_minimo=60, max_candidatos=300, intervalo_recarga=600):
+        self.score_minimo = score_minimo
+        self.max_candidatos = max_candidatos
+        self.intervalo_recarga = intervalo_recarga
+        self._lock = threading.RLock()
+        self._descricoes = {}                 # id -> descrição normalizada
+        self._ngramas = {}                    # id -> conjunto de trigramas
+        self._invertido = defaultdict(set)    # trigrama -> ids
+        self._carregado_em = None
+        self._registrar_eventos()
+
+    def carregar(self):
+        """(Re)constrói o índice a partir do banco de dados"""
+        with self._lock:
+            self._descricoes.clear()
+            self._ngramas.clear()
+            self._invertido.clear()
+            linhas = db.session.query(Produto.id, Produto.descricao).yield_per(1000)
+            for produto_id, descricao in linhas:
+                self._adicionar(produto_id, descricao)
+            self._carregado_em = time.monotonic()
+
+    def _garantir_carregado(self):
+        with self._lock:
+            if (self._carregado_em is None or
+                    time.monotonic() - self._carregado_em > self.intervalo_recarga):
+                self.carregar()
+
+    def _adicionar(self, produto_id, descricao):
+        self._remover(produto_id)
+        normalizada = normalizar_texto(descricao)
+        ngramas = gerar_ngramas(normalizada)
+        self._descricoes[produto_id] = normalizada
+        self._ngramas[produto_id] = ngramas
+        for ngrama in ngramas:
+            self._invertido[ngrama].add(produto_id)
+
+    def _remover(self, produto_id):
+        for ngrama in self._ngramas.pop(produto_id, ()):
+            ids = self._invertido.get(ngrama)
+            if ids is not None:
+                ids.discard(produto_id)
+                if not ids:
+                    del self._invertido[ngrama]
+        self._descricoes.pop(produto_id, None)
+
+    def atualizar(self, produto_id, descricao):
+        """Insere ou atualiza um produto no índice"""
+        with self._lock:
+            if self._carregado_em is not None:
+                self._adicionar(produto_id, descricao)
+
+    def remover(self, produto_id):
+        """Remove um produto do índice"""
+        with self._lock:
+            if self._carregado_em is not None:
+                self._remover(produto_id)
+
+    def candidatos(self, termo_normalizado):
+        """Retorna os ids que compartilham mais trigramas com o termo"""
+        contagem = Counter()
+        for ngrama in gerar_ngramas(termo_normalizado):
+            contagem.update(self._invertido.get(ngrama, ()))
+        return [produto_id for produto_id, _ in contagem.most_common(self.max_candidatos)]
+
+    def buscar(self, termo, limite=5):
+        """Busca fuzzy retornando os ids dos produtos mais parecidos com o termo"""
+        termo_normalizado = normalizar_texto(termo)
+        if not termo_normalizado:
+            return []
+
+        self._garantir_carregado()
+        with self._lock:
+            opcoes = {
+                produto_id: self._descricoes[produto_id]
+                for produto_id in self.candidatos(termo_normalizado)
+            }
+
+        if not opcoes:
+            return []
+
+        matches = process.extract(
+            termo_normalizado, opcoes, limit=limite,
+            scorer=fuzz.partial_ratio, score_cutoff=self.score_minimo
+        )
+        return [produto_id for _, _, produto_id in matches]
+
+    def _registrar_eventos(self):
+        """Acumula alterações de Produto na sessão e aplica após o commit"""
+
+        def pendentes(target):
+            session = object_session(target)
+            return session.info.setdefault('indice_produtos', {}) if session else None
+
+        @event.listens_for(Produto, 'after_insert')
+        @event.listens_for(Produto, 'after_update')
+        def produto_salvo(mapper, connection, target):
+            alteracoes = pendentes(target)
+            if alteracoes is not None:
+                alteracoes[target.id] = target.descricao
+
+        @event.listens_for(Produto, 'after_delete')
+        def produto_excluido(mapper, connection, target):
+            alteracoes = pendentes(target)
+            if alteracoes is not None:
+                alteracoes[target.id] = None
+
+        @event.listens_for(Session, 'after_commit')
+        def aplicar(session):
+            for produto_id, descricao in session.info.pop('indice_produtos', {}).items():
+                if descricao is None:
+                    self.remover(produto_id)
+                else:
+                    self.atualizar(produto_id, descricao)
+
+        @event.listens_for(Session, 'after_rollback')
+        def descartar(session):
+            session.info.pop('indice_produtos', None)
+
+
+class MotorBuscaEstabelecimentos:
+    """Busca fuzzy conjunta em nome, bairro e cidade dos estabelecimentos
+
+    Os valores ficam em listas paralelas indexadas por posição e o índice
+    invertido guarda arrays numpy de posições. Os candidatos são escolhidos
+    por sobreposição de trigramas e pontuados numa única chamada a
+    ``process.cdist``. Qualquer commit que altere um Estabelecimento marca
+    o índice para reconstrução na próxima busca.
+    """
+
+    CAMPOS = ('nome', 'bairro', 'cidade')
+
+    def __init__(self, score_minimo=60, max_candidatos=300, intervalo_recarga=600):
+        self.score_minimo = score_minimo
+        self.max_candidatos = max_candidatos
+        self.intervalo_recarga = intervalo_recarga
+        self.histograma = histograma('busca_estabelecimentos')
+        self._lock = threading.RLock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._textos = {campo: [] for campo in self.CAMPOS}
+        self._invertido = {}
+        self._carregado_em = None
+        self._registrar_eventos()
+
+    def carregar(self):
+        """(Re)constrói o armazenamento e o índice a partir do banco de dados"""
+        linhas = db.session.query(
+            Estabelecimento.id, Estabelecimento.nome,
+            Estabelecimento.bairro, Estabelecimento.cidade
+        ).order_by(Estabelecimento.id).all()
+
+        textos = {campo: [] for campo in self.CAMPOS}
+        posicoes = defaultdict(list)
+        for posicao, (_, *valores) in enumerate(linhas):
+            ngramas = set()
+            for campo, valor in zip(self.CAMPOS, valores):
+                normalizado = normalizar_texto(valor)
+                textos[campo].append(normalizado)
+                ngramas |= gerar_ngramas(normalizado)
+            for ngrama in ngramas:
+                posicoes[ngrama].append(posicao)
+
+        with self._lock:
+            self._ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+            self._textos = textos
+            self._invertido = {
+                ngrama: np.asarray(lista, dtype=np.int32) for ngrama, lista in posicoes.items()
+            }
+            self._carregado_em = time.monotonic()
+
+    def invalidar(self):
+        with self._lock:
+            self._carregado_em = None
+
+    def _garantir_carregado(self):
+        with self._lock:
+            if (self._carregado_em is None or
+                    time.monotonic() - self._carregado_em > self.intervalo_recarga):
+                self.carregar()
+
+    def candidatos(self, termo_normalizado):
+        """Posições com maior sobreposição de trigramas com o termo"""
+        listas = [self._invertido[n] for n in gerar_ngramas(termo_normalizado) if n in self._invertido]
+        if not listas:
+            return np.empty(0, dtype=np.int64)
+
+        contagem = np.bincount(np.concatenate(listas), minlength=len(self._ids))
+        posicoes = np.flatnonzero(contagem)
+        if len(posicoes) > self.max_candidatos:
+            melhores = np.argpartition(contagem[posicoes], -self.max_candidatos)[-self.max_candidatos:]
+            posicoes = posicoes[melhores]
+        return posicoes
+
+    def buscar(self, termo, limite=5):
+        """Retorna os ids dos estabelecimentos mais parecidos com o termo"""
+        inicio = time.perf_counter()
+        try:
+            termo_normalizado = normalizar_texto(termo)
+            if not termo_normalizado:
+                return []
+
+            self._garantir_carregado()
+            with self._lock:
+                posicoes = self.candidatos(termo_normalizado)
+                if not len(posicoes):
+                    return []
+                ids = self._ids[posicoes]
+                escolhas = [self._textos[campo][p] for campo in self.CAMPOS for p in posicoes]
+
+            # Uma linha por campo, uma coluna por candidato; vale o melhor campo
+            scores = process.cdist(
+                [termo_normalizado], escolhas, scorer=fuzz.partial_ratio,
+                score_cutoff=self.score_minimo, dtype=np.uint8
+            ).reshape(len(self.CAMPOS), len(posicoes)).max(axis=0)
+
+            ordem = np.argsort(-scores.astype(np.int16), kind='stable')[:limite]
+            return [int(ids[i]) for i in ordem if scores[i] >= self.score_minimo]
+        finally:
+            self.histograma.registrar(time.perf_counter() - inicio)
+
+    def _registrar_eventos(self):
+        """Marca o índice para reconstrução após commits que alteram Estabelecimento"""
+
+        @event.listens_for(Estabelecimento, 'after_insert')
+        @event.listens_for(Estabelecimento, 'after_update')
+        @event.listens_for(Estabelecimento, 'after_delete')
+        def estabelecimento_alterado(mapper, connection, target):
+            session = object_session(target)
+            if session is not None:
+                session.info['indice_estabelecimentos'] = True
+
+        @event.listens_for(Session, 'after_commit')
+        def aplicar(session):
+            if session.info.pop('indice_estabelecimentos', False):
+                self.invalidar()
+
+        @event.listens_for(Session, 'after_rollback')
+        def descartar(session):
+            session.info.pop('indice_estabelecimentos', None)
@@ -0,0 +1,239 @@
+"""
+Cache de respostas com invalidação por tags
+
+Cada resposta em cache guarda as tags dos dados que usou (``produto:<id>``,
+``estabelecimento:<id>``, ``stats``...) junto com a versão de cada tag no
+momento do cálculo. Invalidar uma tag troca sua versão; na leitura, uma
+entrada cujas versões não batem mais com as atuais é tratada como ausente.
+Assim as escritas invalidam exatamente o que mudou e os TTLs podem ser
+longos sem servir dados velhos.
+
+As versões ficam no próprio backend do Flask-Caching, então com um backend
+compartilhado (FileSystemCache) todos os processos enxergam as mesmas
+invalidações. As tags podem ser fixas, formatadas com os argumentos da rota
+(``'produto:{produto_id}'``) ou acrescentadas pela view durante o cálculo
+com ``marcar_tags``.
+
+A chave de cada resposta é a rota mais a query string normalizada e,
+quando a resposta depende de quem pede, o usuário da sessão ou o seu papel.
+Apenas respostas 200 são guardadas.
+
+Requisições simultâneas que não encontram a mesma chave esperam um único
+cálculo. Rotas com ``revalidar`` servem a resposta antiga enquanto uma
+thread em segundo plano a recalcula. Acertos, faltas, respostas antigas e
+cálculos compartilhados são contados em ``metricas`` (``cache.<view>.*``).
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+from flask import request, g, session, make_response, Response, current_app
+from metricas import incrementar
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_TAG = 'tag:'
+PREFIXO_RESPOSTA = 'resposta:'
+PREFIXO_REVALIDACAO = 'revalidando:'
+ESPERA_MAXIMA = 30  # segundos que uma requisição espera o cálculo de outra
+
+
+def marcar_tags(*tags):
+    """Acrescenta tags à resposta sendo calculada (ex.: estabelecimentos listados)"""
+    if 'tags_cache' in g:
+        g.tags_cache.update(tags)
+
+def invalidar_tags(*tags):
+    """Invalida tags pelo cache registrado na aplicação atual (para blueprints)"""
+    current_app.extensions['cache_com_tags'].invalidar(*tags)
+
+def _nova_versao():
+    return uuid.uuid4().hex[:12]
+
+
+class _Calculo:
+    """Cálculo em andamento de uma chave, aguardado pelas requisições concorrentes"""
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.entrada = None
+
+
+class CacheComTags:
+
+    def __init__(self, cache, app=None, papel=None):
+        """``papel()`` devolve o papel do usuário da sessão (ex.: 'admin'), usado por ``por_papel``"""
+        self.cache = cache
+        self.papel = papel
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            app.extensions['cache_com_tags'] = self
+
+    def versoes(self, tags):
+        """Versão atual de cada tag, criando as que ainda não existem"""
+        tags = sorted(tags)
+        chaves = [PREFIXO_TAG + tag for tag in tags]
+        atuais = dict(zip(tags, self.cache.get_many(*chaves))) if tags else {}
+        for tag, versao in atuais.items():
+            if versao is None:
+                # add() só grava se ninguém criou a versão nesse meio tempo
+                self.cache.add(PREFIXO_TAG + tag, _nova_versao(), timeout=0)
+                atuais[tag] = self.cache.get(PREFIXO_TAG + tag)
+        return atuais
+
+    def invalidar(self, *tags):
+        """Invalida todas as respostas marcadas com qualquer uma das tags
+
+        Deve ser chamado depois do commit, para que um recálculo concorrente
+        não grave os dados antigos com a versão nova.
+        """
+        self.cache.set_many({PREFIXO_TAG + tag: _nova_versao() for tag in tags}, timeout=0)
+
+    def _valida(self, entrada):
+        versoes = entrada['versoes']
+        if not versoes:
+            return True
+        atuais = self.cache.get_many(*[PREFIXO_TAG + tag for tag in versoes])
+        return all(atual == versao for atual, versao in zip(atuais, versoes.values()))
+
+    @staticmethod
+    def _resposta(entrada):
+        return Response(entrada['corpo'], status=entrada['status'], headers=entrada['headers'])
+
+    def _calcular(self, chave, f, args, kwargs, tags, validade):
+        """Executa a view e guarda a resposta; retorna (resposta, entrada compartilhável ou None)"""
+        tags_rota = {tag.format(**kwargs) for tag in tags}
+        # Versões lidas antes do cálculo: uma invalidação durante o
+        # cálculo deixa a entrada já nascida inválida
+        versoes = self.versoes(tags_rota)
+        g.tags_cache = set()
+        resposta = make_response(f(*args, **kwargs))
+        versoes.update(self.versoes(g.pop('tags_cache') - tags_rota))
+
+        # Erros, redirecionamentos e negações de acesso nunca são reaproveitados
+        if resposta.status_code != 200 or resposta.is_streamed:
+            return resposta, None
+        entrada = {
+            'versoes': versoes,
+            'criado_em': time.time(),
+            'corpo': resposta.get_data(),
+            'status': resposta.status_code,
+            'headers': list(resposta.headers.items())
+        }
+        self.cache.set(chave, entrada, timeout=validade)
+        return resposta, entrada
+
+    def _calcular_coalescido(self, chave, calcular, nome):
+        """Requisições simultâneas pela mesma chave esperam um único cálculo"""
+        with self._lock:
+            calculo = self._em_andamento.get(chave)
+            lider = calculo is None
+            if lider:
+                calculo = self._em_andamento[chave] = _Calculo()
+
+        if not lider:
+            calculo.pronto.wait(ESPERA_MAXIMA)
+            if calculo.entrada is not None:
+                incrementar(f'cache.{nome}.coalescido')
+                return self._resposta(calculo.entrada)
+            # O cálculo falhou, demorou demais ou não pode ser compartilhado
+            return calcular()[0]
+
+        try:
+            resposta, calculo.entrada = calcular()
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            calculo.pronto.set()
+        return resposta
+
+    def _revalidar_em_segundo_plano(self, chave, calcular, nome):
+        """Recalcula a entrada numa thread, com no máximo uma revalidação por chave"""
+        with self._lock:
+            if chave in self._em_andamento:
+                return
+            calculo = self._em_andamento[chave] = _Calculo()
+
+        def liberar():
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            calculo.pronto.set()
+
+        # Entre processos, a trava fica no próprio backend compartilhado
+        trava = PREFIXO_REVALIDACAO + chave
+        if not self.cache.add(trava, True, timeout=ESPERA_MAXIMA):
+            liberar()
+            return
+
+        app = current_app._get_current_object()
+        environ = dict(request.environ)
+
+        def executar():
+            try:
+                with app.request_context(environ):
+                    calculo.entrada = calcular()[1]
+                incrementar(f'cache.{nome}.revalidacao')
+            except Exception as e:
+                logger.error(f"Erro ao revalidar cache de {nome}: {str(e)}")
+            finally:
+                self.cache.delete(trava)
+                liberar()
+
+        threading.Thread(target=executar, name=f'revalidar-{nome}', daemon=True).start()
+
+    def chave(self, query_string=True, por_usuario=False, por_papel=False):
+        """Chave da requisição atual: rota, query string ordenada e escopo"""
+        partes = [request.path]
+        if query_string:
+            argumentos = sorted(request.args.items(multi=True))
+            partes.append('&'.join(f'{k}={v}' for k, v in argumentos))
+        if por_usuario:
+            partes.append(f"usuario={session.get('user_id')}")
+        if por_papel:
+            partes.append(f'papel={self.papel()}')
+        return PREFIXO_RESPOSTA + hashlib.sha256('|'.join(partes).encode()).hexdigest()
+
+    def cached(self, timeout=None, tags=(), query_string=True, unless=None, por_usuario=False, por_papel=False,
+               revalidar=False, obsoleto_por=3600):
+        """Decorator de cache para views
+
+        ``tags`` podem usar os argumentos da rota: ``'produto:{produto_id}'``.
+        ``por_usuario``/``por_papel`` separam as respostas por usuário da
+        sessão ou por papel, para rotas cujo conteúdo depende de quem pede.
+
+        Com ``revalidar`` (stale-while-revalidate), depois de ``timeout``
+        segundos ou de uma invalidação a resposta antiga continua sendo
+        servida por até ``obsoleto_por`` segundos enquanto uma única thread
+        a recalcula. Indicado para análises caras que toleram dados de alguns
+        segundos atrás.
+        """
+        validade = timeout + obsoleto_por if revalidar else timeout
+
+        def decorador(f):
+            nome = f.__name__
+
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if unless is not None and unless():
+                    return f(*args, **kwargs)
+
+                chave = self.chave(query_string, por_usuario, por_papel)
+                calcular = lambda: self._calcular(chave, f, args, kwargs, tags, validade)
+                entrada = self.cache.get(chave)
+                if entrada is not None:
+                    fresca = not revalidar or time.time() - entrada['criado_em'] < timeout
+                    if fresca and self._valida(entrada):
+                        incrementar(f'cache.{nome}.hit')
+                        return self._resposta(entrada)
+                    if revalidar:
+                        incrementar(f'cache.{nome}.stale')
+                        self._revalidar_em_segundo_plano(chave, calcular, nome)
+                        return self._resposta(entrada)
+
+                incrementar(f'cache.{nome}.miss')
+                return self._calcular_coalescido(chave, calcular, nome)
+            return wrapper
+        return decorador
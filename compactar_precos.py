@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Script para deduplicar o histórico de preços já gravado
+
+Aplica ao histórico a mesma regra da escrita (``PRECOS_JANELA_DEDUP``): em
+cada produto/estabelecimento, coletas seguidas do mesmo preço no mesmo dia
+e dentro da janela viram uma linha só, com ``valido_ate`` na última coleta
+(cada dia com coleta mantém a sua linha). Em bancos antigos, rode antes
+``migrate_valido_ate.py``. No final, preço atual, resumos diários e
+contadores são reconstruídos.
+
+    python compactar_precos.py              # janela da configuração
+    python compactar_precos.py --horas 24
+"""
+import argparse
+from sqlalchemy import select, delete, tuple_
+from app import app, cache
+from models import db, Preco
+from ingestao import repete, estender_validade
+from projecoes import reconstruir_preco_atual, reconstruir_resumos_diarios, reconciliar_contadores
+
+PARES_POR_LOTE = 200  # pares (produto, estabelecimento) por transação
+
+def compactar_pares(pares, janela):
+    """Remove as repetições do histórico dos pares; retorna quantas linhas saíram"""
+    linhas = db.session.execute(
+        select(
+            Preco.id, Preco.produto_id, Preco.estabelecimento_id,
+            Preco.preco, Preco.data_coleta, Preco.valido_ate
+        ).where(
+            tuple_(Preco.produto_id, Preco.estabelecimento_id).in_(pares)
+        ).order_by(Preco.produto_id, Preco.estabelecimento_id, Preco.data_coleta, Preco.id)
+    ).all()
+
+    remover, extensoes = [], {}
+    atual, par_atual = None, None
+    for linha in linhas:
+        par = (linha.produto_id, linha.estabelecimento_id)
+        fim = max(linha.data_coleta, linha.valido_ate or linha.data_coleta)
+        if par == par_atual and repete(atual, linha.preco, linha.data_coleta, janela):
+            remover.append(linha.id)
+            if fim > atual['fim']:
+                atual['fim'] = extensoes[atual['id']] = fim
+        else:
+            atual = {'id': linha.id, 'preco': linha.preco, 'inicio': linha.data_coleta, 'fim': fim}
+            par_atual = par
+
+    for inicio in range(0, len(remover), 500):
+        db.session.execute(
+            delete(Preco).where(Preco.id.in_(remover[inicio:inicio + 500])).execution_options(synchronize_session=False)
+        )
+    estender_validade(extensoes)
+    return len(remover)
+
+def compactar_precos(horas=None):
+    with app.app_context():
+        try:
+            janela = int(horas * 3600) if horas else app.config['PRECOS_JANELA_DEDUP']
+            if not janela:
+                print("Nenhuma janela de deduplicação: informe --horas ou configure PRECOS_JANELA_DEDUP.")
+                return
+
+            pares = db.session.execute(
+                select(Preco.produto_id, Preco.estabelecimento_id).distinct()
+                .order_by(Preco.produto_id, Preco.estabelecimento_id)
+            ).all()
+            print(f"Compactando o histórico de {len(pares)} produtos/estabelecimentos (janela de {janela}s)...")
+
+            removidas = 0
+            for inicio in range(0, len(pares), PARES_POR_LOTE):
+                removidas += compactar_pares([tuple(par) for par in pares[inicio:inicio + PARES_POR_LOTE]], janela)
+                db.session.commit()
+                print(f"   ✅ {min(inicio + PARES_POR_LOTE, len(pares))}/{len(pares)} pares, {removidas} linhas removidas")
+
+            print("Reconstruindo preço atual, resumos diários e contadores...")
+            reconstruir_preco_atual()
+            reconstruir_resumos_diarios()
+            reconciliar_contadores()
+            db.session.commit()
+            cache.clear()
+            print(f"Compactação concluída: {removidas} linhas repetidas removidas")
+
+        except Exception as e:
+            print(f"Erro durante a compactação: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deduplica o histórico de preços')
+    parser.add_argument('--horas', type=float, help='janela de deduplicação (padrão: PRECOS_JANELA_DEDUP)')
+    args = parser.parse_args()
+    compactar_precos(args.horas)
@@ -0,0 +1,137 @@
+"""
+Comparação de preços em lote
+
+Busca os preços atuais (projeção preco_atual) de um conjunto de produtos,
+ou dos itens de uma lista de compras, com um número fixo de consultas,
+evitando uma consulta por produto (N+1).
+"""
+from sqlalchemy import func
+from models import db, PrecoAtual, Estabelecimento, ItemLista
+
+
+def comparar_produtos(produtos, limit_por_produto=None):
+    """Retorna a comparação de preços atuais (do menor para o maior) de cada produto
+
+    Produtos sem preço ficam de fora, como na comparação original. Com
+    ``limit_por_produto`` apenas os N menores preços de cada produto são
+    retornados (ROW_NUMBER particionado por produto).
+    """
+    produtos_por_id = {p.id: p for p in produtos}
+    if not produtos_por_id:
+        return []
+
+    colunas = [
+        PrecoAtual.produto_id.label('produto_id'),
+        PrecoAtual.preco.label('preco'),
+        PrecoAtual.data_coleta.label('data_coleta'),
+        Estabelecimento.id.label('estabelecimento_id'),
+        Estabelecimento.nome.label('nome'),
+        Estabelecimento.bairro.label('bairro'),
+        Estabelecimento.cidade.label('cidade')
+    ]
+    query = db.session.query(*colunas).join(
+        Estabelecimento, PrecoAtual.estabelecimento_id == Estabelecimento.id
+    ).filter(PrecoAtual.produto_id.in_(list(produtos_por_id)))
+
+    if limit_por_produto:
+        posicao = func.row_number().over(
+            partition_by=PrecoAtual.produto_id,
+            order_by=(PrecoAtual.preco, PrecoAtual.estabelecimento_id)
+        ).label('posicao')
+        sub = query.add_columns(posicao).subquery()
+        linhas = db.session.query(sub).filter(
+            sub.c.posicao <= limit_por_produto
+        ).order_by(sub.c.produto_id, sub.c.posicao).all()
+    else:
+        linhas = query.order_by(PrecoAtual.produto_id, PrecoAtual.preco, PrecoAtual.estabelecimento_id).all()
+
+    precos_por_produto = {}
+    for linha in linhas:
+        precos_por_produto.setdefault(linha.produto_id, []).append({
+            'preco': float(linha.preco),
+            'data_coleta': linha.data_coleta.isoformat(),
+            'estabelecimento': {
+                'id': linha.estabelecimento_id,
+                'nome': linha.nome,
+                'bairro': linha.bairro,
+                'cidade': linha.cidade
+            }
+        })
+
+    resultado = []
+    for produto in produtos:
+        precos = precos_por_produto.get(produto.id)
+        if precos:
+            resultado.append({
+                'produto': {
+                    'id': produto.id,
+                    'descricao': produto.descricao,
+                    'ean': produto.ean
+                },
+                'precos': precos
+            })
+    return resultado
+
+def totais_lista_por_estabelecimento(lista_id, limite=None):
+    """Total da cesta em cada estabelecimento, numa única agregação sobre preco_atual
+
+    Retorna (linhas, total_estabelecimentos). As linhas vêm ordenadas pelos
+    estabelecimentos que têm mais itens da lista e, em seguida, pelo menor total.
+    """
+    total = func.sum(PrecoAtual.preco * ItemLista.quantidade).label('total')
+    encontrados = func.count(ItemLista.id).label('itens_encontrados')
+    agregado = db.session.query(
+        PrecoAtual.estabelecimento_id.label('estabelecimento_id'), total, encontrados
+    ).join(
+        PrecoAtual, PrecoAtual.produto_id == ItemLista.produto_id
+    ).filter(
+        ItemLista.lista_id == lista_id
+    ).group_by(PrecoAtual.estabelecimento_id).subquery()
+
+    query = db.session.query(
+        Estabelecimento, agregado.c.total, agregado.c.itens_encontrados
+    ).join(
+        agregado, agregado.c.estabelecimento_id == Estabelecimento.id
+    ).order_by(agregado.c.itens_encontrados.desc(), agregado.c.total, Estabelecimento.id)
+
+    total_estabelecimentos = db.session.query(func.count()).select_from(agregado).scalar()
+    if limite:
+        query = query.limit(limite)
+    return query.all(), total_estabelecimentos
+
+def produtos_por_estabelecimento(lista_id, estabelecimentos_ids):
+    """Conjunto de produtos da lista com preço atual em cada estabelecimento informado"""
+    encontrados = {est_id: set() for est_id in estabelecimentos_ids}
+    if not encontrados:
+        return encontrados
+
+    linhas = db.session.query(PrecoAtual.estabelecimento_id, PrecoAtual.produto_id).join(
+        ItemLista, ItemLista.produto_id == PrecoAtual.produto_id
+    ).filter(
+        ItemLista.lista_id == lista_id,
+        PrecoAtual.estabelecimento_id.in_(list(encontrados))
+    ).all()
+    for est_id, produto_id in linhas:
+        encontrados[est_id].add(produto_id)
+    return encontrados
+
+def menores_precos_lista(lista_id):
+    """Menor preço atual de cada item da lista e o estabelecimento que o pratica"""
+    posicao = func.row_number().over(
+        partition_by=PrecoAtual.produto_id,
+        order_by=(PrecoAtual.preco, PrecoAtual.estabelecimento_id)
+    ).label('posicao')
+    ranking = db.session.query(
+        PrecoAtual.produto_id.label('produto_id'),
+        PrecoAtual.estabelecimento_id.label('estabelecimento_id'),
+        PrecoAtual.preco.label('preco'),
+        posicao
+    ).join(
+        ItemLista, ItemLista.produto_id == PrecoAtual.produto_id
+    ).filter(ItemLista.lista_id == lista_id).subquery()
+
+    return db.session.query(
+        ranking.c.produto_id, ranking.c.preco, Estabelecimento
+    ).join(
+        Estabelecimento, Estabelecimento.id == ranking.c.estabelecimento_id
+    ).filter(ranking.c.posicao == 1).all()
@@ -0,0 +1,242 @@
+"""
+Exportadores de relatórios
+
+Todos os formatos consomem a mesma fonte: ``FonteLinhas``, um iterador
+preguiçoso de dicionários acompanhado da descrição das colunas. Cada
+exportador é um gerador de blocos de bytes que lê as linhas uma a uma; o
+mesmo gerador alimenta a resposta HTTP em streaming e o arquivo gravado pela
+fila de relatórios. Novos formatos são registrados com::
+
+    @registrar_exportador('jsonl', '.jsonl', 'application/x-ndjson')
+    def exportar_jsonl(fonte):
+        for linha in fonte.linhas:
+            yield ...
+"""
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+import xlsxwriter
+from flask import Response, stream_with_context
+from relatorios_pdf import gerar_pdf_paginado
+
+logger = logging.getLogger(__name__)
+
+Exportador = namedtuple('Exportador', 'nome extensao mimetype incremental gerar')
+
+_exportadores = {}
+
+TAMANHO_BLOCO = 64 * 1024  # bytes acumulados antes de enviar/gravar um bloco
+LINHAS_POR_GRUPO = 1000  # linhas por grupo no formato colunar
+
+FORMATOS_EXCEL = {
+    'moeda': {'num_format': '#,##0.00'},
+    'data': {'num_format': 'dd/mm/yyyy hh:mm'}
+}
+LIMITE_LINHAS_EXCEL = 1048575  # 1.048.576 linhas por planilha, menos o cabeçalho
+
+
+class FonteLinhas:
+    """Linhas de um relatório, lidas sob demanda
+
+    ``linhas`` é qualquer iterável de dicionários com as chaves de
+    ``colunas``; os valores mantêm o tipo original (datas, números) e cada
+    formato decide como representá-los. ``contar`` devolve o total de
+    linhas sem percorrê-las, quando a fonte sabe fazer isso.
+    """
+
+    def __init__(self, colunas, linhas, titulo='Relatório', tipos=None, larguras=None, contar=None):
+        self.colunas = list(colunas)
+        self.linhas = linhas
+        self.titulo = titulo
+        self.tipos = tipos or {}
+        self.larguras = larguras
+        self.contar = contar
+
+    @classmethod
+    def de_dicionarios(cls, dados, titulo='Relatório'):
+        """Fonte a partir de uma lista já materializada"""
+        return cls(list(dados[0].keys()) if dados else [], dados, titulo=titulo, contar=lambda: len(dados))
+
+    def total(self):
+        return self.contar() if self.contar else None
+
+
+def registrar_exportador(nome, extensao, mimetype, incremental=True):
+    """Registra um formato: gerar(fonte) produz o arquivo em blocos de bytes
+
+    ``incremental`` indica que os blocos saem à medida que as linhas são
+    lidas; formatos que só existem depois de fechados (xlsx, pdf) não são.
+    """
+    def decorador(gerar):
+        _exportadores[nome] = Exportador(nome, extensao, mimetype, incremental, gerar)
+        return gerar
+    return decorador
+
+def obter_exportador(nome):
+    if nome not in _exportadores:
+        raise ValueError(f'Formato não suportado: {nome}')
+    return _exportadores[nome]
+
+def formatos_disponiveis():
+    return list(_exportadores)
+
+def resposta_streaming(fonte, formato):
+    """Resposta HTTP que envia os blocos à medida que são gerados"""
+    exportador = obter_exportador(formato)
+    return Response(stream_with_context(exportador.gerar(fonte)), mimetype=exportador.mimetype)
+
+def resposta_exportacao(fonte, formato, filename=None):
+    """Como ``resposta_streaming``, mas como arquivo para download"""
+    response = resposta_streaming(fonte, formato)
+    nome = filename or f'relatorio{obter_exportador(formato).extensao}'
+    response.headers['Content-Disposition'] = f'attachment; filename={nome}'
+    return response
+
+def escrever_arquivo(fonte, formato, destino):
+    """Grava o arquivo em ``destino`` bloco a bloco"""
+    with open(destino, 'wb') as arquivo:
+        for bloco in obter_exportador(formato).gerar(fonte):
+            arquivo.write(bloco)
+
+
+def _texto(valor):
+    """Representação textual usada em CSV"""
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    return valor
+
+def _json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+def _ler_em_blocos(caminho):
+    """Envia um arquivo temporário em blocos e o remove ao final"""
+    try:
+        with open(caminho, 'rb') as arquivo:
+            while True:
+                bloco = arquivo.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        os.remove(caminho)
+
+def _arquivo_temporario(sufixo):
+    descritor, caminho = tempfile.mkstemp(suffix=sufixo)
+    os.close(descritor)
+    return caminho
+
+
+@registrar_exportador('csv', '.csv', 'text/csv')
+def exportar_csv(fonte):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fonte.colunas)
+    writer.writeheader()
+    for linha in fonte.linhas:
+        writer.writerow({coluna: _texto(linha[coluna]) for coluna in fonte.colunas})
+        if output.tell() >= TAMANHO_BLOCO:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate(0)
+    yield output.getvalue().encode('utf-8')
+
+@registrar_exportador('jsonl', '.jsonl', 'application/x-ndjson')
+def exportar_jsonl(fonte):
+    buffer = []
+    tamanho = 0
+    for linha in fonte.linhas:
+        texto = json.dumps({coluna: linha[coluna] for coluna in fonte.colunas},
+                           ensure_ascii=False, default=_json) + '\n'
+        buffer.append(texto)
+        tamanho += len(texto)
+        if tamanho >= TAMANHO_BLOCO:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            tamanho = 0
+    yield ''.join(buffer).encode('utf-8')
+
+@registrar_exportador('colunar', '.colunar.jsonl', 'application/x-ndjson')
+def exportar_colunar(fonte):
+    """Formato colunar em grupos de linhas, no estilo dos row groups do Parquet
+
+    A primeira linha descreve o esquema; cada linha seguinte é um grupo de
+    até LINHAS_POR_GRUPO linhas, com um vetor de valores por coluna.
+    """
+    esquema = {'colunas': fonte.colunas, 'tipos': fonte.tipos}
+    yield (json.dumps(esquema, ensure_ascii=False) + '\n').encode('utf-8')
+
+    grupo = {coluna: [] for coluna in fonte.colunas}
+    quantidade = 0
+    for linha in fonte.linhas:
+        for coluna in fonte.colunas:
+            grupo[coluna].append(linha[coluna])
+        quantidade += 1
+        if quantidade == LINHAS_POR_GRUPO:
+            yield (json.dumps({'linhas': quantidade, 'colunas': grupo},
+                              ensure_ascii=False, default=_json) + '\n').encode('utf-8')
+            grupo = {coluna: [] for coluna in fonte.colunas}
+            quantidade = 0
+    if quantidade:
+        yield (json.dumps({'linhas': quantidade, 'colunas': grupo},
+                          ensure_ascii=False, default=_json) + '\n').encode('utf-8')
+
+@registrar_exportador('excel', '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', incremental=False)
+def exportar_excel(fonte):
+    """Planilha em modo constant_memory; o arquivo só é enviado depois de fechado
+
+    ``fonte.tipos`` mapeia colunas para 'moeda' ou 'data'; nas demais o tipo
+    da célula segue o valor (número, data ou texto).
+    """
+    caminho = _arquivo_temporario('.xlsx')
+    try:
+        workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        worksheet = workbook.add_worksheet()
+        formatos = {nome: workbook.add_format(props) for nome, props in FORMATOS_EXCEL.items()}
+        formato_cabecalho = workbook.add_format({'bold': True})
+        formatos_colunas = [formatos.get(fonte.tipos.get(coluna)) for coluna in fonte.colunas]
+
+        for col, coluna in enumerate(fonte.colunas):
+            worksheet.write_string(0, col, coluna, formato_cabecalho)
+            if fonte.tipos.get(coluna) == 'data':
+                worksheet.set_column(col, col, 16)
+
+        for row, item in enumerate(fonte.linhas, 1):
+            if row > LIMITE_LINHAS_EXCEL:
+                logger.warning(f"Exportação Excel truncada em {LIMITE_LINHAS_EXCEL} linhas")
+                break
+            for col, coluna in enumerate(fonte.colunas):
+                valor = item[coluna]
+                formato = formatos_colunas[col]
+                if valor is None or valor == '':
+                    worksheet.write_blank(row, col, None, formato)
+                elif isinstance(valor, datetime):
+                    worksheet.write_datetime(row, col, valor, formato or formatos['data'])
+                elif isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+                    worksheet.write_number(row, col, valor, formato)
+                else:
+                    worksheet.write_string(row, col, str(valor), formato)
+
+        workbook.close()
+    except Exception:
+        os.remove(caminho)
+        raise
+    yield from _ler_em_blocos(caminho)
+
+@registrar_exportador('pdf', '.pdf', 'application/pdf', incremental=False)
+def exportar_pdf(fonte):
+    caminho = _arquivo_temporario('.pdf')
+    try:
+        gerar_pdf_paginado(fonte.linhas, fonte.colunas, fonte.titulo, caminho, larguras=fonte.larguras)
+    except Exception:
+        os.remove(caminho)
+        raise
+    yield from _ler_em_blocos(caminho)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Script para importar preços de um arquivo CSV (ex.: exportação de NFC-e)
+
+Colunas reconhecidas (cabeçalho obrigatório):
+    ean, descricao          - produto, cadastrado se o EAN ainda não existir
+    cnpj, nome, bairro, cidade - estabelecimento, cadastrado se o CNPJ ainda não existir
+    preco                   - aceita vírgula decimal (7,99 ou 1.234,56)
+    data_coleta             - opcional, ISO 8601
+    produto_id, estabelecimento_id - opcionais, no lugar de ean/cnpj
+
+O arquivo é lido em streaming e processado em três estágios ligados por
+filas limitadas (o leitor para quando os validadores ou o gravador ficam
+para trás):
+
+    leitor (thread) -> validação (pool de processos) -> gravador (este processo)
+
+A conversão e a validação das linhas, a parte cara em Python, rodam em
+paralelo; só o processo principal abre conexões com o SQLite e grava, em
+lotes, cada um numa transação, na ordem do arquivo. Depois de cada lote o
+progresso vai para ``<arquivo>.checkpoint``; rodar o script de novo retoma
+do último lote gravado. Linhas rejeitadas vão para
+``<arquivo>.rejeitados.csv``.
+
+Com ``--adiar-projecoes`` o gravador só insere os preços e o preço atual e
+os resumos diários são reconstruídos uma vez no final, o que acelera cargas
+grandes (até lá, as estatísticas não refletem a importação). Nesse modo a
+deduplicação (``PRECOS_JANELA_DEDUP``) não é aplicada na escrita; rode
+``compactar_precos.py`` depois, se necessário.
+
+    python importar_precos.py precos.csv
+    python importar_precos.py precos.csv --lote 20000 --delimitador ';' --processos 4
+    python importar_precos.py precos.csv --reiniciar   # ignora o checkpoint
+    python importar_precos.py precos.csv --adiar-projecoes
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import event, text
+from models import db
+from ingestao import validar_itens, gravar_lote
+from projecoes import reconstruir_preco_atual, reconstruir_resumos_diarios
+
+TAMANHO_LOTE = 5000  # registros por transação
+REGISTROS_POR_TAREFA = 1000  # registros validados por tarefa do pool
+TAREFAS_POR_PROCESSO = 4  # tarefas em andamento ou prontas por processo, antes de o leitor esperar
+
+# Ajustes de carga para as conexões do importador: WAL permite leituras da
+# aplicação durante a importação e synchronous=NORMAL é seguro com WAL
+PRAGMAS_CARGA = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-262144',  # 256 MB
+    'PRAGMA temp_store=MEMORY',
+)
+
+def aplicar_pragmas(conexao_dbapi, _registro):
+    cursor = conexao_dbapi.cursor()
+    for pragma in PRAGMAS_CARGA:
+        cursor.execute(pragma)
+    cursor.close()
+
+def numero_decimal(valor):
+    """'1.234,56' -> '1234.56'; valores com ponto decimal passam inalterados"""
+    valor = valor.strip()
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    return valor
+
+def normalizar_registro(registro):
+    """Remove campos vazios e normaliza o preço de uma linha do CSV"""
+    item = {chave.strip().lower(): valor.strip() for chave, valor in registro.items()
+            if chave and valor and valor.strip()}
+    if 'preco' in item:
+        item['preco'] = numero_decimal(item['preco'])
+    return item
+
+def identificar_arquivo(caminho):
+    estado = os.stat(caminho)
+    return {'arquivo': os.path.abspath(caminho), 'tamanho': estado.st_size, 'modificado': estado.st_mtime}
+
+def ler_checkpoint(caminho, identificacao):
+    """Registros já importados deste mesmo arquivo (0 sem checkpoint)"""
+    if not os.path.exists(caminho):
+        return 0
+    with open(caminho) as arquivo:
+        checkpoint = json.load(arquivo)
+    if any(checkpoint.get(chave) != valor for chave, valor in identificacao.items()):
+        raise SystemExit(f"O checkpoint {caminho} é de outra versão do arquivo. Use --reiniciar para importar do início.")
+    return checkpoint['registros']
+
+def gravar_checkpoint(caminho, identificacao, registros):
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w') as arquivo:
+        json.dump(dict(identificacao, registros=registros), arquivo)
+    os.replace(temporario, caminho)
+
+def preparar_registros(cabecalho, linhas, inicio):
+    """Roda nos processos do pool: monta, normaliza e valida os registros"""
+    itens = [normalizar_registro(dict(zip(cabecalho, linha))) for linha in linhas]
+    validas, erros = validar_itens(itens, inicio)
+    return inicio, len(linhas), validas, erros
+
+def _enfileirar(fila, item, parar):
+    """put() que desiste se o gravador tiver parado"""
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def ler_em_tarefas(caminho, delimitador, pular, executor, fila, parar):
+    """Leitor: envia blocos de registros ao pool e enfileira os futuros, na ordem do arquivo
+
+    Termina com None na fila, ou com a exceção que interrompeu a leitura.
+    """
+    try:
+        with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+            leitor = csv.reader(arquivo, delimiter=delimitador)
+            cabecalho = next(leitor, [])
+            linhas = []
+            inicio = pular + 1
+            for numero, linha in enumerate(leitor, 1):
+                if numero <= pular:
+                    continue
+                linhas.append(linha)
+                if len(linhas) == REGISTROS_POR_TAREFA:
+                    if not _enfileirar(fila, executor.submit(preparar_registros, cabecalho, linhas, inicio), parar):
+                        return
+                    inicio += len(linhas)
+                    linhas = []
+            if linhas and not _enfileirar(fila, executor.submit(preparar_registros, cabecalho, linhas, inicio), parar):
+                return
+        _enfileirar(fila, None, parar)
+    except Exception as e:
+        _enfileirar(fila, e, parar)
+
+def importar_precos(caminho, tamanho=TAMANHO_LOTE, delimitador=',', reiniciar=False, processos=None,
+                    adiar_projecoes=False):
+    # Importado aqui para que os processos de validação (spawn), que reimportam
+    # este módulo, não carreguem a aplicação Flask inteira
+    from app import app, cache
+
+    arquivo_checkpoint = f'{caminho}.checkpoint'
+    arquivo_rejeitados = f'{caminho}.rejeitados.csv'
+    identificacao = identificar_arquivo(caminho)
+    if reiniciar and os.path.exists(arquivo_checkpoint):
+        os.remove(arquivo_checkpoint)
+    pular = ler_checkpoint(arquivo_checkpoint, identificacao)
+    processos = processos or max(1, (os.cpu_count() or 2) - 1)
+
+    with app.app_context():
+        db.create_all()
+        # Conexões novas já nascem com os PRAGMAs de carga
+        event.listen(db.engine, 'connect', aplicar_pragmas)
+        db.engine.dispose()
+
+        if pular:
+            print(f"Retomando após {pular} registros já importados...")
+        print(f"Validando com {processos} processo(s), gravando em lotes de {tamanho} registros")
+
+        janela = app.config['PRECOS_JANELA_DEDUP']
+        if janela and adiar_projecoes:
+            print("Deduplicação desligada com --adiar-projecoes; use compactar_precos.py depois da carga")
+
+        totais = {'registros': 0, 'inseridos': 0, 'confirmados': 0, 'rejeitados': 0}
+        inicio_importacao = time.perf_counter()
+        fila = queue.Queue(maxsize=processos * TAREFAS_POR_PROCESSO)
+        parar = threading.Event()
+        executor = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('spawn'))
+        leitor = threading.Thread(
+            target=ler_em_tarefas, args=(caminho, delimitador, pular, executor, fila, parar), daemon=True
+        )
+
+        with open(arquivo_rejeitados, 'a' if pular else 'w', newline='', encoding='utf-8') as rejeitados:
+            escritor = csv.writer(rejeitados)
+            if not pular:
+                escritor.writerow(['registro', 'erro'])
+
+            def gravar(validas, erros, ultimo, registros):
+                inicio_lote = time.perf_counter()
+                inseridos, confirmados, erros, _ = gravar_lote(
+                    validas, erros, cadastrar=True, projecoes=not adiar_projecoes, janela=janela
+                )
+                db.session.commit()
+
+                escritor.writerows([erro['linha'], erro['erro']] for erro in erros)
+                rejeitados.flush()
+                gravar_checkpoint(arquivo_checkpoint, identificacao, ultimo)
+
+                totais['registros'] += registros
+                totais['inseridos'] += inseridos
+                totais['confirmados'] += confirmados
+                totais['rejeitados'] += len(erros)
+                decorrido = time.perf_counter() - inicio_importacao
+                print(f"   ✅ {ultimo} registros: +{inseridos} inseridos, {confirmados} confirmados, {len(erros)} rejeitados "
+                      f"(gravação: {registros / (time.perf_counter() - inicio_lote):.0f} linhas/s, "
+                      f"total: {totais['registros'] / decorrido:.0f} linhas/s)")
+
+            # Gravador: consome os resultados na ordem do arquivo e grava a cada ``tamanho`` registros
+            validas, erros, registros, ultimo = [], [], 0, pular
+            leitor.start()
+            try:
+                while True:
+                    tarefa = fila.get()
+                    if tarefa is None:
+                        break
+                    if isinstance(tarefa, Exception):
+                        raise tarefa
+                    inicio, quantidade, validas_tarefa, erros_tarefa = tarefa.result()
+                    validas.extend(validas_tarefa)
+                    erros.extend(erros_tarefa)
+                    registros += quantidade
+                    ultimo = inicio + quantidade - 1
+                    if registros >= tamanho:
+                        gravar(validas, erros, ultimo, registros)
+                        validas, erros, registros = [], [], 0
+                if registros:
+                    gravar(validas, erros, ultimo, registros)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro no lote que termina no registro {ultimo}: {e}")
+                print("Corrija o problema e rode o script de novo para retomar do último lote gravado.")
+                falhou = True
+            else:
+                falhou = False
+            finally:
+                parar.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+                leitor.join()
+
+        if falhou:
+            # Sem reconstrução nem resumo: a importação fica para a próxima execução
+            sys.exit(1)
+
+        if adiar_projecoes:
+            # Também cobre lotes gravados por execuções anteriores interrompidas
+            print("Reconstruindo preço atual e resumos diários...")
+            reconstruir_preco_atual()
+            reconstruir_resumos_diarios()
+            db.session.commit()
+
+        # Respostas em cache de todas as rotas podem ter mudado
+        cache.clear()
+
+        decorrido = time.perf_counter() - inicio_importacao
+        print(f"Importação: {totais['registros']} registros em {decorrido:.1f}s "
+              f"({totais['registros'] / decorrido if decorrido else 0:.0f} linhas/s)")
+        print(f"Inseridos: {totais['inseridos']} | Confirmados: {totais['confirmados']} | Rejeitados: {totais['rejeitados']}"
+              + (f" (detalhes em {arquivo_rejeitados})" if totais['rejeitados'] else ''))
+        db.session.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa preços de um arquivo CSV')
+    parser.add_argument('arquivo')
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='registros por transação')
+    parser.add_argument('--delimitador', default=',')
+    parser.add_argument('--processos', type=int, help='processos de validação (padrão: núcleos - 1)')
+    parser.add_argument('--reiniciar', action='store_true', help='ignora o checkpoint e importa do início')
+    parser.add_argument('--adiar-projecoes', action='store_true',
+                        help='reconstrói preço atual e resumos só no final')
+    args = parser.parse_args()
+    importar_precos(args.arquivo, args.lote, args.delimitador, args.reiniciar, args.processos,
+                    args.adiar_projecoes)
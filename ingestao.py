@@ -0,0 +1,378 @@
+"""
+Ingestão de preços em lote
+
+Usado por ``POST /precos/lote`` e pelo importador de arquivos
+(``importar_precos.py``): as linhas são validadas por coluna, sobre o lote
+inteiro, antes de qualquer acesso ao banco, produtos e estabelecimentos
+são resolvidos com uma consulta por lote (por id, EAN ou CNPJ) e os preços
+válidos entram com um único executemany, atualizando as projeções na mesma
+transação. Uma linha inválida vira um erro com o seu número e não impede
+as demais.
+
+O importador também cadastra os produtos (por EAN) e estabelecimentos (por
+CNPJ) que ainda não existem, com os dados de cadastro da própria linha.
+
+Deduplicação (``janela`` em segundos, 0 desliga): um preço igual ao último
+gravado para o mesmo produto/estabelecimento, coletado no mesmo dia e até
+``janela`` segundos depois da última confirmação, não gera uma linha nova;
+apenas estende o ``valido_ate`` da linha existente. Assim cada dia com
+coleta continua tendo ao menos uma linha por produto/estabelecimento.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import select, insert, update, tuple_
+from models import db, Produto, Estabelecimento, Preco, PrecoAtual
+from projecoes import atualizar_preco_atual, atualizar_resumos_diarios, ajustar_contador, TAMANHO_LOTE
+
+LIMITE_LOTE = 10000  # preços por requisição
+PRECO_MAXIMO = 99999999.99  # Numeric(10, 2)
+CAMPOS_CADASTRO = ('descricao', 'nome', 'bairro', 'cidade')
+NAO_DIGITOS = re.compile(r'\D')
+
+
+class LinhaInvalida(ValueError):
+    """Erro de validação de uma linha do lote"""
+
+
+def _rejeitar(erros, mascara, mensagem):
+    """Registra a mensagem nas linhas da máscara que ainda não tinham erro"""
+    erros[mascara & (erros == '')] = mensagem
+
+def _identificadores(valores):
+    """(presentes, válidos, ids) de uma coluna de ids: inteiros positivos, em número ou texto"""
+    presentes = np.array([valor is not None for valor in valores], dtype=bool)
+    if all(type(valor) is int for valor in valores) and all(-2 ** 63 < valor < 2 ** 63 for valor in valores):
+        # Lotes JSON: a coluna inteira já é de inteiros
+        ids = np.array(valores, dtype=np.int64)
+        return presentes, ids > 0, ids
+    textos = np.char.strip(np.array([str(valor) for valor in valores], dtype=str))
+    # Só dígitos ASCII e no máximo 18, para caber em int64
+    tamanhos = np.char.str_len(textos)
+    validos = (presentes & (tamanhos > 0) & (tamanhos <= 18)
+               & (np.char.str_len(np.char.strip(textos, '0123456789')) == 0))
+    ids = np.zeros(len(valores), dtype=np.int64)
+    ids[validos] = textos[validos].astype(np.int64)
+    return presentes, validos & (ids > 0), ids
+
+def _documentos(valores, tamanho):
+    """(presentes, válidos, dígitos) de uma coluna de EANs ou CNPJs"""
+    presentes = np.array([bool(valor) for valor in valores], dtype=bool)
+    digitos = np.array([NAO_DIGITOS.sub('', str(valor)) if valor else '' for valor in valores], dtype=str)
+    return presentes, np.char.str_len(digitos) == tamanho, digitos
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _precos(valores):
+    """(presentes, numéricos, preços) de uma coluna de preços"""
+    presentes = np.array([valor is not None and valor != '' for valor in valores], dtype=bool)
+    precos = np.full(len(valores), np.nan)
+    informados = [valor for valor, presente in zip(valores, presentes) if presente]
+    try:
+        precos[presentes] = np.array(informados, dtype=float)
+        numericos = presentes
+    except (TypeError, ValueError):
+        # Alguma linha não é numérica: converte uma a uma para saber qual
+        convertidos = [_numero(valor) if presente else None for valor, presente in zip(valores, presentes)]
+        numericos = np.array([valor is not None for valor in convertidos], dtype=bool)
+        precos[numericos] = [valor for valor in convertidos if valor is not None]
+    return presentes, numericos, precos
+
+def _data_coleta(valor):
+    """Data ISO 8601; com fuso, é convertida para UTC como as demais datas do banco"""
+    try:
+        data = datetime.fromisoformat(str(valor))
+    except ValueError:
+        raise LinhaInvalida('data_coleta deve estar no formato ISO 8601')
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+def validar_itens(itens, inicio=1):
+    """Valida os itens sem acessar o banco; retorna (válidas, erros)
+
+    A validação é feita por coluna, sobre o lote inteiro: cada campo é
+    extraído uma vez e as regras de ids, EAN/CNPJ e preço são aplicadas com
+    operações do numpy. Cada linha recebe o primeiro erro encontrado.
+
+    O produto vem por ``produto_id`` ou ``ean`` e o estabelecimento por
+    ``estabelecimento_id`` ou ``cnpj``; ``data_coleta`` é opcional. Os campos
+    de cadastro (descrição do produto, nome/bairro/cidade do estabelecimento)
+    são repassados para ``cadastrar_faltantes``.
+
+    ``válidas`` são pares (número da linha, linha normalizada). Recebe e
+    devolve apenas dados simples, então pode rodar em outro processo.
+    """
+    objetos = np.array([isinstance(item, dict) for item in itens], dtype=bool)
+    registros = [item if isinstance(item, dict) else {} for item in itens]
+    coluna = lambda campo: [registro.get(campo) for registro in registros]
+    erros = np.full(len(itens), '', dtype=object)
+    _rejeitar(erros, ~objetos, 'Registro deve ser um objeto JSON')
+
+    por_id, produto_id_valido, produto_ids = _identificadores(coluna('produto_id'))
+    por_ean, ean_valido, eans = _documentos(coluna('ean'), 13)
+    _rejeitar(erros, por_id & ~produto_id_valido, 'produto_id inválido')
+    _rejeitar(erros, ~por_id & por_ean & ~ean_valido, 'EAN deve ter 13 dígitos')
+    _rejeitar(erros, ~por_id & ~por_ean, 'Informe produto_id ou ean')
+
+    por_id_estabelecimento, estabelecimento_id_valido, estabelecimento_ids = _identificadores(coluna('estabelecimento_id'))
+    por_cnpj, cnpj_valido, cnpjs = _documentos(coluna('cnpj'), 14)
+    _rejeitar(erros, por_id_estabelecimento & ~estabelecimento_id_valido, 'estabelecimento_id inválido')
+    _rejeitar(erros, ~por_id_estabelecimento & por_cnpj & ~cnpj_valido, 'CNPJ deve ter 14 dígitos')
+    _rejeitar(erros, ~por_id_estabelecimento & ~por_cnpj, 'Informe estabelecimento_id ou cnpj')
+
+    com_preco, numericos, precos = _precos(coluna('preco'))
+    _rejeitar(erros, ~com_preco, 'Preço é obrigatório')
+    _rejeitar(erros, ~numericos, 'Preço deve ser um número válido')
+    with np.errstate(invalid='ignore'):
+        _rejeitar(erros, ~np.isfinite(precos) | ~(precos > 0), 'Preço deve ser maior que zero')
+        _rejeitar(erros, precos > PRECO_MAXIMO, 'Preço acima do limite')
+    precos = np.round(precos, 2)
+
+    # Datas não têm forma vetorizada (fusos ISO 8601); só as linhas ainda válidas são convertidas
+    datas = [None] * len(itens)
+    for indice in np.flatnonzero(erros == ''):
+        valor = registros[indice].get('data_coleta')
+        if valor:
+            try:
+                datas[indice] = _data_coleta(valor)
+            except LinhaInvalida as e:
+                erros[indice] = str(e)
+
+    # Só a montagem das linhas válidas volta a ser por linha, sobre listas Python
+    validas = []
+    por_id, produto_ids, eans = por_id.tolist(), produto_ids.tolist(), eans.tolist()
+    por_id_estabelecimento, estabelecimento_ids, cnpjs = (
+        por_id_estabelecimento.tolist(), estabelecimento_ids.tolist(), cnpjs.tolist()
+    )
+    precos = precos.tolist()
+    for indice in np.flatnonzero(erros == '').tolist():
+        registro = registros[indice]
+        linha = {
+            'produto_id': produto_ids[indice] if por_id[indice] else None,
+            'ean': None if por_id[indice] else eans[indice],
+            'estabelecimento_id': estabelecimento_ids[indice] if por_id_estabelecimento[indice] else None,
+            'cnpj': None if por_id_estabelecimento[indice] else cnpjs[indice],
+            'preco': precos[indice],
+            'data_coleta': datas[indice]
+        }
+        for campo in CAMPOS_CADASTRO:
+            if registro.get(campo):
+                linha[campo] = str(registro[campo]).strip()
+        validas.append((indice + inicio, linha))
+
+    erros = [{'linha': int(indice) + inicio, 'erro': erros[indice]} for indice in np.flatnonzero(erros != '')]
+    return validas, erros
+
+def _mapear(coluna, valores, modelo):
+    """{valor: id} para os valores da coluna, em consultas de TAMANHO_LOTE
+
+    Havendo repetidos (EANs e CNPJs não são únicos), fica o menor id.
+    """
+    valores = sorted(valores)
+    mapa = {}
+    for inicio in range(0, len(valores), TAMANHO_LOTE):
+        mapa.update(db.session.execute(
+            select(coluna, modelo.id).where(coluna.in_(valores[inicio:inicio + TAMANHO_LOTE])).order_by(modelo.id.desc())
+        ).all())
+    return mapa
+
+def cadastrar_faltantes(linhas):
+    """Cadastra os produtos (por EAN) e estabelecimentos (por CNPJ) ainda inexistentes
+
+    Só entram os que trazem os dados obrigatórios na linha (descrição; nome,
+    bairro e cidade); as demais linhas falham depois como não encontradas.
+    Retorna (produtos criados, estabelecimentos criados).
+    """
+    eans = {l['ean'] for _, l in linhas if l['ean']}
+    cnpjs = {l['cnpj'] for _, l in linhas if l['cnpj']}
+    eans -= _mapear(Produto.ean, eans, Produto).keys()
+    cnpjs -= _mapear(Estabelecimento.cnpj, cnpjs, Estabelecimento).keys()
+
+    produtos, estabelecimentos = {}, {}
+    for _, linha in linhas:
+        if linha['ean'] in eans and linha['ean'] not in produtos and linha.get('descricao'):
+            produtos[linha['ean']] = {'ean': linha['ean'], 'descricao': linha['descricao'][:200]}
+        if (linha['cnpj'] in cnpjs and linha['cnpj'] not in estabelecimentos
+                and all(linha.get(campo) for campo in ('nome', 'bairro', 'cidade'))):
+            estabelecimentos[linha['cnpj']] = {
+                'cnpj': linha['cnpj'], 'nome': linha['nome'][:100],
+                'bairro': linha['bairro'][:100], 'cidade': linha['cidade'][:100]
+            }
+
+    if produtos:
+        db.session.execute(insert(Produto), list(produtos.values()))
+        ajustar_contador('produtos', len(produtos))
+    if estabelecimentos:
+        db.session.execute(insert(Estabelecimento), list(estabelecimentos.values()))
+        ajustar_contador('estabelecimentos', len(estabelecimentos))
+    return len(produtos), len(estabelecimentos)
+
+def resolver_referencias(linhas):
+    """Troca EAN/CNPJ por ids e confere os ids informados; retorna (resolvidas, erros)"""
+    produtos_por_id = _mapear(Produto.id, {l['produto_id'] for _, l in linhas if l['produto_id']}, Produto)
+    produtos_por_ean = _mapear(Produto.ean, {l['ean'] for _, l in linhas if l['ean']}, Produto)
+    estabelecimentos_por_id = _mapear(
+        Estabelecimento.id, {l['estabelecimento_id'] for _, l in linhas if l['estabelecimento_id']}, Estabelecimento
+    )
+    estabelecimentos_por_cnpj = _mapear(
+        Estabelecimento.cnpj, {l['cnpj'] for _, l in linhas if l['cnpj']}, Estabelecimento
+    )
+
+    resolvidas, erros = [], []
+    for numero, linha in linhas:
+        produto_id = (produtos_por_id.get(linha['produto_id']) if linha['produto_id']
+                      else produtos_por_ean.get(linha['ean']))
+        estabelecimento_id = (estabelecimentos_por_id.get(linha['estabelecimento_id']) if linha['estabelecimento_id']
+                              else estabelecimentos_por_cnpj.get(linha['cnpj']))
+        if produto_id is None:
+            erros.append({'linha': numero, 'erro': 'Produto não encontrado'})
+        elif estabelecimento_id is None:
+            erros.append({'linha': numero, 'erro': 'Estabelecimento não encontrado'})
+        else:
+            resolvidas.append(dict(linha, produto_id=produto_id, estabelecimento_id=estabelecimento_id))
+    return resolvidas, erros
+
+def repete(anterior, preco, data_coleta, janela):
+    """O preço coletado em ``data_coleta`` apenas confirma a observação ``anterior``?
+
+    ``anterior`` tem preco, inicio (data_coleta) e fim (último valido_ate).
+    Só confirma dentro do dia da coleta: no dia seguinte o preço ganha uma
+    linha nova, para que os resumos diários e os filtros por data enxerguem
+    todo dia em que ele foi observado.
+    """
+    return (round(float(anterior['preco']), 2) == round(float(preco), 2)
+            and anterior['inicio'] <= data_coleta
+            and data_coleta.date() == anterior['inicio'].date()
+            and data_coleta - anterior['fim'] <= timedelta(seconds=janela))
+
+def _ultimas_observacoes(pares):
+    """{(produto_id, estabelecimento_id): {id, preco, inicio, fim}} da linha atual de cada par"""
+    pares = sorted(pares)
+    ultimas = {}
+    for inicio in range(0, len(pares), TAMANHO_LOTE):
+        for produto_id, estabelecimento_id, preco_id, preco, data_coleta, valido_ate in db.session.execute(
+            select(
+                PrecoAtual.produto_id, PrecoAtual.estabelecimento_id, Preco.id,
+                Preco.preco, Preco.data_coleta, Preco.valido_ate
+            ).join(Preco, Preco.id == PrecoAtual.preco_id).where(
+                tuple_(PrecoAtual.produto_id, PrecoAtual.estabelecimento_id).in_(pares[inicio:inicio + TAMANHO_LOTE])
+            )
+        ):
+            ultimas[(produto_id, estabelecimento_id)] = {
+                'id': preco_id, 'preco': preco, 'inicio': data_coleta, 'fim': max(data_coleta, valido_ate or data_coleta)
+            }
+    return ultimas
+
+def separar_repetidos(registros, janela):
+    """Separa os registros novos das confirmações de preços já gravados
+
+    Retorna (novos, extensões), com extensões = {preco_id: novo valido_ate}.
+    Repetições dentro do próprio lote estendem o ``valido_ate`` do registro
+    novo correspondente. Usa o preço atual (``preco_atual``) de cada par.
+    """
+    ultimas = _ultimas_observacoes({(r['produto_id'], r['estabelecimento_id']) for r in registros})
+    novos, extensoes = [], {}
+    for registro in sorted(registros, key=lambda r: (r['produto_id'], r['estabelecimento_id'], r['data_coleta'])):
+        par = (registro['produto_id'], registro['estabelecimento_id'])
+        ultima = ultimas.get(par)
+        if ultima and repete(ultima, registro['preco'], registro['data_coleta'], janela):
+            if registro['data_coleta'] > ultima['fim']:
+                ultima['fim'] = registro['data_coleta']
+                if 'registro' in ultima:
+                    ultima['registro']['valido_ate'] = ultima['fim']
+                else:
+                    extensoes[ultima['id']] = ultima['fim']
+        elif not ultima or registro['data_coleta'] >= ultima['fim']:
+            novos.append(registro)
+            ultimas[par] = {
+                'registro': registro, 'preco': registro['preco'],
+                'inicio': registro['data_coleta'], 'fim': registro['data_coleta']
+            }
+        else:
+            # Coleta mais antiga que a última observação: entra no histórico como está
+            novos.append(registro)
+    return novos, extensoes
+
+def estender_validade(extensoes):
+    if extensoes:
+        db.session.execute(update(Preco), [
+            {'id': preco_id, 'valido_ate': valido_ate} for preco_id, valido_ate in extensoes.items()
+        ])
+
+def confirmar_repetido(produto_id, estabelecimento_id, preco, data_coleta, janela):
+    """Versão de ``separar_repetidos`` para um preço só
+
+    Se o preço apenas confirma a linha atual do par, estende o valido_ate
+    dela e retorna o seu id; senão retorna None.
+    """
+    par = (produto_id, estabelecimento_id)
+    ultima = _ultimas_observacoes([par]).get(par)
+    if not ultima or not repete(ultima, preco, data_coleta, janela):
+        return None
+    if data_coleta > ultima['fim']:
+        estender_validade({ultima['id']: data_coleta})
+    return ultima['id']
+
+def inserir_precos(linhas, usuario_id=None, projecoes=True, janela=0):
+    """Insere os preços com um executemany e atualiza as projeções
+
+    Roda na transação corrente; quem chama faz o commit. Retorna
+    (inseridos, confirmados, pares afetados), em que confirmados são os
+    preços repetidos absorvidos pela deduplicação. Sem ``projecoes``, preço
+    atual e resumos diários ficam para uma reconstrução posterior (e não há
+    deduplicação, que depende do preço atual).
+    """
+    if not linhas:
+        return 0, 0, set()
+    agora = datetime.utcnow()
+    registros = [{
+        'produto_id': linha['produto_id'],
+        'estabelecimento_id': linha['estabelecimento_id'],
+        'preco': linha['preco'],
+        'data_coleta': linha['data_coleta'] or agora,
+        'valido_ate': None,
+        'usuario_id': usuario_id
+    } for linha in linhas]
+    pares = {(r['produto_id'], r['estabelecimento_id']) for r in registros}
+
+    extensoes = {}
+    if janela and projecoes:
+        registros, extensoes = separar_repetidos(registros, janela)
+        estender_validade(extensoes)
+    if registros:
+        db.session.execute(insert(Preco), registros)
+
+    if projecoes:
+        atualizar_preco_atual({(r['produto_id'], r['estabelecimento_id']) for r in registros})
+        atualizar_resumos_diarios({(r['data_coleta'], r['produto_id'], r['estabelecimento_id']) for r in registros})
+    ajustar_contador('precos', len(registros))
+    return len(registros), len(linhas) - len(registros), pares
+
+def gravar_lote(validas, erros=(), usuario_id=None, cadastrar=False, projecoes=True, janela=0):
+    """Resolve e insere linhas já validadas; retorna (inseridos, confirmados, erros, pares afetados)
+
+    Com ``cadastrar``, produtos e estabelecimentos novos são criados antes da
+    resolução. Os erros de validação recebidos voltam junto com os de
+    resolução, ordenados pela linha.
+    """
+    if cadastrar:
+        cadastrar_faltantes(validas)
+    resolvidas, nao_encontradas = resolver_referencias(validas)
+    erros = sorted([*erros, *nao_encontradas], key=lambda erro: erro['linha'])
+
+    inseridos, confirmados, pares = inserir_precos(resolvidas, usuario_id, projecoes, janela)
+    return inseridos, confirmados, erros, pares
+
+def processar_lote(itens, usuario_id=None, cadastrar=False, inicio=1, janela=0):
+    """Valida, resolve e insere os itens; retorna (inseridos, confirmados, erros, pares afetados)
+
+    ``erros`` traz o número da linha (a partir de ``inicio``) e a mensagem
+    de cada item rejeitado.
+    """
+    validas, erros = validar_itens(itens, inicio)
+    return gravar_lote(validas, erros, usuario_id, cadastrar, janela=janela)
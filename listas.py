@@ -1,15 +1,13 @@
-from flask import Blueprint, request, jsonify, session, render_template
-from models import db, ListaCompras, ItemLista, Produto, Preco, Estabelecimento
+from flask import Blueprint, request, jsonify, session
+from models import db, ListaCompras, ItemLista, Produto, PrecoAtual, Estabelecimento
 from auth import login_required
-from sqlalchemy import func
+from comparacao import totais_lista_por_estabelecimento, produtos_por_estabelecimento, menores_precos_lista
+from otimizador import otimizar_cesta
+import numpy as np
+import time
 
 listas_bp = Blueprint('listas', __name__)
 
-@listas_bp.route('/listas', methods=['GET'])
-@login_required
-def listas_page():
-    return render_template('listas_adminlte.html')
-
 @listas_bp.route('/api/listas', methods=['GET'])
 @login_required
 def listar_listas():
@@ -68,9 +66,11 @@ def obter_lista(lista_id):
         'itens': []
     }
     
+    # Menor preço atual de cada item, numa única consulta sobre preco_atual
+    menores = {produto_id: preco for produto_id, preco, _ in menores_precos_lista(lista_id)}
+    
     for item, produto in itens:
-        # Buscar menor preço do produto
-        menor_preco = db.session.query(func.min(Preco.preco)).filter_by(produto_id=produto.id).scalar()
+        menor_preco = menores.get(produto.id)
         
         resultado['itens'].append({
             'id': item.id,
@@ -164,43 +164,161 @@ def comparar_lista(lista_id):
     if not lista:
         return jsonify({'error': 'Lista não encontrada'}), 404
     
+    limite = min(request.args.get('limite', 50, type=int), 500)
+    
     itens = db.session.query(ItemLista, Produto).join(
         Produto, ItemLista.produto_id == Produto.id
     ).filter(ItemLista.lista_id == lista_id).all()
+    quantidades = {item.produto_id: item.quantidade for item, produto in itens}
+    descricoes = {produto.id: produto.descricao for item, produto in itens}
     
-    # Agrupar preços por estabelecimento
-    estabelecimentos_totais = {}
+    # Total da cesta por estabelecimento (uma agregação sobre os preços atuais)
+    totais, total_estabelecimentos = totais_lista_por_estabelecimento(lista_id, limite)
+    encontrados = produtos_por_estabelecimento(lista_id, [est.id for est, _, _ in totais])
     
-    for item, produto in itens:
-        precos = db.session.query(Preco, Estabelecimento).join(
-            Estabelecimento, Preco.estabelecimento_id == Estabelecimento.id
-        ).filter(Preco.produto_id == produto.id).all()
-        
-        for preco, estabelecimento in precos:
-            est_id = estabelecimento.id
-            if est_id not in estabelecimentos_totais:
-                estabelecimentos_totais[est_id] = {
-                    'estabelecimento': {
-                        'id': estabelecimento.id,
-                        'nome': estabelecimento.nome,
-                        'bairro': estabelecimento.bairro,
-                        'cidade': estabelecimento.cidade
-                    },
-                    'total': 0,
-                    'itens_encontrados': 0,
-                    'total_itens': len(itens)
-                }
-            
-            estabelecimentos_totais[est_id]['total'] += float(preco.preco) * item.quantidade
-            estabelecimentos_totais[est_id]['itens_encontrados'] += 1
-    
-    # Ordenar por menor total
-    resultado = sorted(estabelecimentos_totais.values(), key=lambda x: x['total'])
+    comparacao = []
+    for estabelecimento, total, itens_encontrados in totais:
+        faltantes = [pid for pid in quantidades if pid not in encontrados[estabelecimento.id]]
+        comparacao.append({
+            'estabelecimento': {
+                'id': estabelecimento.id,
+                'nome': estabelecimento.nome,
+                'bairro': estabelecimento.bairro,
+                'cidade': estabelecimento.cidade
+            },
+            'total': round(float(total), 2),
+            'itens_encontrados': itens_encontrados,
+            'total_itens': len(itens),
+            'itens_faltantes': len(faltantes),
+            'produtos_faltantes': faltantes
+        })
+    
+    # Divisão mais barata: cada item no estabelecimento com menor preço atual
+    divisao = []
+    for produto_id, preco, estabelecimento in menores_precos_lista(lista_id):
+        divisao.append({
+            'produto_id': produto_id,
+            'produto_nome': descricoes[produto_id],
+            'quantidade': quantidades[produto_id],
+            'preco': float(preco),
+            'subtotal': round(float(preco) * quantidades[produto_id], 2),
+            'estabelecimento': {
+                'id': estabelecimento.id,
+                'nome': estabelecimento.nome,
+                'bairro': estabelecimento.bairro,
+                'cidade': estabelecimento.cidade
+            }
+        })
+    com_preco = {d['produto_id'] for d in divisao}
+    
+    return jsonify({
+        'lista': {
+            'id': lista.id,
+            'nome': lista.nome
+        },
+        'comparacao': comparacao,
+        'total_estabelecimentos': total_estabelecimentos,
+        'divisao_mais_barata': {
+            'total': round(sum(d['subtotal'] for d in divisao), 2),
+            'total_estabelecimentos': len({d['estabelecimento']['id'] for d in divisao}),
+            'itens': divisao,
+            'produtos_sem_preco': [pid for pid in quantidades if pid not in com_preco]
+        }
+    })
+
+@listas_bp.route('/api/listas/<int:lista_id>/otimizar', methods=['GET'])
+@login_required
+def otimizar_lista(lista_id):
+    """Menor custo para comprar a lista inteira em até K estabelecimentos"""
+    inicio = time.perf_counter()
+    lista = ListaCompras.query.filter_by(id=lista_id, usuario_id=session['user_id'], ativa=True).first()
+    if not lista:
+        return jsonify({'error': 'Lista não encontrada'}), 404
+    
+    max_estabelecimentos = request.args.get('max_estabelecimentos', 2, type=int)
+    if max_estabelecimentos < 1 or max_estabelecimentos > 10:
+        return jsonify({'error': 'max_estabelecimentos deve estar entre 1 e 10'}), 400
+    tempo_ms = min(max(request.args.get('tempo_ms', 200, type=int), 10), 2000)
+    cidade = request.args.get('cidade', '').strip()
+    bairro = request.args.get('bairro', '').strip()
+    
+    itens = db.session.query(ItemLista, Produto).join(
+        Produto, ItemLista.produto_id == Produto.id
+    ).filter(ItemLista.lista_id == lista_id).order_by(ItemLista.id).all()
+    posicao_item = {item.produto_id: i for i, (item, produto) in enumerate(itens)}
+    
+    # Vetores de custo (preço atual x quantidade) por estabelecimento
+    query = db.session.query(
+        PrecoAtual.estabelecimento_id, PrecoAtual.produto_id, PrecoAtual.preco
+    ).join(
+        ItemLista, ItemLista.produto_id == PrecoAtual.produto_id
+    ).join(
+        Estabelecimento, Estabelecimento.id == PrecoAtual.estabelecimento_id
+    ).filter(ItemLista.lista_id == lista_id)
+    if cidade:
+        query = query.filter(Estabelecimento.cidade == cidade)
+    if bairro:
+        query = query.filter(Estabelecimento.bairro == bairro)
+    
+    linhas = query.all()
+    estabelecimentos_ids = sorted({est_id for est_id, _, _ in linhas})
+    posicao_estabelecimento = {est_id: i for i, est_id in enumerate(estabelecimentos_ids)}
+    custos = np.full((len(estabelecimentos_ids), len(itens)), np.inf)
+    for est_id, produto_id, preco in linhas:
+        item = itens[posicao_item[produto_id]][0]
+        custos[posicao_estabelecimento[est_id], posicao_item[produto_id]] = float(preco) * item.quantidade
+    
+    restante = tempo_ms / 1000 - (time.perf_counter() - inicio)
+    solucao = otimizar_cesta(custos, max_estabelecimentos, tempo_limite=max(restante, 0.005))
+    
+    escolhidos = {e.id: e for e in Estabelecimento.query.filter(
+        Estabelecimento.id.in_([estabelecimentos_ids[i] for i in solucao['lojas']])
+    ).all()}
+    
+    compras = {est_id: [] for est_id in escolhidos}
+    produtos_faltantes = []
+    for (item, produto), linha in zip(itens, solucao['atribuicao']):
+        if linha < 0:
+            produtos_faltantes.append(produto.id)
+            continue
+        custo = custos[linha, posicao_item[produto.id]]
+        compras[estabelecimentos_ids[linha]].append({
+            'produto_id': produto.id,
+            'produto_nome': produto.descricao,
+            'quantidade': item.quantidade,
+            'preco': round(custo / item.quantidade, 2),
+            'subtotal': round(custo, 2)
+        })
+    
+    estabelecimentos = []
+    for est_id, itens_comprados in compras.items():
+        estabelecimento = escolhidos[est_id]
+        estabelecimentos.append({
+            'estabelecimento': {
+                'id': estabelecimento.id,
+                'nome': estabelecimento.nome,
+                'bairro': estabelecimento.bairro,
+                'cidade': estabelecimento.cidade
+            },
+            'total': round(sum(i['subtotal'] for i in itens_comprados), 2),
+            'itens': itens_comprados
+        })
+    estabelecimentos.sort(key=lambda x: x['total'], reverse=True)
     
     return jsonify({
         'lista': {
             'id': lista.id,
             'nome': lista.nome
         },
-        'comparacao': resultado
+        'parametros': {
+            'max_estabelecimentos': max_estabelecimentos,
+            'cidade': cidade or None,
+            'bairro': bairro or None,
+            'tempo_ms': tempo_ms
+        },
+        'total': round(solucao['total'], 2),
+        'estabelecimentos': estabelecimentos,
+        'produtos_faltantes': produtos_faltantes,
+        'otimo': solucao['otimo'],
+        'tempo_execucao_ms': round((time.perf_counter() - inicio) * 1000, 2)
     })
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Métricas internas por processo (histogramas de latência e contadores)
+"""
+import bisect
+import threading
+
+# Limites superiores dos buckets, em milissegundos
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_histogramas = {}
+_contadores = {}
+_lock = threading.Lock()
+
+
+class Histograma:
+    """Histograma de latência com buckets fixos"""
+
+    def __init__(self, nome, limites=LIMITES_MS):
+        self.nome = nome
+        self.limites = limites
+        self._lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self._contagens = [0] * (len(self.limites) + 1)
+            self._total = 0
+            self._soma_ms = 0.0
+            self._max_ms = 0.0
+
+    def registrar(self, segundos):
+        """Registra uma amostra de duração (em segundos)"""
+        ms = segundos * 1000
+        with self._lock:
+            self._contagens[bisect.bisect_left(self.limites, ms)] += 1
+            self._total += 1
+            self._soma_ms += ms
+            self._max_ms = max(self._max_ms, ms)
+
+    def percentil(self, p):
+        """Estimativa do percentil p (0-100) pelo limite superior do bucket"""
+        with self._lock:
+            if not self._total:
+                return None
+            alvo = self._total * p / 100
+            acumulado = 0
+            for i, contagem in enumerate(self._contagens):
+                acumulado += contagem
+                if acumulado >= alvo:
+                    return self.limites[i] if i < len(self.limites) else self._max_ms
+            return self._max_ms
+
+    def resumo(self):
+        with self._lock:
+            total = self._total
+            media = self._soma_ms / total if total else None
+            maximo = self._max_ms
+            buckets = {
+                (f'<={limite}' if i < len(self.limites) else f'>{self.limites[-1]}'): contagem
+                for i, (limite, contagem) in enumerate(zip(self.limites + (None,), self._contagens))
+            }
+        return {
+            'nome': self.nome,
+            'total': total,
+            'media_ms': media,
+            'max_ms': maximo,
+            'p50_ms': self.percentil(50),
+            'p90_ms': self.percentil(90),
+            'p99_ms': self.percentil(99),
+            'buckets_ms': buckets
+        }
+
+
+def histograma(nome):
+    """Retorna (criando se preciso) o histograma registrado com esse nome"""
+    with _lock:
+        if nome not in _histogramas:
+            _histogramas[nome] = Histograma(nome)
+        return _histogramas[nome]
+
+def resumo_histogramas():
+    with _lock:
+        registrados = list(_histogramas.values())
+    return {h.nome: h.resumo() for h in registrados}
+
+def incrementar(nome, quantidade=1):
+    """Soma ``quantidade`` ao contador ``nome``"""
+    with _lock:
+        _contadores[nome] = _contadores.get(nome, 0) + quantidade
+
+def resumo_contadores():
+    with _lock:
+        return dict(sorted(_contadores.items()))
\ No newline at end of file
@@ -0,0 +1,57 @@
+from flask import Flask
+from models import db
+import sqlite3
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///promoprecco.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+def migrate_favoritos():
+    """Adiciona a coluna preco_referencia à tabela favorito e preenche com o
+    menor preço vigente na data em que cada produto foi favoritado"""
+    
+    # Conecta diretamente ao SQLite para verificar a estrutura
+    conn = sqlite3.connect('instance/promoprecco.db')
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("PRAGMA table_info(favorito)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'preco_referencia' not in columns:
+            print("Adicionando coluna preco_referencia à tabela favorito...")
+            cursor.execute("ALTER TABLE favorito ADD COLUMN preco_referencia NUMERIC(10, 2)")
+        else:
+            print("Coluna preco_referencia já existe na tabela favorito.")
+        
+        # Menor entre os últimos preços de cada estabelecimento até a data do favorito
+        cursor.execute("""
+            UPDATE favorito SET preco_referencia = (
+                SELECT MIN(p.preco) FROM preco p
+                WHERE p.produto_id = favorito.produto_id
+                  AND p.data_coleta <= favorito.data_criacao
+                  AND NOT EXISTS (
+                      SELECT 1 FROM preco p2
+                      WHERE p2.produto_id = p.produto_id
+                        AND p2.estabelecimento_id = p.estabelecimento_id
+                        AND p2.data_coleta <= favorito.data_criacao
+                        AND (p2.data_coleta > p.data_coleta
+                             OR (p2.data_coleta = p.data_coleta AND p2.id > p.id))
+                  )
+            )
+            WHERE preco_referencia IS NULL
+        """)
+        conn.commit()
+        print(f"Preço de referência preenchido em {cursor.rowcount} favoritos!")
+            
+    except Exception as e:
+        print(f"Erro durante a migração: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.init_app(app)
+        migrate_favoritos()
+        print("Migração concluída!")
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script para criar e popular a tabela preco_atual (preço mais recente por
+produto/estabelecimento) a partir do histórico de preços
+"""
+from sqlalchemy import text
+from app import app
+from models import db
+from projecoes import reconstruir_preco_atual
+
+def migrate_preco_atual():
+    with app.app_context():
+        try:
+            # Cria tabelas que ainda não existem (preco_atual)
+            db.create_all()
+
+            # Índice composto usado para recalcular o preço atual de um par
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_preco_produto_estabelecimento_data "
+                "ON preco (produto_id, estabelecimento_id, data_coleta)"
+            ))
+
+            print("Populando tabela preco_atual a partir do histórico...")
+            total = reconstruir_preco_atual()
+            db.session.commit()
+            print(f"Tabela preco_atual populada com {total} registros!")
+
+        except Exception as e:
+            print(f"Erro durante a migração: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_preco_atual()
+    print("Migração concluída!")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Script para criar e popular as tabelas de resumos diários (por produto e por
+estabelecimento) a partir do histórico de preços
+
+Os resumos já são mantidos a cada escrita; este script serve para a carga
+inicial e como compactação periódica (ex.: cron diário), corrigindo qualquer
+divergência. Com um número de dias, só os dias mais recentes são refeitos:
+
+    python migrate_resumos_diarios.py       # reconstrói tudo
+    python migrate_resumos_diarios.py 7     # reconstrói os últimos 7 dias
+"""
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app import app
+from models import db
+from projecoes import reconstruir_resumos_diarios
+
+def migrate_resumos_diarios(dias=None):
+    with app.app_context():
+        try:
+            # Cria tabelas que ainda não existem (resumo_diario_*)
+            db.create_all()
+
+            # Índice usado para recalcular o resumo diário de um estabelecimento
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_preco_estabelecimento_data "
+                "ON preco (estabelecimento_id, data_coleta)"
+            ))
+
+            desde = (datetime.utcnow() - timedelta(days=dias)).date() if dias else None
+            print(f"Reconstruindo resumos diários {'desde ' + desde.isoformat() if desde else 'de todo o histórico'}...")
+            totais = reconstruir_resumos_diarios(desde)
+            db.session.commit()
+            for tabela, total in totais.items():
+                print(f"Tabela {tabela}: {total} registros")
+
+        except Exception as e:
+            print(f"Erro durante a migração: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_resumos_diarios(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print("Migração concluída!")
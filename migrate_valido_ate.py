@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Script para adicionar a coluna valido_ate à tabela preco
+
+Em cada preço, ``valido_ate`` guarda a última coleta que confirmou o mesmo
+valor (deduplicação por ``PRECOS_JANELA_DEDUP``). Deve ser executado em
+bancos existentes antes de subir a aplicação; depois, ``compactar_precos.py``
+pode deduplicar o histórico já gravado.
+"""
+from sqlalchemy import text
+from app import app
+from models import db
+
+def migrate_valido_ate():
+    with app.app_context():
+        try:
+            colunas = [coluna[1] for coluna in db.session.execute(text("PRAGMA table_info(preco)"))]
+            if 'valido_ate' not in colunas:
+                print("Adicionando coluna valido_ate à tabela preco...")
+                db.session.execute(text("ALTER TABLE preco ADD COLUMN valido_ate DATETIME"))
+                db.session.commit()
+            else:
+                print("Coluna valido_ate já existe na tabela preco.")
+
+        except Exception as e:
+            print(f"Erro durante a migração: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate_valido_ate()
+    print("Migração concluída!")
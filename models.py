@@ -9,6 +9,8 @@ class Produto(db.Model):
     descricao = db.Column(db.String(200), nullable=False, index=True)
     ean = db.Column(db.String(13), index=True)
     precos = db.relationship('Preco', backref='produto', lazy='dynamic', cascade='all, delete-orphan')
+    precos_atuais = db.relationship('PrecoAtual', backref='produto', lazy='dynamic', cascade='all, delete-orphan')
+    resumos_diarios = db.relationship('ResumoDiarioProduto', lazy='dynamic', cascade='all, delete-orphan')
 
 class Estabelecimento(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,6 +19,8 @@ class Estabelecimento(db.Model):
     bairro = db.Column(db.String(100), nullable=False, index=True)
     cidade = db.Column(db.String(100), nullable=False, index=True)
     precos = db.relationship('Preco', backref='estabelecimento', lazy='dynamic', cascade='all, delete-orphan')
+    precos_atuais = db.relationship('PrecoAtual', backref='estabelecimento', lazy='dynamic', cascade='all, delete-orphan')
+    resumos_diarios = db.relationship('ResumoDiarioEstabelecimento', lazy='dynamic', cascade='all, delete-orphan')
 
 class Preco(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -24,7 +28,50 @@ class Preco(db.Model):
     estabelecimento_id = db.Column(db.Integer, db.ForeignKey('estabelecimento.id'), nullable=False, index=True)
     preco = db.Column(db.Numeric(10, 2), nullable=False, index=True)
     data_coleta = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    valido_ate = db.Column(db.DateTime)  # última coleta repetida do mesmo preço (deduplicação)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=True, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_preco_produto_estabelecimento_data', 'produto_id', 'estabelecimento_id', 'data_coleta'),
+        db.Index('ix_preco_estabelecimento_data', 'estabelecimento_id', 'data_coleta'),
+    )
+
+class PrecoAtual(db.Model):
+    """Projeção do preço mais recente de cada (produto, estabelecimento), mantida na escrita"""
+    __tablename__ = 'preco_atual'
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True)
+    estabelecimento_id = db.Column(db.Integer, db.ForeignKey('estabelecimento.id'), primary_key=True, index=True)
+    preco_id = db.Column(db.Integer, nullable=False)
+    preco = db.Column(db.Numeric(10, 2), nullable=False)
+    data_coleta = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (db.Index('ix_preco_atual_produto_preco', 'produto_id', 'preco'),)
+
+class ResumoDiarioProduto(db.Model):
+    """Agregado diário dos preços coletados de cada produto, mantido na escrita"""
+    __tablename__ = 'resumo_diario_produto'
+    dia = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True, index=True)
+    total_precos = db.Column(db.Integer, nullable=False)
+    menor_preco = db.Column(db.Numeric(10, 2), nullable=False)
+    maior_preco = db.Column(db.Numeric(10, 2), nullable=False)
+    soma_precos = db.Column(db.Numeric(14, 2), nullable=False)
+
+class ResumoDiarioEstabelecimento(db.Model):
+    """Agregado diário dos preços coletados em cada estabelecimento, mantido na escrita"""
+    __tablename__ = 'resumo_diario_estabelecimento'
+    dia = db.Column(db.Date, primary_key=True)
+    estabelecimento_id = db.Column(db.Integer, db.ForeignKey('estabelecimento.id'), primary_key=True, index=True)
+    total_precos = db.Column(db.Integer, nullable=False)
+    menor_preco = db.Column(db.Numeric(10, 2), nullable=False)
+    maior_preco = db.Column(db.Numeric(10, 2), nullable=False)
+    soma_precos = db.Column(db.Numeric(14, 2), nullable=False)
+
+class Contador(db.Model):
+    """Total de linhas de uma tabela, mantido na escrita para evitar COUNT(*)"""
+    __tablename__ = 'contador'
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
 
 class Usuario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -49,5 +96,40 @@ class Favorito(db.Model):
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
     produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    preco_referencia = db.Column(db.Numeric(10, 2))  # menor preço atual quando o produto foi favoritado
     
-    __table_args__ = (db.UniqueConstraint('usuario_id', 'produto_id', name='unique_favorito'),)
\ No newline at end of file
+    __table_args__ = (db.UniqueConstraint('usuario_id', 'produto_id', name='unique_favorito'),)
+
+class ListaCompras(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(100), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    ativa = db.Column(db.Boolean, default=True)
+    itens = db.relationship('ItemLista', backref='lista', lazy='dynamic', cascade='all, delete-orphan')
+
+class ItemLista(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    lista_id = db.Column(db.Integer, db.ForeignKey('lista_compras.id'), nullable=False, index=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=1)
+    comprado = db.Column(db.Boolean, default=False)
+    
+    __table_args__ = (db.UniqueConstraint('lista_id', 'produto_id', name='unique_item_lista'),)
+
+class RelatorioJob(db.Model):
+    """Exportação de relatório executada em segundo plano pela fila de relatórios"""
+    __tablename__ = 'relatorio_job'
+    id = db.Column(db.String(32), primary_key=True)
+    relatorio = db.Column(db.String(50), nullable=False)
+    formato = db.Column(db.String(10), nullable=False)
+    parametros = db.Column(db.Text, nullable=False)  # JSON normalizado
+    chave = db.Column(db.String(64), nullable=False, index=True)  # hash de relatório + formato + parâmetros
+    status = db.Column(db.String(20), nullable=False, default='pendente', index=True)
+    total_linhas = db.Column(db.Integer)
+    arquivo = db.Column(db.String(255))
+    erro = db.Column(db.String(255))
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_inicio = db.Column(db.DateTime)
+    data_conclusao = db.Column(db.DateTime)
+    expira_em = db.Column(db.DateTime, index=True)
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Otimizador de cesta: menor custo para comprar uma lista inteira usando no
+máximo K estabelecimentos
+
+Trabalha sobre uma matriz de custos (estabelecimentos x itens) já
+multiplicados pela quantidade, com ``np.inf`` onde o estabelecimento não
+tem preço para o item. A busca combina três etapas, todas limitadas pelo
+mesmo prazo:
+
+1. guloso: adiciona a cada passo o estabelecimento que mais reduz o custo;
+2. busca local: troca um estabelecimento escolhido por outro enquanto houver
+   melhora;
+3. branch and bound: percorre os subconjuntos em ordem de custo individual,
+   podando pelo limite inferior ``sum(min(atual, menor custo restante))``.
+
+Se o branch and bound terminar dentro do prazo a solução é ótima. Itens que
+nenhum estabelecimento escolhido tem recebem uma penalidade maior que
+qualquer cesta completa, então a cobertura sempre vem antes do preço.
+"""
+import time
+import numpy as np
+
+
+class _TempoEsgotado(Exception):
+    pass
+
+
+class _Busca:
+
+    def __init__(self, custos, max_lojas, prazo):
+        self.custos = custos
+        self.max_lojas = max_lojas
+        self.prazo = prazo
+        self.melhor_custo = np.inf
+        self.melhor = ()
+
+    def verificar_prazo(self):
+        if time.perf_counter() > self.prazo:
+            raise _TempoEsgotado()
+
+    def avaliar(self, lojas):
+        return self.custos[list(lojas)].min(axis=0).sum()
+
+    def registrar(self, lojas, custo):
+        if custo < self.melhor_custo - 1e-9:
+            self.melhor_custo = custo
+            self.melhor = tuple(sorted(lojas))
+
+    def guloso(self):
+        atual = np.full(self.custos.shape[1], np.inf)
+        escolhidas = []
+        for _ in range(self.max_lojas):
+            self.verificar_prazo()
+            totais = np.minimum(atual, self.custos).sum(axis=1)
+            totais[escolhidas] = np.inf
+            candidata = int(np.argmin(totais))
+            if escolhidas and totais[candidata] >= atual.sum() - 1e-9:
+                break
+            escolhidas.append(candidata)
+            atual = np.minimum(atual, self.custos[candidata])
+        self.registrar(escolhidas, atual.sum())
+        return escolhidas
+
+    def busca_local(self, escolhidas):
+        escolhidas = list(escolhidas)
+        melhorou = True
+        while melhorou:
+            melhorou = False
+            for posicao in range(len(escolhidas)):
+                self.verificar_prazo()
+                restantes = escolhidas[:posicao] + escolhidas[posicao + 1:]
+                base = (self.custos[restantes].min(axis=0) if restantes
+                        else np.full(self.custos.shape[1], np.inf))
+                totais = np.minimum(base, self.custos).sum(axis=1)
+                totais[restantes] = np.inf
+                candidata = int(np.argmin(totais))
+                if totais[candidata] < self.avaliar(escolhidas) - 1e-9:
+                    escolhidas[posicao] = candidata
+                    self.registrar(escolhidas, totais[candidata])
+                    melhorou = True
+        return escolhidas
+
+    def branch_and_bound(self):
+        ordem = np.argsort(self.custos.sum(axis=1), kind='stable')
+        custos = self.custos[ordem]
+        # menor_restante[j] = menor custo de cada item entre os estabelecimentos j..n-1
+        menor_restante = np.minimum.accumulate(custos[::-1], axis=0)[::-1]
+
+        def explorar(inicio, escolhidas, atual):
+            for j in range(inicio, len(custos)):
+                self.verificar_prazo()
+                if np.minimum(atual, menor_restante[j]).sum() >= self.melhor_custo - 1e-9:
+                    break
+                filho = np.minimum(atual, custos[j])
+                caminho = escolhidas + [int(ordem[j])]
+                self.registrar(caminho, filho.sum())
+                if len(caminho) < self.max_lojas:
+                    explorar(j + 1, caminho, filho)
+
+        explorar(0, [], np.full(custos.shape[1], np.inf))
+
+
+def otimizar_cesta(custos, max_lojas, tempo_limite=0.2):
+    """Escolhe até ``max_lojas`` linhas de ``custos`` minimizando o custo total
+
+    Retorna um dicionário com os índices das linhas escolhidas, o índice da
+    linha atribuída a cada item (-1 se nenhuma escolhida tem o item), o
+    custo total dos itens cobertos e se a solução foi provada ótima.
+    """
+    inicio = time.perf_counter()
+    custos = np.asarray(custos, dtype=float)
+    lojas, itens = custos.shape
+    if not lojas or not itens or max_lojas < 1:
+        return {'lojas': [], 'atribuicao': [-1] * itens, 'total': 0.0, 'otimo': True, 'tempo_ms': 0.0}
+
+    finitos = np.isfinite(custos)
+    penalidade = custos[finitos].sum() + 1
+    busca = _Busca(np.where(finitos, custos, penalidade), min(max_lojas, lojas), inicio + tempo_limite)
+
+    # Garante uma resposta mesmo se o prazo acabar na primeira etapa
+    melhor_individual = int(np.argmin(busca.custos.sum(axis=1)))
+    busca.registrar([melhor_individual], busca.custos[melhor_individual].sum())
+
+    otimo = False
+    try:
+        busca.busca_local(busca.guloso())
+        busca.branch_and_bound()
+        otimo = True
+    except _TempoEsgotado:
+        pass
+
+    escolhidas = list(busca.melhor)
+    sub = custos[escolhidas]
+    atribuicao = np.argmin(sub, axis=0)
+    cobertos = np.isfinite(sub).any(axis=0)
+    return {
+        'lojas': escolhidas,
+        'atribuicao': [escolhidas[a] if c else -1 for a, c in zip(atribuicao, cobertos)],
+        'total': float(sub.min(axis=0)[cobertos].sum()),
+        'otimo': otimo,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2)
+    }
@@ -0,0 +1,74 @@
+"""
+Paginação por cursor (keyset)
+
+Em vez de OFFSET + COUNT(*), cada página continua a partir da chave de
+ordenação (coluna, id) do último item da página anterior, codificada num
+cursor opaco. O custo de uma página não depende da sua profundidade.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import tuple_, asc, desc
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+def _desserializar(coluna, valor):
+    if valor is None:
+        return None
+    tipo = coluna.type.python_type
+    if tipo is datetime:
+        return datetime.fromisoformat(valor)
+    if tipo is Decimal:
+        return Decimal(valor)
+    return tipo(valor)
+
+def codificar_cursor(chave, valor, id):
+    dados = json.dumps({'k': chave, 'v': _serializar(valor), 'id': id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor, chave, coluna):
+    """Retorna (valor, id) do cursor, validando que ele pertence à mesma ordenação"""
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if dados['k'] != chave:
+            raise CursorInvalido('Cursor não corresponde à ordenação solicitada')
+        return _desserializar(coluna, dados['v']), int(dados['id'])
+    except CursorInvalido:
+        raise
+    except Exception:
+        raise CursorInvalido('Cursor inválido')
+
+def paginar_por_cursor(query, coluna, coluna_id, ordem, cursor, per_page, extrair_chave):
+    """Executa uma página de ``query`` ordenada por (coluna, coluna_id)
+
+    ``extrair_chave(item)`` devolve o par (valor da coluna, id) de um item do
+    resultado. Retorna (itens, proximo_cursor); proximo_cursor é None na
+    última página.
+    """
+    chave = f'{coluna.key}:{ordem}'
+    direcao = asc if ordem == 'asc' else desc
+
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, chave, coluna)
+        posicao = tuple_(coluna, coluna_id)
+        limite = tuple_(valor, ultimo_id)
+        query = query.filter(posicao > limite if ordem == 'asc' else posicao < limite)
+
+    itens = query.order_by(direcao(coluna), direcao(coluna_id)).limit(per_page + 1).all()
+
+    proximo_cursor = None
+    if len(itens) > per_page:
+        itens = itens[:per_page]
+        proximo_cursor = codificar_cursor(chave, *extrair_chave(itens[-1]))
+    return itens, proximo_cursor
@@ -0,0 +1,199 @@
+"""
+Projeções mantidas na escrita
+
+As funções daqui rodam dentro da transação corrente (db.session) e devem
+ser chamadas antes do commit de quem altera a tabela de preços.
+
+- ``preco_atual``: preço mais recente de cada (produto, estabelecimento)
+- ``resumo_diario_produto``/``resumo_diario_estabelecimento``: contagem,
+  menor, maior e soma dos preços coletados por dia, lidos pelas
+  estatísticas no lugar do histórico bruto
+- ``contador``: total de produtos, estabelecimentos e preços
+"""
+from datetime import datetime, time, timedelta
+from sqlalchemy import select, insert, update, delete, func, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import (db, Produto, Estabelecimento, Preco, PrecoAtual, Contador,
+                    ResumoDiarioProduto, ResumoDiarioEstabelecimento)
+
+TAMANHO_LOTE = 500
+
+COLUNAS_RESUMO = ['dia', 'total_precos', 'menor_preco', 'maior_preco', 'soma_precos']
+
+# Tabela contada por cada contador
+CONTADORES = {
+    'produtos': Produto,
+    'estabelecimentos': Estabelecimento,
+    'precos': Preco,
+}
+
+# (tabela de resumo, coluna da dimensão no resumo, coluna no histórico)
+RESUMOS_DIARIOS = (
+    (ResumoDiarioProduto, ResumoDiarioProduto.produto_id, Preco.produto_id),
+    (ResumoDiarioEstabelecimento, ResumoDiarioEstabelecimento.estabelecimento_id, Preco.estabelecimento_id),
+)
+
+
+def _lotes(itens, tamanho=TAMANHO_LOTE):
+    itens = list(itens)
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+def _ultimos_precos(*filtros):
+    """SELECT do registro mais recente de cada par (data_coleta, depois id)"""
+    posicao = func.row_number().over(
+        partition_by=(Preco.produto_id, Preco.estabelecimento_id),
+        order_by=(Preco.data_coleta.desc(), Preco.id.desc())
+    ).label('posicao')
+    historico = select(
+        Preco.produto_id, Preco.estabelecimento_id, Preco.id.label('preco_id'),
+        Preco.preco, Preco.data_coleta, posicao
+    ).where(*filtros).subquery()
+    return select(
+        historico.c.produto_id, historico.c.estabelecimento_id, historico.c.preco_id,
+        historico.c.preco, historico.c.data_coleta
+    ).where(historico.c.posicao == 1)
+
+def _inserir_preco_atual(ultimos):
+    return db.session.execute(
+        insert(PrecoAtual).from_select(
+            ['produto_id', 'estabelecimento_id', 'preco_id', 'preco', 'data_coleta'], ultimos
+        )
+    )
+
+def atualizar_preco_atual(pares):
+    """Recalcula o preço atual dos pares (produto_id, estabelecimento_id)
+
+    O registro mais recente do histórico vira o preço atual; pares sem
+    histórico saem da projeção.
+    """
+    pares = {(int(produto_id), int(estabelecimento_id)) for produto_id, estabelecimento_id in pares}
+    if not pares:
+        return
+
+    db.session.flush()
+    for lote in _lotes(sorted(pares)):
+        db.session.execute(
+            delete(PrecoAtual).where(
+                tuple_(PrecoAtual.produto_id, PrecoAtual.estabelecimento_id).in_(lote)
+            ).execution_options(synchronize_session=False)
+        )
+        _inserir_preco_atual(_ultimos_precos(
+            tuple_(Preco.produto_id, Preco.estabelecimento_id).in_(lote)
+        ))
+
+def reconstruir_preco_atual():
+    """Reconstrói a projeção inteira a partir do histórico"""
+    db.session.execute(delete(PrecoAtual).execution_options(synchronize_session=False))
+    return _inserir_preco_atual(_ultimos_precos()).rowcount
+
+
+def _dia_coleta():
+    return func.date(Preco.data_coleta, type_=db.Date)
+
+def _agregado_diario(coluna, *filtros):
+    """SELECT dos resumos diários de uma dimensão (produto ou estabelecimento)"""
+    dia = _dia_coleta()
+    return select(
+        dia, coluna, func.count(Preco.id), func.min(Preco.preco),
+        func.max(Preco.preco), func.sum(Preco.preco)
+    ).where(*filtros).group_by(dia, coluna)
+
+def _inserir_resumo(modelo, coluna_resumo, agregado):
+    colunas = COLUNAS_RESUMO[:1] + [coluna_resumo.key] + COLUNAS_RESUMO[1:]
+    return db.session.execute(insert(modelo).from_select(colunas, agregado))
+
+def chaves_resumo(*filtros):
+    """Chaves (dia, produto_id, estabelecimento_id) dos preços que atendem aos filtros
+
+    Usado antes de excluir produtos ou estabelecimentos, cujos preços também
+    entram nos resumos da outra dimensão.
+    """
+    return db.session.execute(
+        select(_dia_coleta(), Preco.produto_id, Preco.estabelecimento_id).where(*filtros).distinct()
+    ).all()
+
+def atualizar_resumos_diarios(chaves):
+    """Recalcula os resumos dos (data_coleta, produto_id, estabelecimento_id) alterados
+
+    Cada dia afetado é recalculado a partir do histórico daquele dia, o que
+    cobre inclusões, edições e exclusões (menor/maior não podem ser
+    descontados de forma incremental).
+    """
+    chaves = {
+        (data.date() if isinstance(data, datetime) else data, int(produto_id), int(estabelecimento_id))
+        for data, produto_id, estabelecimento_id in chaves if data is not None
+    }
+    if not chaves:
+        return
+
+    db.session.flush()
+    for posicao, (modelo, coluna_resumo, coluna) in enumerate(RESUMOS_DIARIOS, 1):
+        for lote in _lotes(sorted({(chave[0], chave[posicao]) for chave in chaves})):
+            db.session.execute(
+                delete(modelo).where(
+                    tuple_(modelo.dia, coluna_resumo).in_(lote)
+                ).execution_options(synchronize_session=False)
+            )
+            # O intervalo de datas deixa o índice (dimensão, data_coleta) fazer o filtro
+            inicio = datetime.combine(min(dia for dia, _ in lote), time.min)
+            fim = datetime.combine(max(dia for dia, _ in lote) + timedelta(days=1), time.min)
+            _inserir_resumo(modelo, coluna_resumo, _agregado_diario(
+                coluna,
+                coluna.in_({identificador for _, identificador in lote}),
+                Preco.data_coleta >= inicio,
+                Preco.data_coleta < fim,
+                tuple_(_dia_coleta(), coluna).in_(lote)
+            ))
+
+def reconstruir_resumos_diarios(desde=None):
+    """Reconstrói os resumos a partir do histórico (todos ou a partir da data ``desde``)
+
+    Retorna o número de linhas gravadas em cada tabela de resumo.
+    """
+    totais = {}
+    for modelo, coluna_resumo, coluna in RESUMOS_DIARIOS:
+        filtros_resumo = [modelo.dia >= desde] if desde else []
+        filtros = [Preco.data_coleta >= datetime.combine(desde, time.min)] if desde else []
+        db.session.execute(delete(modelo).where(*filtros_resumo).execution_options(synchronize_session=False))
+        totais[modelo.__tablename__] = _inserir_resumo(
+            modelo, coluna_resumo, _agregado_diario(coluna, *filtros)
+        ).rowcount
+    return totais
+
+
+def ajustar_contador(nome, delta):
+    """Soma ``delta`` ao contador (atômico no banco)
+
+    Um contador que ainda não existe é ignorado aqui e criado com a contagem
+    exata na primeira leitura.
+    """
+    if delta:
+        db.session.execute(update(Contador).where(Contador.nome == nome).values(valor=Contador.valor + delta))
+
+def _contagem_exata(nome):
+    return db.session.execute(select(func.count()).select_from(CONTADORES[nome])).scalar()
+
+def ler_contadores():
+    """Valor de todos os contadores, inicializando os ausentes pela contagem exata"""
+    valores = dict(db.session.execute(select(Contador.nome, Contador.valor)).all())
+    for nome in CONTADORES.keys() - valores.keys():
+        valores[nome] = _contagem_exata(nome)
+        db.session.execute(
+            sqlite_insert(Contador).values(nome=nome, valor=valores[nome]).on_conflict_do_nothing()
+        )
+    return {nome: valores[nome] for nome in CONTADORES}
+
+def reconciliar_contadores():
+    """Regrava os contadores com a contagem exata; retorna {nome: (anterior, exato)}"""
+    anteriores = dict(db.session.execute(select(Contador.nome, Contador.valor)).all())
+    resultado = {}
+    for nome in CONTADORES:
+        exato = _contagem_exata(nome)
+        db.session.execute(
+            sqlite_insert(Contador).values(nome=nome, valor=exato).on_conflict_do_update(
+                index_elements=[Contador.nome], set_={'valor': exato}
+            )
+        )
+        resultado[nome] = (anteriores.get(nome), exato)
+    return resultado
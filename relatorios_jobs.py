@@ -0,0 +1,300 @@
+"""
+Fila de relatórios assíncronos
+
+Exportações de arquivo não rodam na requisição: cada pedido vira um registro
+em ``relatorio_job`` e é executado num pool de processos. A requisição apenas
+grava o job e devolve o id; situação, progresso e download ficam nos
+endpoints deste blueprint. Pedidos com os mesmos parâmetros normalizados
+reaproveitam o job em andamento ou o arquivo ainda não expirado.
+
+Os relatórios são registrados pela aplicação e devolvem uma ``FonteLinhas``;
+os formatos são os do módulo ``exportadores``::
+
+    @registrar_relatorio('relatorio_precos')
+    def fonte_relatorio_precos(dias, produto_id=None):
+        return FonteLinhas(colunas, linhas, titulo='Relatório de Preços')
+
+Os processos do pool importam ``app`` para ter os mesmos registros e a mesma
+configuração de banco. O progresso (linhas escritas) é publicado num arquivo
+ao lado do resultado, para não disputar o banco com a leitura do relatório.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, jsonify, send_file
+from models import db, RelatorioJob
+from exportadores import obter_exportador, escrever_arquivo
+
+logger = logging.getLogger(__name__)
+
+relatorios_bp = Blueprint('relatorios_jobs', __name__)
+
+_relatorios = {}
+
+INTERVALO_PROGRESSO = 1000  # linhas entre atualizações do arquivo de progresso
+
+
+def registrar_relatorio(nome):
+    """Registra a fonte de um relatório: fonte(**parametros) -> FonteLinhas"""
+    def decorador(fonte):
+        _relatorios[nome] = fonte
+        return fonte
+    return decorador
+
+def chave_job(relatorio, formato, parametros):
+    normalizados = json.dumps([relatorio, formato, parametros], sort_keys=True, default=str)
+    return hashlib.sha256(normalizados.encode()).hexdigest()
+
+
+class FilaRelatorios:
+    """Agenda jobs de relatório e guarda os arquivos gerados em disco"""
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RELATORIOS_PASTA', os.path.join(app.instance_path, 'relatorios'))
+        app.config.setdefault('RELATORIOS_PROCESSOS', 2)
+        app.config.setdefault('RELATORIOS_TTL', 3600)  # segundos que um arquivo pronto é reaproveitado
+        app.config.setdefault('RELATORIOS_TEMPO_MAXIMO', 3600)  # depois disso um job não concluído é dado como falho
+        self.app = app
+        app.extensions['fila_relatorios'] = self
+
+    @property
+    def pasta(self):
+        return self.app.config['RELATORIOS_PASTA']
+
+    def executor(self):
+        # Criado no primeiro uso: os processos do pool também importam a
+        # aplicação e não devem abrir um pool próprio
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.pasta, exist_ok=True)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.app.config['RELATORIOS_PROCESSOS'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _descartar_executor(self, executor):
+        # Um pool cujo processo morreu não aceita mais jobs; o próximo uso cria outro
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _enviar(self, job_id):
+        executor = self.executor()
+        try:
+            futuro = executor.submit(executar_job, job_id)
+        except BrokenProcessPool:
+            self._descartar_executor(executor)
+            executor = self.executor()
+            futuro = executor.submit(executar_job, job_id)
+        futuro.add_done_callback(lambda f: self._verificar_falha(job_id, executor, f))
+
+    def solicitar(self, relatorio, formato, parametros):
+        """Retorna o job equivalente ainda válido ou agenda um novo"""
+        if relatorio not in _relatorios:
+            raise ValueError(f'Relatório desconhecido: {relatorio}')
+        obter_exportador(formato)
+
+        self.limpar_expirados()
+        chave = chave_job(relatorio, formato, parametros)
+        agora = datetime.utcnow()
+        existente = RelatorioJob.query.filter(
+            RelatorioJob.chave == chave,
+            db.or_(
+                RelatorioJob.status.in_(['pendente', 'processando']),
+                db.and_(RelatorioJob.status == 'concluido', RelatorioJob.expira_em > agora)
+            )
+        ).order_by(RelatorioJob.data_criacao.desc()).first()
+        if existente:
+            return existente
+
+        job = RelatorioJob(
+            id=uuid.uuid4().hex,
+            relatorio=relatorio,
+            formato=formato,
+            parametros=json.dumps(parametros, sort_keys=True, default=str),
+            chave=chave,
+            status='pendente',
+            data_criacao=agora
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self._enviar(job.id)
+        return job
+
+    def _verificar_falha(self, job_id, executor, futuro):
+        # Falhas dentro do job já são registradas pelo processo; aqui sobram
+        # as do próprio pool (processo encerrado, erro ao enviar o job)
+        erro = futuro.exception()
+        if erro is None:
+            return
+        if isinstance(erro, BrokenProcessPool):
+            self._descartar_executor(executor)
+        logger.error(f"Falha no pool de relatórios ao executar {job_id}: {erro}")
+        with self.app.app_context():
+            job = db.session.get(RelatorioJob, job_id)
+            if job and job.status in ('pendente', 'processando'):
+                job.status = 'erro'
+                job.erro = 'Falha ao executar o relatório'
+                job.data_conclusao = datetime.utcnow()
+                db.session.commit()
+
+    def progresso(self, job):
+        """Linhas já escritas pelo job"""
+        if job.status == 'concluido':
+            return job.total_linhas or 0
+        try:
+            with open(caminho_progresso(self.pasta, job.id)) as arquivo:
+                return int(arquivo.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def limpar_expirados(self):
+        """Remove jobs e arquivos expirados e encerra jobs abandonados"""
+        agora = datetime.utcnow()
+        expirados = RelatorioJob.query.filter(
+            db.or_(
+                RelatorioJob.expira_em <= agora,
+                db.and_(RelatorioJob.status == 'erro', RelatorioJob.data_criacao <= agora - timedelta(
+                    seconds=self.app.config['RELATORIOS_TTL']))
+            )
+        ).all()
+        for job in expirados:
+            _remover_arquivo(job.arquivo)
+            db.session.delete(job)
+
+        limite = agora - timedelta(seconds=self.app.config['RELATORIOS_TEMPO_MAXIMO'])
+        RelatorioJob.query.filter(
+            RelatorioJob.status.in_(['pendente', 'processando']),
+            RelatorioJob.data_criacao <= limite
+        ).update({'status': 'erro', 'erro': 'Tempo máximo excedido', 'data_conclusao': agora},
+                 synchronize_session=False)
+        db.session.commit()
+        return len(expirados)
+
+
+def caminho_progresso(pasta, job_id):
+    return os.path.join(pasta, f'{job_id}.progresso')
+
+def _remover_arquivo(caminho):
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+def _publicar_progresso(caminho, linhas):
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w') as arquivo:
+        arquivo.write(str(linhas))
+    os.replace(temporario, caminho)
+
+def _acompanhar(linhas, caminho):
+    """Repassa as linhas publicando a contagem a cada INTERVALO_PROGRESSO"""
+    contador = 0
+    for contador, linha in enumerate(linhas, 1):
+        if contador % INTERVALO_PROGRESSO == 0:
+            _publicar_progresso(caminho, contador)
+        yield linha
+    _publicar_progresso(caminho, contador)
+
+def executar_job(job_id):
+    """Ponto de entrada nos processos do pool"""
+    from app import app  # registra relatórios e formatos no processo do pool
+
+    with app.app_context():
+        job = db.session.get(RelatorioJob, job_id)
+        if not job or job.status != 'pendente':
+            return
+
+        pasta = app.config['RELATORIOS_PASTA']
+        destino = os.path.join(pasta, f'{job.id}{obter_exportador(job.formato).extensao}')
+        progresso = caminho_progresso(pasta, job.id)
+
+        job.status = 'processando'
+        job.data_inicio = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            fonte = _relatorios[job.relatorio](**json.loads(job.parametros))
+            total = fonte.total()
+            job.total_linhas = total
+            db.session.commit()
+
+            # Escreve num arquivo parcial para nunca servir um resultado incompleto
+            fonte.linhas = _acompanhar(fonte.linhas, progresso)
+            escrever_arquivo(fonte, job.formato, f'{destino}.parcial')
+            os.replace(f'{destino}.parcial', destino)
+            db.session.rollback()
+
+            job.status = 'concluido'
+            job.arquivo = destino
+            job.data_conclusao = datetime.utcnow()
+            job.expira_em = job.data_conclusao + timedelta(seconds=app.config['RELATORIOS_TTL'])
+            db.session.commit()
+            logger.info(f"Relatório {job.relatorio} ({job.formato}) {job.id} gerado: {total} linhas")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao gerar relatório {job_id}: {str(e)}")
+            _remover_arquivo(f'{destino}.parcial')
+            job.status = 'erro'
+            job.erro = 'Erro ao gerar relatório'
+            job.data_conclusao = datetime.utcnow()
+            db.session.commit()
+        finally:
+            _remover_arquivo(progresso)
+
+
+def serializar_job(job, fila):
+    progresso = fila.progresso(job)
+    total = job.total_linhas
+    return {
+        'job_id': job.id,
+        'relatorio': job.relatorio,
+        'formato': job.formato,
+        'status': job.status,
+        'progresso': progresso,
+        'total_linhas': total,
+        'percentual': round(progresso / total * 100, 1) if total else (100.0 if job.status == 'concluido' else 0.0),
+        'erro': job.erro,
+        'data_criacao': job.data_criacao.isoformat(),
+        'expira_em': job.expira_em.isoformat() if job.expira_em else None,
+        'status_url': f'/api/relatorios/jobs/{job.id}',
+        'download_url': f'/api/relatorios/jobs/{job.id}/download'
+    }
+
+@relatorios_bp.route('/api/relatorios/jobs/<job_id>', methods=['GET'])
+def status_job(job_id):
+    """Situação e progresso de um job de relatório"""
+    job = db.session.get(RelatorioJob, job_id)
+    if not job:
+        return jsonify({'error': 'Relatório não encontrado'}), 404
+    return jsonify(serializar_job(job, current_app.extensions['fila_relatorios']))
+
+@relatorios_bp.route('/api/relatorios/jobs/<job_id>/download', methods=['GET'])
+def download_job(job_id):
+    """Baixa o arquivo de um job concluído"""
+    fila = current_app.extensions['fila_relatorios']
+    job = db.session.get(RelatorioJob, job_id)
+    if not job:
+        return jsonify({'error': 'Relatório não encontrado'}), 404
+    if job.status != 'concluido':
+        return jsonify(serializar_job(job, fila)), 409
+    if not job.arquivo or not os.path.exists(job.arquivo):
+        return jsonify({'error': 'Arquivo expirado'}), 410
+
+    exportador = obter_exportador(job.formato)
+    return send_file(job.arquivo, mimetype=exportador.mimetype, as_attachment=True,
+                     download_name=f'{job.relatorio}{exportador.extensao}')
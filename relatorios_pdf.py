@@ -0,0 +1,72 @@
+"""
+Relatórios PDF paginados
+
+O layout de uma ``Table`` única do ReportLab cresce de forma superlinear com
+o número de linhas; aqui os dados são divididos em tabelas do tamanho de uma
+página, com cabeçalho repetido e larguras de coluna fixas.
+"""
+from datetime import datetime
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+LINHAS_POR_TABELA = 30
+
+ESTILO_TABELA = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+def formatar_valor(valor):
+    """Formata um valor para célula de PDF conforme o tipo"""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, float):
+        return f'{valor:.2f}'
+    return str(valor)
+
+def gerar_pdf_paginado(linhas, colunas, titulo, destino, larguras=None, linhas_por_tabela=LINHAS_POR_TABELA):
+    """Escreve ``linhas`` (dicionários) em ``destino`` como tabelas de uma página
+
+    ``larguras`` são frações da largura útil da página para cada coluna; sem
+    elas as colunas dividem a largura igualmente.
+    """
+    pagina = landscape(letter)
+    margem = 36
+    doc = SimpleDocTemplate(destino, pagesize=pagina, leftMargin=margem, rightMargin=margem,
+                            topMargin=margem, bottomMargin=margem, title=titulo)
+    largura_util = pagina[0] - 2 * margem
+    larguras = larguras or [1 / max(len(colunas), 1)] * len(colunas)
+    col_widths = [largura_util * fracao for fracao in larguras]
+
+    styles = getSampleStyleSheet()
+    elements = [Paragraph(titulo, styles['Title'])]
+
+    def adicionar_tabela(bloco):
+        table = Table([colunas] + bloco, colWidths=col_widths, repeatRows=1)
+        table.setStyle(ESTILO_TABELA)
+        elements.append(table)
+
+    bloco = []
+    for linha in linhas:
+        bloco.append([formatar_valor(linha[coluna]) for coluna in colunas])
+        if len(bloco) == linhas_por_tabela:
+            adicionar_tabela(bloco)
+            bloco = []
+    # Sem linhas, o relatório ainda traz o cabeçalho (se houver colunas)
+    if bloco or (len(elements) == 1 and colunas):
+        adicionar_tabela(bloco)
+
+    doc.build(elements)
+